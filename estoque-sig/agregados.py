@@ -0,0 +1,132 @@
+"""Agregados do estoque mantidos de forma incremental.
+
+Cada operação que altera um item informa o estado do item antes e depois da
+mudança, e os totais do Dashboard são ajustados em tempo constante. Um
+recálculo completo fica disponível para conferência e ressincronização.
+"""
+import math
+from typing import Dict, Mapping, NamedTuple, Tuple
+
+import numpy as np
+
+from estoque_colunar import EstoqueColunar
+
+
+class EstadoItem(NamedTuple):
+    """Campos de um item que participam dos agregados"""
+    quantidade: int
+    minimo: int
+    maximo: int
+    valor_unitario: float
+
+    @classmethod
+    def de_item(cls, item: Mapping) -> "EstadoItem":
+        return cls(item["quantidade"], item["minimo"], item["maximo"], item["valor_unitario"])
+
+
+class AgregadosEstoque:
+    """Totais e contadores do estoque atualizados em O(1)"""
+
+    def __init__(self):
+        self._zerar()
+
+    def _zerar(self):
+        self.total_itens = 0
+        self.quantidade_total = 0
+        self.valor_total = 0.0
+        self.soma_maximo = 0
+        self.itens_criticos = 0
+        self.itens_excesso = 0
+
+    def adicionar(self, estado: EstadoItem):
+        """Contabiliza um item novo"""
+        self._aplicar(estado, 1)
+
+    def remover(self, estado: EstadoItem):
+        """Retira um item dos agregados"""
+        self._aplicar(estado, -1)
+
+    def atualizar(self, antes: EstadoItem, depois: EstadoItem):
+        """Ajusta os agregados após a alteração de um item"""
+        self._aplicar(antes, -1)
+        self._aplicar(depois, 1)
+
+    def aplicar_colunas(self, qtd: np.ndarray, minimo: np.ndarray, maximo: np.ndarray,
+                        valor_unitario: np.ndarray, sinal: int = 1):
+        """Contabiliza (sinal=1) ou retira (sinal=-1) vários itens de uma vez (arrays alinhados)"""
+        self.total_itens += sinal * len(qtd)
+        self.quantidade_total += sinal * int(qtd.sum())
+        self.valor_total += sinal * float(np.dot(qtd, valor_unitario))
+        self.soma_maximo += sinal * int(maximo.sum())
+        self.itens_criticos += sinal * int(np.count_nonzero(qtd < minimo))
+        self.itens_excesso += sinal * int(np.count_nonzero(qtd > maximo))
+
+    def atualizar_quantidades(self, qtd_antes: np.ndarray, qtd_depois: np.ndarray,
+                              minimo: np.ndarray, maximo: np.ndarray, valor_unitario: np.ndarray):
+        """Ajusta os agregados após a mudança de quantidade de vários itens (arrays alinhados)"""
+        self.quantidade_total += int(qtd_depois.sum() - qtd_antes.sum())
+        self.valor_total += float(np.dot(qtd_depois - qtd_antes, valor_unitario))
+        self.itens_criticos += int(np.count_nonzero(qtd_depois < minimo)
+                                   - np.count_nonzero(qtd_antes < minimo))
+        self.itens_excesso += int(np.count_nonzero(qtd_depois > maximo)
+                                  - np.count_nonzero(qtd_antes > maximo))
+
+    def _aplicar(self, estado: EstadoItem, sinal: int):
+        qtd, minimo, maximo, valor_unitario = estado
+        self.total_itens += sinal
+        self.quantidade_total += sinal * qtd
+        self.valor_total += sinal * qtd * valor_unitario
+        self.soma_maximo += sinal * maximo
+        if qtd < minimo:
+            self.itens_criticos += sinal
+        if qtd > maximo:
+            self.itens_excesso += sinal
+
+    def recalcular(self, estoque: Mapping):
+        """Reconstrói os agregados a partir do estoque completo"""
+        self._zerar()
+        if isinstance(estoque, EstoqueColunar):
+            qtd = estoque.coluna("quantidade")
+            minimo = estoque.coluna("minimo")
+            maximo = estoque.coluna("maximo")
+            self.total_itens = len(estoque)
+            self.quantidade_total = int(qtd.sum())
+            self.valor_total = float(np.dot(qtd, estoque.coluna("valor_unitario")))
+            self.soma_maximo = int(maximo.sum())
+            self.itens_criticos = int(np.count_nonzero(qtd < minimo))
+            self.itens_excesso = int(np.count_nonzero(qtd > maximo))
+        else:
+            for item in estoque.values():
+                self.adicionar(EstadoItem.de_item(item))
+
+    def estatisticas(self) -> Dict:
+        """Retorna as estatísticas no formato de EstoqueManager.obter_estatisticas"""
+        return {
+            "total_itens": self.total_itens,
+            "quantidade_total": self.quantidade_total,
+            "valor_total": self.valor_total,
+            "itens_criticos": self.itens_criticos,
+            "itens_excesso": self.itens_excesso,
+            "taxa_ocupacao": (self.quantidade_total / self.soma_maximo) * 100
+                             if self.soma_maximo else 0.0
+        }
+
+    def comparar(self, estoque: Mapping) -> Dict[str, Tuple]:
+        """Compara os contadores com um recálculo completo.
+
+        Retorna ``{campo: (incremental, recalculado)}`` apenas para os campos
+        divergentes; um dicionário vazio indica agregados consistentes.
+        """
+        referencia = AgregadosEstoque()
+        referencia.recalcular(estoque)
+        divergencias = {}
+        for campo in ("total_itens", "quantidade_total", "soma_maximo",
+                      "itens_criticos", "itens_excesso"):
+            atual, esperado = getattr(self, campo), getattr(referencia, campo)
+            if atual != esperado:
+                divergencias[campo] = (atual, esperado)
+        # O valor total acumula somas de ponto flutuante; compara com tolerância
+        if not math.isclose(self.valor_total, referencia.valor_total,
+                            rel_tol=1e-9, abs_tol=1e-6):
+            divergencias["valor_total"] = (self.valor_total, referencia.valor_total)
+        return divergencias
@@ -1,13 +1,21 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
 import json
 import os
-import hashlib
+import tempfile
 import time
-from typing import Dict, List, Tuple, Optional
-import random
+from typing import List, Tuple
+
+# Interface Streamlit; o gerenciador e as regras do estoque ficam em gerenciador_estoque
+from gerenciador_estoque import EstoqueManager, criar_gerenciador
+from historico_colunar import para_epoca
+from movimentacao_lote import ler_movimentos
+from importacao_catalogo import COLUNAS_CATALOGO, ler_blocos
+from exportacao import FORMATOS_EXPORTACAO, exportar_para_arquivo
+from paginacao import TAMANHOS_PAGINA
+from previsao import JANELA_PREVISAO, MODOS_PREVISAO, SEGUNDOS_DIA
+from classificacao import CLASSES_ABC, CLASSES_XYZ, DIAS_XYZ
 
 # Configuração da página - DEVE SER O PRIMEIRO COMANDO STREAMLIT
 st.set_page_config(
@@ -107,279 +115,64 @@ st.markdown("""
 
 # [RESTO DO CÓDIGO CONTINUA IGUAL, MAS REMOVA A CONFIGURAÇÃO DUPLICADA NA FUNÇÃO main()]
 
-class EstoqueManager:
-    def __init__(self):
-        self.estoque = {}
-        self.historico = []
-        self.usuarios = {
-            "admin": {"senha": self.hash_senha("admin123"), "tipo": "Administrador"},
-            "user": {"senha": self.hash_senha("user123"), "tipo": "Operador"}
-        }
-        self.inicializar_estoque()
-    
-    def hash_senha(self, senha: str) -> str:
-        """Hash de senha para segurança"""
-        return hashlib.sha256(senha.encode()).hexdigest()
-    
-    def inicializar_estoque(self):
-        """Inicializa estoque com dados de exemplo baseados na planilha"""
-        dados_exemplo = [
-            {"codigo": "001", "descricao": "ABRAÇADEIRA TIPO D 1/2", "unidade": "PÇ", 
-             "quantidade": 50, "minimo": 10, "maximo": 100, "localizacao": "A-01", 
-             "fornecedor": "Fornecedor A", "valor_unitario": 2.50},
-            
-            {"codigo": "002", "descricao": "ABRAÇADEIRA TIPO D 3/4", "unidade": "PÇ", 
-             "quantidade": 30, "minimo": 15, "maximo": 80, "localizacao": "A-02", 
-             "fornecedor": "Fornecedor A", "valor_unitario": 3.00},
-            
-            {"codigo": "003", "descricao": "ABRAÇADEIRA TIPO D 1", "unidade": "PÇ", 
-             "quantidade": 5, "minimo": 20, "maximo": 60, "localizacao": "A-03", 
-             "fornecedor": "Fornecedor A", "valor_unitario": 3.50},
-            
-            {"codigo": "004", "descricao": "ABRAÇADEIRA TIPO D 2", "unidade": "PÇ", 
-             "quantidade": 25, "minimo": 10, "maximo": 50, "localizacao": "A-04", 
-             "fornecedor": "Fornecedor B", "valor_unitario": 4.50},
-            
-            {"codigo": "005", "descricao": "ABRAÇADEIRA TIPO U 1/2", "unidade": "PÇ", 
-             "quantidade": 100, "minimo": 30, "maximo": 200, "localizacao": "B-01", 
-             "fornecedor": "Fornecedor B", "valor_unitario": 1.80},
-            
-            {"codigo": "006", "descricao": "ABRAÇADEIRA TIPO U 3/4", "unidade": "PÇ", 
-             "quantidade": 75, "minimo": 25, "maximo": 150, "localizacao": "B-02", 
-             "fornecedor": "Fornecedor C", "valor_unitario": 2.20},
-            
-            {"codigo": "007", "descricao": "PARAFUSO SEXTAVADO 1/2 x 2", "unidade": "PÇ", 
-             "quantidade": 200, "minimo": 50, "maximo": 300, "localizacao": "C-01", 
-             "fornecedor": "Fornecedor C", "valor_unitario": 0.50},
-            
-            {"codigo": "008", "descricao": "PORCA SEXTAVADA 1/2", "unidade": "PÇ", 
-             "quantidade": 150, "minimo": 50, "maximo": 250, "localizacao": "C-02", 
-             "fornecedor": "Fornecedor D", "valor_unitario": 0.30},
-            
-            {"codigo": "009", "descricao": "ARRUELA LISA 1/2", "unidade": "PÇ", 
-             "quantidade": 180, "minimo": 100, "maximo": 300, "localizacao": "C-03", 
-             "fornecedor": "Fornecedor D", "valor_unitario": 0.15},
-            
-            {"codigo": "010", "descricao": "BUCHA DE REDUÇÃO 1 x 3/4", "unidade": "PÇ", 
-             "quantidade": 8, "minimo": 20, "maximo": 60, "localizacao": "D-01", 
-             "fornecedor": "Fornecedor E", "valor_unitario": 5.00}
-        ]
-        
-        for item in dados_exemplo:
-            self.estoque[item["codigo"]] = {
-                "descricao": item["descricao"],
-                "unidade": item["unidade"],
-                "quantidade": item["quantidade"],
-                "minimo": item["minimo"],
-                "maximo": item["maximo"],
-                "localizacao": item["localizacao"],
-                "fornecedor": item["fornecedor"],
-                "valor_unitario": item["valor_unitario"],
-                "ultima_atualizacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-    
-    def autenticar_usuario(self, usuario: str, senha: str) -> bool:
-        """Autentica usuário"""
-        if usuario in self.usuarios:
-            return self.usuarios[usuario]["senha"] == self.hash_senha(senha)
-        return False
-    
-    def adicionar_item(self, codigo: str, descricao: str, unidade: str, 
-                      quantidade: int, minimo: int, maximo: int, 
-                      localizacao: str, fornecedor: str, valor_unitario: float) -> bool:
-        """Adiciona novo item ao estoque"""
-        if codigo in self.estoque:
-            return False
-        
-        self.estoque[codigo] = {
-            "descricao": descricao,
-            "unidade": unidade,
-            "quantidade": quantidade,
-            "minimo": minimo,
-            "maximo": maximo,
-            "localizacao": localizacao,
-            "fornecedor": fornecedor,
-            "valor_unitario": valor_unitario,
-            "ultima_atualizacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        self.registrar_historico("CADASTRO", codigo, descricao, quantidade, 
-                               st.session_state.usuario_atual)
-        return True
-    
-    def atualizar_item(self, codigo: str, campo: str, valor) -> bool:
-        """Atualiza campo específico de um item"""
-        if codigo not in self.estoque:
-            return False
-        
-        valor_anterior = self.estoque[codigo].get(campo)
-        self.estoque[codigo][campo] = valor
-        self.estoque[codigo]["ultima_atualizacao"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        self.registrar_historico("ATUALIZAÇÃO", codigo, 
-                               f"{campo}: {valor_anterior} → {valor}", 
-                               self.estoque[codigo]["quantidade"], 
-                               st.session_state.usuario_atual)
-        return True
-    
-    def entrada_estoque(self, codigo: str, quantidade: int, observacao: str = "") -> bool:
-        """Registra entrada no estoque"""
-        if codigo not in self.estoque or quantidade <= 0:
-            return False
-        
-        qtd_anterior = self.estoque[codigo]["quantidade"]
-        self.estoque[codigo]["quantidade"] += quantidade
-        self.estoque[codigo]["ultima_atualizacao"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        self.registrar_historico("ENTRADA", codigo, 
-                               f"Qtd: +{quantidade}. {observacao}", 
-                               self.estoque[codigo]["quantidade"], 
-                               st.session_state.usuario_atual)
-        return True
-    
-    def saida_estoque(self, codigo: str, quantidade: int, observacao: str = "") -> bool:
-        """Registra saída do estoque"""
-        if codigo not in self.estoque or quantidade <= 0:
-            return False
-        
-        if self.estoque[codigo]["quantidade"] < quantidade:
-            return False
-        
-        self.estoque[codigo]["quantidade"] -= quantidade
-        self.estoque[codigo]["ultima_atualizacao"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        self.registrar_historico("SAÍDA", codigo, 
-                               f"Qtd: -{quantidade}. {observacao}", 
-                               self.estoque[codigo]["quantidade"], 
-                               st.session_state.usuario_atual)
-        return True
-    
-    def registrar_historico(self, tipo: str, codigo: str, descricao: str, 
-                          quantidade: int, usuario: str):
-        """Registra operação no histórico"""
-        registro = {
-            "data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "tipo": tipo,
-            "codigo": codigo,
-            "descricao": descricao,
-            "quantidade": quantidade,
-            "usuario": usuario
-        }
-        self.historico.append(registro)
-    
-    def obter_alertas(self) -> Dict[str, List]:
-        """Retorna alertas de estoque"""
-        alertas = {
-            "critico": [],
-            "baixo": [],
-            "reposicao": [],
-            "excesso": []
-        }
-        
-        for codigo, item in self.estoque.items():
-            qtd = item["quantidade"]
-            minimo = item["minimo"]
-            maximo = item["maximo"]
-            
-            if qtd == 0:
-                alertas["critico"].append({
-                    "codigo": codigo,
-                    "descricao": item["descricao"],
-                    "quantidade": qtd,
-                    "minimo": minimo
-                })
-            elif qtd < minimo:
-                alertas["baixo"].append({
-                    "codigo": codigo,
-                    "descricao": item["descricao"],
-                    "quantidade": qtd,
-                    "minimo": minimo
-                })
-            elif qtd < minimo * 1.2:
-                alertas["reposicao"].append({
-                    "codigo": codigo,
-                    "descricao": item["descricao"],
-                    "quantidade": qtd,
-                    "minimo": minimo
-                })
-            elif qtd > maximo:
-                alertas["excesso"].append({
-                    "codigo": codigo,
-                    "descricao": item["descricao"],
-                    "quantidade": qtd,
-                    "maximo": maximo
-                })
-        
-        return alertas
-    
-    def gerar_relatorio(self) -> pd.DataFrame:
-        """Gera relatório completo do estoque"""
-        dados = []
-        for codigo, item in self.estoque.items():
-            dados.append({
-                "Código": codigo,
-                "Descrição": item["descricao"],
-                "Unidade": item["unidade"],
-                "Quantidade": item["quantidade"],
-                "Mínimo": item["minimo"],
-                "Máximo": item["maximo"],
-                "Localização": item["localizacao"],
-                "Fornecedor": item["fornecedor"],
-                "Valor Unit.": f"R$ {item['valor_unitario']:.2f}",
-                "Valor Total": f"R$ {item['quantidade'] * item['valor_unitario']:.2f}",
-                "Status": self.get_status(item["quantidade"], item["minimo"], item["maximo"]),
-                "Última Atualização": item["ultima_atualizacao"]
-            })
-        
-        return pd.DataFrame(dados)
-    
-    def get_status(self, qtd: int, minimo: int, maximo: int) -> str:
-        """Retorna status do item baseado na quantidade"""
-        if qtd == 0:
-            return "🔴 Sem Estoque"
-        elif qtd < minimo:
-            return "🟡 Abaixo do Mínimo"
-        elif qtd > maximo:
-            return "🟠 Acima do Máximo"
-        else:
-            return "🟢 Normal"
-    
-    def buscar_item(self, termo: str) -> Dict:
-        """Busca item por código ou descrição"""
-        resultados = {}
-        termo_lower = termo.lower()
-        
-        for codigo, item in self.estoque.items():
-            if (termo_lower in codigo.lower() or 
-                termo_lower in item["descricao"].lower()):
-                resultados[codigo] = item
-        
-        return resultados
-    
-    def calcular_valor_total(self) -> float:
-        """Calcula valor total do estoque"""
-        total = 0
-        for item in self.estoque.values():
-            total += item["quantidade"] * item["valor_unitario"]
-        return total
+# Seções da interface principal (só a selecionada é montada a cada execução)
+SECOES = ["📈 Dashboard", "📦 Estoque", "➕ Cadastro",
+          "🔄 Movimentações", "📊 Relatórios", "📜 Histórico", "⚙️ Configurações"]
+
+# Colunas do relatório, na ordem de exibição
+COLUNAS_RELATORIO = ["Código", "Descrição", "Unidade", "Quantidade", "Mínimo", "Máximo",
+                     "Localização", "Fornecedor", "Valor Unit.", "Valor Total", "Status",
+                     "Última Atualização"]
+
+# Formato de exibição dos valores monetários
+FORMATO_MOEDA = "R$ %.2f"
+
+# Linhas exibidas de uma consulta ao histórico arquivado
+LIMITE_ARQUIVO_EXIBIDO = 1000
+
+def controles_pagina(chave: str, total: int, colunas: List[str],
+                     decrescente: bool = False) -> Tuple[str, bool, int, int]:
+    """Seletores de ordenação e de página de uma tabela paginada no servidor.
     
-    def obter_estatisticas(self) -> Dict:
-        """Retorna estatísticas do estoque"""
-        qtd_total = sum(item["quantidade"] for item in self.estoque.values())
-        itens_criticos = len([1 for item in self.estoque.values() 
-                            if item["quantidade"] < item["minimo"]])
-        itens_excesso = len([1 for item in self.estoque.values() 
-                           if item["quantidade"] > item["maximo"]])
-        
-        return {
-            "total_itens": len(self.estoque),
-            "quantidade_total": qtd_total,
-            "valor_total": self.calcular_valor_total(),
-            "itens_criticos": itens_criticos,
-            "itens_excesso": itens_excesso,
-            "taxa_ocupacao": (qtd_total / sum(item["maximo"] 
-                            for item in self.estoque.values())) * 100
+    Retorna a coluna escolhida, a direção, o deslocamento e o tamanho da página.
+    """
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        ordem = st.selectbox("Ordenar por", colunas, key=f"{chave}_ordem")
+    with col2:
+        decrescente = st.toggle("Decrescente", value=decrescente, key=f"{chave}_decrescente")
+    with col3:
+        limite = st.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1, key=f"{chave}_limite")
+    paginas = max(1, -(-total // limite))
+    # Com filtros mais restritos há menos páginas: a página atual acompanha
+    if st.session_state.get(f"{chave}_pagina", 1) > paginas:
+        st.session_state[f"{chave}_pagina"] = paginas
+    with col4:
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, step=1,
+                                 key=f"{chave}_pagina")
+    st.caption(f"Página {pagina} de {paginas} · {total:,} registros")
+    return ordem, decrescente, (pagina - 1) * limite, limite
+
+def tabela_maiores_valores(campo: str, valor: str, n: int = 10):
+    """Tabela dos n itens de maior valor de um fornecedor ou localização"""
+    maiores = st.session_state.estoque_manager.maiores_valores(n, campo, valor)
+    st.dataframe(
+        pd.DataFrame({
+            "Código": [item["codigo"] for item in maiores],
+            "Descrição": [item["descricao"] for item in maiores],
+            "Valor Total": [item["valor_total"] for item in maiores],
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Valor Total": st.column_config.NumberColumn("Valor Total", format=FORMATO_MOEDA),
         }
+    )
+
+@st.cache_resource
+def obter_estoque_manager() -> EstoqueManager:
+    """Gerenciador único do processo, compartilhado por todas as sessões"""
+    return criar_gerenciador()
 
 # [CONTINUA O RESTO DO CÓDIGO...]
 
@@ -387,9 +180,9 @@ class EstoqueManager:
 def main():
     # NÃO COLOQUE st.set_page_config() AQUI - JÁ FOI CHAMADO NO INÍCIO
     
-    # Inicialização do session state
-    if "estoque_manager" not in st.session_state:
-        st.session_state.estoque_manager = EstoqueManager()
+    # Inicialização do session state (a sessão guarda apenas a referência ao
+    # gerenciador compartilhado; movimentações ficam visíveis a todas as sessões)
+    st.session_state.estoque_manager = obter_estoque_manager()
     
     if "autenticado" not in st.session_state:
         st.session_state.autenticado = False
@@ -400,6 +193,10 @@ def main():
     if "tipo_usuario" not in st.session_state:
         st.session_state.tipo_usuario = None
     
+    # Conferência dos indicadores a cada leitura: opção desta sessão, não do gerenciador compartilhado
+    if "verificar_indicadores" not in st.session_state:
+        st.session_state.verificar_indicadores = False
+    
     # Sistema de autenticação
     if not st.session_state.autenticado:
         st.title("🔐 Sistema de Gestão de Estoque - Login")
@@ -440,6 +237,12 @@ def main():
         
         return
     
+    # Retenção do histórico: arquiva o que saiu da janela quente (barato quando não há o que arquivar)
+    try:
+        st.session_state.estoque_manager.aplicar_retencao()
+    except (OSError, ValueError) as e:
+        st.warning(f"Retenção do histórico não aplicada: {str(e)}")
+    
     # Interface principal (após autenticação)
     # Sidebar
     with st.sidebar:
@@ -462,8 +265,7 @@ def main():
         busca = st.text_input("Buscar (código ou descrição)")
         
         # Filtro por fornecedor
-        fornecedores = ["Todos"] + list(set(item["fornecedor"] 
-                                          for item in st.session_state.estoque_manager.estoque.values()))
+        fornecedores = ["Todos"] + st.session_state.estoque_manager.valores_distintos("fornecedor")
         fornecedor_filtro = st.selectbox("Fornecedor", fornecedores)
         
         # Filtro por status
@@ -472,23 +274,29 @@ def main():
                                      "Sem Estoque", "Acima do Máximo"])
         
         # Filtro por localização
-        localizacoes = ["Todas"] + list(set(item["localizacao"] 
-                                          for item in st.session_state.estoque_manager.estoque.values()))
+        localizacoes = ["Todas"] + st.session_state.estoque_manager.valores_distintos("localizacao")
         localizacao_filtro = st.selectbox("Localização", localizacoes)
+        
+        # Filtros pelas classes ABC (valor) e XYZ (variabilidade do consumo)
+        col1, col2 = st.columns(2)
+        with col1:
+            classe_abc_filtro = st.selectbox("Classe ABC", ["Todas"] + CLASSES_ABC)
+        with col2:
+            classe_xyz_filtro = st.selectbox("Classe XYZ", ["Todas"] + CLASSES_XYZ)
     
     # Título principal
     st.title("📊 Sistema de Gestão de Estoque")
     
-    # Tabs principais
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
-        "📈 Dashboard", "📦 Estoque", "➕ Cadastro", 
-        "🔄 Movimentações", "📊 Relatórios", "📜 Histórico", "⚙️ Configurações"
-    ])
+    # Navegação principal: ao contrário de st.tabs, que executa o corpo de todas
+    # as abas, só a seção selecionada monta seus dados nesta execução
+    secao = st.radio("Seção", SECOES, horizontal=True, label_visibility="collapsed",
+                     key="secao_ativa")
     
-    # Tab Dashboard
-    with tab1:
+    # Seção Dashboard
+    if secao == SECOES[0]:
         # Estatísticas
-        stats = st.session_state.estoque_manager.obter_estatisticas()
+        stats = st.session_state.estoque_manager.obter_estatisticas(
+            verificar=st.session_state.verificar_indicadores)
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -542,14 +350,12 @@ def main():
         # Gráficos
         st.subheader("📊 Análise Visual")
         
-        # Preparar dados para gráficos
-        df_estoque = st.session_state.estoque_manager.gerar_relatorio()
-        
         col1, col2 = st.columns(2)
         
         with col1:
-            # Gráfico de status
-            status_counts = df_estoque['Status'].value_counts()
+            # Gráfico de status (contagens do índice de alertas, sem montar o relatório)
+            status_counts = {status: count for status, count
+                             in st.session_state.estoque_manager.contagem_status().items() if count > 0}
             fig_data = []
             colors = []
             
@@ -579,10 +385,8 @@ def main():
                 st.write(json.dumps(chart_config))
         
         with col2:
-            # Top 10 itens por valor
-            df_top = df_estoque.copy()
-            df_top['Valor_Numerico'] = df_top['Valor Total'].str.replace('R$ ', '').str.replace(',', '').astype(float)
-            df_top = df_top.nlargest(10, 'Valor_Numerico')
+            # Top 10 itens por valor (ranking mantido pelas movimentações)
+            top_itens = st.session_state.estoque_manager.maiores_valores(10)
             
             chart_config = {
                 "type": "bar",
@@ -591,76 +395,79 @@ def main():
                 },
                 "series": [{
                     "name": "Valor Total",
-                    "data": df_top['Valor_Numerico'].tolist()
+                    "data": [item["valor_total"] for item in top_itens]
                 }],
-                "categories": df_top['Descrição'].tolist()
+                "categories": [item["descricao"] for item in top_itens]
             }
             st.write(json.dumps(chart_config))
     
-    # Tab Estoque
-    with tab2:
+    # Seção Estoque
+    elif secao == SECOES[1]:
         st.subheader("📦 Consulta de Estoque")
         
-        # Aplicar filtros
-        df_filtrado = st.session_state.estoque_manager.gerar_relatorio()
-        
-        # Filtro de busca
-        if busca:
-            df_filtrado = df_filtrado[
-                df_filtrado['Código'].str.contains(busca, case=False) |
-                df_filtrado['Descrição'].str.contains(busca, case=False)
-            ]
-        
-        # Filtro de fornecedor
-        if fornecedor_filtro != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['Fornecedor'] == fornecedor_filtro]
-        
-        # Filtro de status
-        if status_filtro != "Todos":
-            status_map = {
-                "Normal": "🟢 Normal",
-                "Abaixo do Mínimo": "🟡 Abaixo do Mínimo",
-                "Sem Estoque": "🔴 Sem Estoque",
-                "Acima do Máximo": "🟠 Acima do Máximo"
-            }
-            if status_filtro in status_map:
-                df_filtrado = df_filtrado[df_filtrado['Status'] == status_map[status_filtro]]
+        # Aplicar filtros (busca pelo índice de trigramas, resultados por relevância)
+        status_map = {
+            "Normal": "🟢 Normal",
+            "Abaixo do Mínimo": "🟡 Abaixo do Mínimo",
+            "Sem Estoque": "🔴 Sem Estoque",
+            "Acima do Máximo": "🟠 Acima do Máximo"
+        }
+        consulta = st.session_state.estoque_manager.consultar_estoque(
+            busca=busca,
+            fornecedor=None if fornecedor_filtro == "Todos" else fornecedor_filtro,
+            status=status_map.get(status_filtro),
+            localizacao=None if localizacao_filtro == "Todas" else localizacao_filtro,
+            classe_abc=None if classe_abc_filtro == "Todas" else classe_abc_filtro,
+            classe_xyz=None if classe_xyz_filtro == "Todas" else classe_xyz_filtro
+        )
         
-        # Filtro de localização
-        if localizacao_filtro != "Todas":
-            df_filtrado = df_filtrado[df_filtrado['Localização'] == localizacao_filtro]
+        # Paginação e ordenação no servidor: só a página é montada e enviada
+        padrao = "Relevância" if busca else "Padrão"
+        ordem, decrescente, deslocamento, limite = controles_pagina(
+            "estoque", consulta["total"], [padrao] + COLUNAS_RELATORIO)
+        df_pagina = st.session_state.estoque_manager.pagina_estoque(
+            consulta, None if ordem == padrao else ordem, decrescente, deslocamento, limite)
         
         # Exibir tabela
         st.dataframe(
-            df_filtrado,
+            df_pagina,
             use_container_width=True,
             hide_index=True,
             column_config={
                 "Status": st.column_config.TextColumn("Status", width="medium"),
-                "Valor Unit.": st.column_config.TextColumn("Valor Unit.", width="small"),
-                "Valor Total": st.column_config.TextColumn("Valor Total", width="small"),
+                "Valor Unit.": st.column_config.NumberColumn("Valor Unit.", width="small",
+                                                             format=FORMATO_MOEDA),
+                "Valor Total": st.column_config.NumberColumn("Valor Total", width="small",
+                                                             format=FORMATO_MOEDA),
             }
         )
         
         # Resumo
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.info(f"**Total de itens filtrados:** {len(df_filtrado)}")
+            st.info(f"**Total de itens filtrados:** {consulta['total']}")
         with col2:
-            total_valor = df_filtrado['Valor Total'].str.replace('R$ ', '').str.replace(',', '').astype(float).sum()
-            st.info(f"**Valor total filtrado:** R$ {total_valor:,.2f}")
+            st.info(f"**Valor total filtrado:** R$ {consulta['valor_total']:,.2f}")
         with col3:
-            if st.button("📥 Exportar para CSV"):
-                csv = df_filtrado.to_csv(index=False)
+            formato_estoque = st.selectbox("Formato de exportação", list(FORMATOS_EXPORTACAO),
+                                           key="formato_estoque")
+            if st.button("📥 Exportar"):
+                # Gravado em blocos a partir do estoque, sem montar o arquivo inteiro na memória
+                arquivo = exportar_para_arquivo(
+                    st.session_state.estoque_manager.blocos_relatorio(
+                        st.session_state.estoque_manager.codigos_consulta(consulta)),
+                    formato_estoque
+                )
+                extensao, mime = FORMATOS_EXPORTACAO[formato_estoque]
                 st.download_button(
-                    label="Download CSV",
-                    data=csv,
-                    file_name=f"estoque_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv"
+                    label=f"Download {formato_estoque}",
+                    data=arquivo,
+                    file_name=f"estoque_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extensao}",
+                    mime=mime
                 )
     
-    # Tab Cadastro
-    with tab3:
+    # Seção Cadastro
+    elif secao == SECOES[2]:
         st.subheader("➕ Cadastro de Novo Item")
         
         if st.session_state.tipo_usuario == "Administrador":
@@ -699,18 +506,48 @@ def main():
                     else:
                         if st.session_state.estoque_manager.adicionar_item(
                             codigo, descricao, unidade, quantidade, minimo, maximo,
-                            localizacao, fornecedor, valor_unitario
+                            localizacao, fornecedor, valor_unitario,
+                            usuario=st.session_state.usuario_atual
                         ):
                             st.success(f"Item {codigo} cadastrado com sucesso!")
                             time.sleep(1)
                             st.rerun()
                         else:
                             st.error(f"Código {codigo} já existe no sistema!")
+            
+            # Carga inicial e sincronização de fornecedores (muitos itens por arquivo)
+            st.markdown("---")
+            st.markdown("### 📂 Importação de Catálogo")
+            with st.expander("Importar itens de CSV ou Excel"):
+                st.caption("Colunas: " + ", ".join(COLUNAS_CATALOGO) + ". "
+                           "As regras do cadastro valem para cada linha.")
+                arquivo_catalogo = st.file_uploader("Arquivo do catálogo", type=["csv", "txt", "xlsx"],
+                                                    key="catalogo_arquivo")
+                modo_importacao = st.radio("Itens já cadastrados",
+                                           ["Recusar (somente inserir)", "Atualizar (inserir e atualizar)"],
+                                           horizontal=True)
+                
+                if arquivo_catalogo is not None and st.button("Importar Catálogo", use_container_width=True):
+                    barra = st.progress(0.0, text="Importando catálogo...")
+                    try:
+                        blocos = ler_blocos(arquivo_catalogo, arquivo_catalogo.name,
+                                            progresso=lambda f: barra.progress(f, text=f"Importando catálogo... {f:.0%}"))
+                        resumo = st.session_state.estoque_manager.importar_catalogo(
+                            blocos, modo="atualizar" if modo_importacao.startswith("Atualizar") else "inserir",
+                            usuario=st.session_state.usuario_atual)
+                    except ValueError as e:
+                        st.error(str(e))
+                    else:
+                        barra.progress(1.0, text="Importação concluída")
+                        st.success(f"{resumo['inseridos']} itens inseridos, {resumo['atualizados']} "
+                                   f"atualizados, {resumo['recusados']} recusados.")
+                        if resumo["recusados"]:
+                            st.dataframe(resumo["recusas"], use_container_width=True, hide_index=True)
         else:
             st.warning("Apenas administradores podem cadastrar novos itens.")
     
-    # Tab Movimentações
-    with tab4:
+    # Seção Movimentações
+    elif secao == SECOES[3]:
         st.subheader("🔄 Movimentações de Estoque")
         
         # Seleção de item
@@ -748,7 +585,8 @@ def main():
                     
                     if st.form_submit_button("Registrar Entrada", use_container_width=True):
                         if st.session_state.estoque_manager.entrada_estoque(
-                            codigo_selecionado, qtd_entrada, obs_entrada
+                            codigo_selecionado, qtd_entrada, obs_entrada,
+                            usuario=st.session_state.usuario_atual
                         ):
                             st.success(f"Entrada de {qtd_entrada} unidades registrada!")
                             time.sleep(1)
@@ -759,21 +597,21 @@ def main():
             with col2:
                 st.markdown("### 📤 Saída de Estoque")
                 with st.form("saida_form"):
-                    qtd_saida = st.number_input("Quantidade", 
-                                              min_value=1, 
-                                              max_value=item["quantidade"],
-                                              value=1)
+                    # Sem limite pelo saldo exibido (pode estar defasado): a baixa confere o saldo atual
+                    qtd_saida = st.number_input("Quantidade", min_value=1, value=1)
                     obs_saida = st.text_area("Observações", max_chars=200)
                     
                     if st.form_submit_button("Registrar Saída", use_container_width=True):
                         if st.session_state.estoque_manager.saida_estoque(
-                            codigo_selecionado, qtd_saida, obs_saida
+                            codigo_selecionado, qtd_saida, obs_saida,
+                            usuario=st.session_state.usuario_atual
                         ):
                             st.success(f"Saída de {qtd_saida} unidades registrada!")
                             time.sleep(1)
                             st.rerun()
                         else:
-                            st.error("Erro ao registrar saída!")
+                            disponivel = st.session_state.estoque_manager.estoque[codigo_selecionado]["quantidade"]
+                            st.error(f"Saldo insuficiente: {disponivel} unidades disponíveis.")
             
             # Atualização de dados
             if st.session_state.tipo_usuario == "Administrador":
@@ -800,16 +638,43 @@ def main():
                     
                     if st.form_submit_button("Atualizar", use_container_width=True):
                         if st.session_state.estoque_manager.atualizar_item(
-                            codigo_selecionado, campo, novo_valor
+                            codigo_selecionado, campo, novo_valor,
+                            usuario=st.session_state.usuario_atual
                         ):
                             st.success(f"Campo {campo} atualizado com sucesso!")
                             time.sleep(1)
                             st.rerun()
                         else:
                             st.error("Erro ao atualizar item!")
+        
+        # Lançamento de muitas linhas de uma vez (recebimento de carga, inventário)
+        st.markdown("---")
+        st.markdown("### 📦 Movimentação em Lote")
+        with st.expander("Importar entradas e saídas (CSV ou texto colado)"):
+            st.caption("Uma linha por movimento: codigo;tipo;quantidade;observacao "
+                       "(tipo ENTRADA ou SAÍDA; observação opcional; cabeçalho opcional)")
+            arquivo_lote = st.file_uploader("Arquivo CSV", type=["csv", "txt"], key="lote_arquivo")
+            texto_lote = st.text_area("Ou cole as linhas aqui", height=150, key="lote_texto")
+            
+            if st.button("Processar Lote", use_container_width=True):
+                try:
+                    movimentos = ler_movimentos(arquivo_lote if arquivo_lote is not None else texto_lote)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    resultado = st.session_state.estoque_manager.movimentar_lote(
+                        movimentos, usuario=st.session_state.usuario_atual)
+                    aceitos = int(resultado["Aceito"].sum())
+                    recusados = len(resultado) - aceitos
+                    if recusados:
+                        st.warning(f"{aceitos} movimentos aplicados, {recusados} recusados.")
+                        st.dataframe(resultado[~resultado["Aceito"]], use_container_width=True,
+                                     hide_index=True)
+                    else:
+                        st.success(f"{aceitos} movimentos aplicados.")
     
-    # Tab Relatórios
-    with tab5:
+    # Seção Relatórios
+    elif secao == SECOES[4]:
         st.subheader("📊 Relatórios e Análises")
         
         # Seleção de relatório
@@ -822,8 +687,8 @@ def main():
         if tipo_relatorio == "Resumo Geral":
             st.markdown("### 📋 Resumo Geral do Estoque")
             
-            stats = st.session_state.estoque_manager.obter_estatisticas()
-            df_estoque = st.session_state.estoque_manager.gerar_relatorio()
+            stats = st.session_state.estoque_manager.obter_estatisticas(
+                verificar=st.session_state.verificar_indicadores)
             
             col1, col2 = st.columns(2)
             with col1:
@@ -837,9 +702,7 @@ def main():
             
             with col2:
                 # Gráfico de distribuição de valor
-                df_valor = df_estoque.copy()
-                df_valor['Valor_Num'] = df_valor['Valor Total'].str.replace('R$ ', '').str.replace(',', '').astype(float)
-                df_top5 = df_valor.nlargest(5, 'Valor_Num')
+                top_itens = st.session_state.estoque_manager.maiores_valores(5)
                 
                 chart_config = {
                     "type": "pie",
@@ -847,8 +710,8 @@ def main():
                         "text": "Top 5 Itens por Valor"
                     },
                     "series": [
-                        {"name": row['Descrição'][:30], "data": row['Valor_Num']} 
-                        for _, row in df_top5.iterrows()
+                        {"name": item["descricao"][:30], "data": item["valor_total"]}
+                        for item in top_itens
                     ]
                 }
                 st.write(json.dumps(chart_config))
@@ -856,13 +719,12 @@ def main():
         elif tipo_relatorio == "Análise por Fornecedor":
             st.markdown("### 🏢 Análise por Fornecedor")
             
-            df_fornecedor = st.session_state.estoque_manager.gerar_relatorio()
-            df_fornecedor['Valor_Num'] = df_fornecedor['Valor Total'].str.replace('R$ ', '').str.replace(',', '').astype(float)
-            
-            resumo_fornecedor = df_fornecedor.groupby('Fornecedor').agg({
+            # Relatório completo montado só nos tipos que agrupam os itens
+            df_relatorio = st.session_state.estoque_manager.gerar_relatorio()
+            resumo_fornecedor = df_relatorio.groupby('Fornecedor', observed=True).agg({
                 'Código': 'count',
                 'Quantidade': 'sum',
-                'Valor_Num': 'sum'
+                'Valor Total': 'sum'
             }).round(2)
             
             resumo_fornecedor.columns = ['Qtd. Itens', 'Qtd. Total', 'Valor Total (R$)']
@@ -881,13 +743,18 @@ def main():
                 "categories": resumo_fornecedor.index.tolist()
             }
             st.write(json.dumps(chart_config))
+            
+            # Maiores itens do fornecedor escolhido
+            fornecedor_top = st.selectbox("Maiores itens do fornecedor",
+                                          resumo_fornecedor.index.tolist())
+            if fornecedor_top is not None:
+                tabela_maiores_valores("fornecedor", fornecedor_top)
         
         elif tipo_relatorio == "Análise por Localização":
             st.markdown("### 📍 Análise por Localização")
             
-            df_local = st.session_state.estoque_manager.gerar_relatorio()
-            
-            resumo_local = df_local.groupby('Localização').agg({
+            df_relatorio = st.session_state.estoque_manager.gerar_relatorio()
+            resumo_local = df_relatorio.groupby('Localização', observed=True).agg({
                 'Código': 'count',
                 'Quantidade': 'sum'
             })
@@ -911,6 +778,11 @@ def main():
                 "labels": ["Quantidade"]
             }
             st.write(json.dumps(chart_config))
+            
+            # Maiores itens da localização escolhida
+            local_top = st.selectbox("Maiores itens da localização", locais)
+            if local_top is not None:
+                tabela_maiores_valores("localizacao", local_top)
         
         elif tipo_relatorio == "Itens Críticos":
             st.markdown("### 🚨 Relatório de Itens Críticos")
@@ -963,79 +835,89 @@ def main():
                     st.warning(f"Itens abaixo do mínimo: {len(alertas['baixo'])}")
                 with col3:
                     st.info(f"Itens para reposição: {len(alertas['reposicao'])}")
+                
+                # Fila de urgência mantida pelo índice de alertas
+                st.markdown("**Prioridade de Reposição (10 mais urgentes)**")
+                urgentes = st.session_state.estoque_manager.itens_mais_urgentes(10)
+                df_urgentes = pd.DataFrame([{
+                    "Código": item["codigo"],
+                    "Descrição": item["descricao"],
+                    "Quantidade": item["quantidade"],
+                    "Mínimo": item["minimo"],
+                    "% do Mínimo": round(item["quantidade"] / item["minimo"] * 100, 1)
+                                   if item["minimo"] else 0.0
+                } for item in urgentes])
+                st.dataframe(df_urgentes, use_container_width=True, hide_index=True)
             else:
                 st.success("Nenhum item crítico encontrado!")
         
         elif tipo_relatorio == "Análise de Valor":
             st.markdown("### 💰 Análise de Valor do Estoque")
             
-            df_valor = st.session_state.estoque_manager.gerar_relatorio()
-            df_valor['Valor_Num'] = df_valor['Valor Total'].str.replace('R$ ', '').str.replace(',', '').astype(float)
-            df_valor['Valor_Unit_Num'] = df_valor['Valor Unit.'].str.replace('R$ ', '').str.replace(',', '').astype(float)
-            
-            # Curva ABC
-            df_valor = df_valor.sort_values('Valor_Num', ascending=False)
-            df_valor['Valor_Acumulado'] = df_valor['Valor_Num'].cumsum()
-            df_valor['Percentual_Acumulado'] = (df_valor['Valor_Acumulado'] / df_valor['Valor_Num'].sum()) * 100
-            
-            df_valor['Classe_ABC'] = pd.cut(
-                df_valor['Percentual_Acumulado'],
-                bins=[0, 80, 95, 100],
-                labels=['A', 'B', 'C']
-            )
-            
-            # Resumo ABC
-            resumo_abc = df_valor.groupby('Classe_ABC').agg({
-                'Código': 'count',
-                'Valor_Num': 'sum'
-            })
+            # Curva ABC e variabilidade XYZ mantidas pelo motor de classificação
+            resumo_classes = st.session_state.estoque_manager.resumo_classes()
             
             st.markdown("**Classificação ABC**")
             col1, col2, col3 = st.columns(3)
             
-            for idx, (classe, dados) in enumerate(resumo_abc.iterrows()):
-                with [col1, col2, col3][idx]:
+            for coluna, (classe, itens, valor) in zip(
+                    [col1, col2, col3], resumo_classes["abc"].itertuples(name=None)):
+                with coluna:
                     st.metric(
                         f"Classe {classe}",
-                        f"{dados['Código']} itens",
-                        f"R$ {dados['Valor_Num']:,.2f}"
+                        f"{itens} itens",
+                        f"R$ {valor:,.2f}"
                     )
             
-            # Tabela detalhada
-            st.markdown("**Detalhamento por Item**")
-            df_display = df_valor[['Código', 'Descrição', 'Quantidade', 'Valor Unit.', 
-                                  'Valor Total', 'Percentual_Acumulado', 'Classe_ABC']]
-            df_display['Percentual_Acumulado'] = df_display['Percentual_Acumulado'].round(2).astype(str) + '%'
+            st.markdown("**Itens por Classe ABC × XYZ**")
+            st.caption(f"XYZ pela variação do consumo diário nos últimos {DIAS_XYZ} dias: "
+                       "X até 0,5, Y até 1,0, Z acima disso ou sem saídas.")
+            st.dataframe(resumo_classes["matriz"], use_container_width=True)
             
-            st.dataframe(df_display, use_container_width=True, hide_index=True)
+            # Tabela detalhada, em ordem decrescente de valor e paginada no servidor
+            st.markdown("**Detalhamento por Item**")
+            col1, col2 = st.columns(2)
+            with col1:
+                limite_valor = st.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1,
+                                            key="valor_limite")
+            paginas_valor = max(1, -(-int(resumo_classes["abc"]["Itens"].sum()) // limite_valor))
+            if st.session_state.get("valor_pagina", 1) > paginas_valor:
+                st.session_state["valor_pagina"] = paginas_valor
+            with col2:
+                pagina_valor = st.number_input("Página", min_value=1, max_value=paginas_valor,
+                                               step=1, key="valor_pagina")
+            df_display = st.session_state.estoque_manager.pagina_valor(
+                (pagina_valor - 1) * limite_valor, limite_valor)
+            
+            st.dataframe(
+                df_display,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Valor Unit.": st.column_config.NumberColumn("Valor Unit.", format=FORMATO_MOEDA),
+                    "Valor Total": st.column_config.NumberColumn("Valor Total", format=FORMATO_MOEDA),
+                    "Percentual Acumulado": st.column_config.NumberColumn("Percentual Acumulado",
+                                                                          format="%.2f%%"),
+                }
+            )
         
         elif tipo_relatorio == "Previsão de Reposição":
             st.markdown("### 🔮 Previsão de Reposição")
             
-            # Simular consumo médio baseado em dados históricos fictícios
-            df_reposicao = []
+            # Consumo diário previsto a partir das saídas registradas no histórico
+            col1, col2 = st.columns(2)
+            with col1:
+                modo_previsao = st.selectbox("Método de previsão", list(MODOS_PREVISAO),
+                                             format_func=MODOS_PREVISAO.get)
+            with col2:
+                janela_previsao = st.slider("Janela de consumo (dias)", min_value=7,
+                                            max_value=JANELA_PREVISAO, value=28)
             
-            for codigo, item in st.session_state.estoque_manager.estoque.items():
-                # Simular consumo diário (entre 5% e 15% do estoque mínimo)
-                consumo_diario = random.uniform(0.05, 0.15) * item["minimo"]
-                dias_para_minimo = max(0, (item["quantidade"] - item["minimo"]) / consumo_diario) if consumo_diario > 0 else 999
-                
-                if dias_para_minimo < 30:  # Mostrar apenas itens que precisam reposição em 30 dias
-                    df_reposicao.append({
-                        "Código": codigo,
-                        "Descrição": item["descricao"],
-                        "Quantidade Atual": item["quantidade"],
-                        "Estoque Mínimo": item["minimo"],
-                        "Consumo Diário Médio": round(consumo_diario, 1),
-                        "Dias até Mínimo": round(dias_para_minimo, 0),
-                        "Data Prevista": (datetime.now() + timedelta(days=dias_para_minimo)).strftime("%d/%m/%Y"),
-                        "Qtd. Sugerida para Compra": item["maximo"] - item["quantidade"]
-                    })
-            
-            if df_reposicao:
-                df_reposicao = pd.DataFrame(df_reposicao)
-                df_reposicao = df_reposicao.sort_values('Dias até Mínimo')
-                
+            # Apenas itens que precisam reposição em 30 dias, do mais urgente ao menos
+            df_reposicao = st.session_state.estoque_manager.previsao_reposicao(
+                modo_previsao, janela_previsao, horizonte=30)
+            
+            if len(df_reposicao):
                 st.dataframe(df_reposicao, use_container_width=True, hide_index=True)
                 
                 # Gráfico de timeline
@@ -1054,81 +936,182 @@ def main():
             else:
                 st.info("Todos os itens estão com estoque adequado para os próximos 30 dias.")
     
-    # Tab Histórico
-    with tab6:
+    # Seção Histórico
+    elif secao == SECOES[5]:
         st.subheader("📜 Histórico de Movimentações")
         
-        if st.session_state.estoque_manager.historico:
+        historico = st.session_state.estoque_manager.historico
+        if len(historico):
             # Filtros de histórico
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                tipos_mov = ["Todos"] + list(set(h["tipo"] for h in st.session_state.estoque_manager.historico))
+                tipos_mov = ["Todos"] + historico.tipos()
                 tipo_filtro = st.selectbox("Tipo de Movimentação", tipos_mov)
             
             with col2:
-                usuarios = ["Todos"] + list(set(h["usuario"] for h in st.session_state.estoque_manager.historico))
+                usuarios = ["Todos"] + historico.usuarios()
                 usuario_filtro = st.selectbox("Usuário", usuarios)
             
             with col3:
                 periodo_filtro = st.selectbox("Período", 
                                             ["Hoje", "Últimos 7 dias", "Últimos 30 dias", "Todos"])
             
-            # Converter histórico para DataFrame
-            df_historico = pd.DataFrame(st.session_state.estoque_manager.historico)
-            df_historico['data'] = pd.to_datetime(df_historico['data'])
-            
-            # Aplicar filtros
-            if tipo_filtro != "Todos":
-                df_historico = df_historico[df_historico['tipo'] == tipo_filtro]
-            
-            if usuario_filtro != "Todos":
-                df_historico = df_historico[df_historico['usuario'] == usuario_filtro]
-            
-            # Filtro de período
+            # Filtro de período: só os segmentos do intervalo são lidos
             hoje = datetime.now()
+            inicio = None
             if periodo_filtro == "Hoje":
-                df_historico = df_historico[df_historico['data'].dt.date == hoje.date()]
+                inicio = hoje.replace(hour=0, minute=0, second=0, microsecond=0)
             elif periodo_filtro == "Últimos 7 dias":
-                df_historico = df_historico[df_historico['data'] >= hoje - timedelta(days=7)]
+                inicio = hoje - timedelta(days=7)
             elif periodo_filtro == "Últimos 30 dias":
-                df_historico = df_historico[df_historico['data'] >= hoje - timedelta(days=30)]
+                inicio = hoje - timedelta(days=30)
             
-            # Ordenar por data decrescente
-            df_historico = df_historico.sort_values('data', ascending=False)
+            filtros = {
+                "inicio": inicio,
+                "tipo": None if tipo_filtro == "Todos" else tipo_filtro,
+                "usuario": None if usuario_filtro == "Todos" else usuario_filtro
+            }
+            # Contagens direto das colunas do log, sem montar os registros
+            resumo = historico.resumo(**filtros)
+            
+            # Paginação e ordenação no servidor (padrão: mais recentes primeiro)
+            colunas_ordem = {"Data/Hora": "data", "Tipo": "tipo", "Código": "codigo",
+                             "Movimento": "delta", "Saldo": "quantidade", "Usuário": "usuario"}
+            ordem, decrescente, deslocamento, limite = controles_pagina(
+                "historico", resumo["total"], list(colunas_ordem), decrescente=True)
+            df_historico = historico.pagina(**filtros, ordem=colunas_ordem[ordem],
+                                            decrescente=decrescente,
+                                            deslocamento=deslocamento, limite=limite)
             
             # Formatar data para exibição
             df_historico['Data/Hora'] = df_historico['data'].dt.strftime('%d/%m/%Y %H:%M:%S')
             
-            # Exibir histórico
-            df_display = df_historico[['Data/Hora', 'tipo', 'codigo', 'descricao', 'quantidade', 'usuario']]
-            df_display.columns = ['Data/Hora', 'Tipo', 'Código', 'Descrição', 'Quantidade', 'Usuário']
-            
-            st.dataframe(df_display, use_container_width=True, hide_index=True)
+            # Exibir histórico (movimento com sinal, saldo após a operação e campos alterados)
+            df_display = df_historico[['Data/Hora', 'tipo', 'codigo', 'delta', 'quantidade', 'campo',
+                                       'valor_anterior', 'valor_novo', 'descricao', 'usuario']]
+            df_display.columns = ['Data/Hora', 'Tipo', 'Código', 'Movimento', 'Saldo', 'Campo',
+                                  'Valor Anterior', 'Valor Novo', 'Descrição/Observação', 'Usuário']
+            
+            st.dataframe(
+                df_display,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Movimento": st.column_config.NumberColumn("Movimento", format="%+d"),
+                }
+            )
             
             # Estatísticas do histórico
             st.markdown("### 📊 Estatísticas do Período")
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
-                st.metric("Total de Movimentações", len(df_historico))
+                st.metric("Total de Movimentações", resumo["total"])
             
             with col2:
-                entradas = len(df_historico[df_historico['tipo'] == 'ENTRADA'])
-                st.metric("Entradas", entradas)
+                st.metric("Entradas", resumo["por_tipo"].get("ENTRADA", 0),
+                          f"{resumo['volume_por_tipo'].get('ENTRADA', 0):,} unidades",
+                          delta_color="off")
             
             with col3:
-                saidas = len(df_historico[df_historico['tipo'] == 'SAÍDA'])
-                st.metric("Saídas", saidas)
+                st.metric("Saídas", resumo["por_tipo"].get("SAÍDA", 0),
+                          f"{resumo['volume_por_tipo'].get('SAÍDA', 0):,} unidades",
+                          delta_color="off")
             
             with col4:
-                usuarios_ativos = df_historico['usuario'].nunique()
-                st.metric("Usuários Ativos", usuarios_ativos)
+                st.metric("Usuários Ativos", resumo["usuarios"])
+            
+            # Tendência do período, dos agregados por hora (hoje) ou por dia
+            granularidade = "hora" if periodo_filtro == "Hoje" else "dia"
+            df_tendencia = historico.tendencia(**filtros, granularidade=granularidade)
+            if len(df_tendencia):
+                por_periodo = df_tendencia.pivot_table(index="periodo", columns="tipo", values="registros",
+                                                       aggfunc="sum", fill_value=0, observed=True)
+                formato_periodo = "%H:%M" if granularidade == "hora" else "%d/%m"
+                chart_config = {
+                    "type": "line",
+                    "title": {
+                        "text": "Movimentações por " + granularidade
+                    },
+                    "series": [
+                        {"name": str(tipo_mov), "data": por_periodo[tipo_mov].tolist()}
+                        for tipo_mov in por_periodo.columns
+                    ],
+                    "categories": por_periodo.index.strftime(formato_periodo).tolist()
+                }
+                st.write(json.dumps(chart_config))
+            
+            # Exportação do histórico completo, um segmento do log por vez
+            st.markdown("### 📥 Exportar Histórico")
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                formato_historico = st.selectbox("Formato", list(FORMATOS_EXPORTACAO),
+                                                 key="formato_historico")
+            
+            with col2:
+                if st.button("📥 Exportar histórico completo", use_container_width=True):
+                    arquivo = exportar_para_arquivo(historico.quadros(), formato_historico)
+                    extensao, mime = FORMATOS_EXPORTACAO[formato_historico]
+                    st.download_button(
+                        label=f"Download {formato_historico}",
+                        data=arquivo,
+                        file_name=f"historico_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extensao}",
+                        mime=mime
+                    )
         else:
             st.info("Nenhuma movimentação registrada até o momento.")
+        
+        # Registros fora da janela quente, lidos direto dos blocos arquivados
+        arquivo_historico = st.session_state.estoque_manager.arquivo
+        if arquivo_historico is not None and arquivo_historico.registros:
+            with st.expander("🗄️ Histórico arquivado"):
+                dias_arquivados = [bloco["dia"] for bloco in arquivo_historico.blocos()]
+                primeiro_dia = pd.Timestamp(min(dias_arquivados) * SEGUNDOS_DIA, unit="s").date()
+                ultimo_dia = pd.Timestamp(max(dias_arquivados) * SEGUNDOS_DIA, unit="s").date()
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    data_inicio = st.date_input("De", value=primeiro_dia, key="arquivo_inicio")
+                
+                with col2:
+                    data_fim = st.date_input("Até", value=ultimo_dia, key="arquivo_fim")
+                
+                with col3:
+                    codigo_arquivo = st.text_input("Código (opcional)", key="arquivo_codigo")
+                
+                df_arquivo = arquivo_historico.quadro(
+                    int(para_epoca(datetime.combine(data_inicio, datetime.min.time()))),
+                    int(para_epoca(datetime.combine(data_fim, datetime.max.time()))),
+                    codigo=codigo_arquivo or None)
+                st.caption(f"{len(df_arquivo):,} registros arquivados no período"
+                           + (f" (exibindo os primeiros {LIMITE_ARQUIVO_EXIBIDO})"
+                              if len(df_arquivo) > LIMITE_ARQUIVO_EXIBIDO else ""))
+                st.dataframe(df_arquivo.head(LIMITE_ARQUIVO_EXIBIDO), use_container_width=True,
+                             hide_index=True)
+                
+                # Saldo exato em qualquer data, a partir dos saldos gravados em cada corte
+                st.markdown("**Saldo em uma data**")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    codigo_saldo = st.text_input("Código do item", key="saldo_codigo")
+                
+                with col2:
+                    data_saldo = st.date_input("Data (saldo ao fim do dia)", value=ultimo_dia,
+                                               key="saldo_data")
+                
+                if codigo_saldo:
+                    saldo = st.session_state.estoque_manager.saldo_em(
+                        codigo_saldo, datetime.combine(data_saldo, datetime.max.time()))
+                    if saldo is None:
+                        st.warning("Item não cadastrado nessa data.")
+                    else:
+                        st.metric(f"Saldo de {codigo_saldo} em {data_saldo.strftime('%d/%m/%Y')}", saldo)
     
-    # Tab Configurações
-    with tab7:
+    # Seção Configurações
+    elif secao == SECOES[6]:
         st.subheader("⚙️ Configurações do Sistema")
         
         tab1, tab2 = st.tabs(["👥 Usuários", "🔧 Sistema"])
@@ -1153,15 +1136,12 @@ def main():
                             elif len(nova_senha) < 6:
                                 st.error("A senha deve ter pelo menos 6 caracteres!")
                             else:
-                                st.session_state.estoque_manager.usuarios[novo_usuario] = {
-                                    "senha": st.session_state.estoque_manager.hash_senha(nova_senha),
-                                    "tipo": tipo
-                                }
+                                st.session_state.estoque_manager.adicionar_usuario(novo_usuario, nova_senha, tipo)
                                 st.success(f"Usuário {novo_usuario} criado com sucesso!")
                 
                 # Lista de usuários
                 st.markdown("### 📋 Usuários Cadastrados")
-                for user, info in st.session_state.estoque_manager.usuarios.items():
+                for user, info in list(st.session_state.estoque_manager.usuarios.items()):
                     col1, col2, col3 = st.columns([3, 2, 1])
                     with col1:
                         st.write(f"👤 **{user}**")
@@ -1170,7 +1150,7 @@ def main():
                     with col3:
                         if user not in ["admin", "user"]:  # Proteger usuários padrão
                             if st.button(f"🗑️", key=f"del_{user}"):
-                                del st.session_state.estoque_manager.usuarios[user]
+                                st.session_state.estoque_manager.remover_usuario(user)
                                 st.rerun()
             else:
                 st.warning("Apenas administradores podem gerenciar usuários.")
@@ -1178,17 +1158,47 @@ def main():
         with tab2:
             st.subheader("Configurações do Sistema")
             
+            # Alertas e retenção valem para todas as sessões: só administradores alteram
+            administrador = st.session_state.tipo_usuario == "Administrador"
+            if not administrador:
+                st.info("Apenas administradores podem alterar os alertas e a retenção do histórico.")
+            
             # Configurações de alertas
             st.markdown("### 🔔 Configurações de Alertas")
             col1, col2 = st.columns(2)
             
+            alertas_ativos = st.session_state.estoque_manager.alertas_ativos
             with col1:
-                alerta_critico = st.checkbox("Alertas de estoque crítico", value=True)
-                alerta_baixo = st.checkbox("Alertas de estoque baixo", value=True)
+                alerta_critico = st.checkbox("Alertas de estoque crítico", value=alertas_ativos["critico"],
+                                             disabled=not administrador)
+                alerta_baixo = st.checkbox("Alertas de estoque baixo", value=alertas_ativos["baixo"],
+                                           disabled=not administrador)
             
             with col2:
-                alerta_reposicao = st.checkbox("Alertas de reposição", value=True)
-                alerta_excesso = st.checkbox("Alertas de excesso", value=True)
+                alerta_reposicao = st.checkbox("Alertas de reposição", value=alertas_ativos["reposicao"],
+                                               disabled=not administrador)
+                alerta_excesso = st.checkbox("Alertas de excesso", value=alertas_ativos["excesso"],
+                                             disabled=not administrador)
+            
+            escolhidos = {"critico": alerta_critico, "baixo": alerta_baixo,
+                          "reposicao": alerta_reposicao, "excesso": alerta_excesso}
+            if administrador and escolhidos != alertas_ativos:
+                st.session_state.estoque_manager.configurar_alertas(escolhidos)
+            monitor = st.session_state.estoque_manager.monitor_alertas
+            if monitor is None:
+                st.caption("Notificações desligadas: defina ESTOQUE_ALERTAS_WEBHOOK, ESTOQUE_ALERTAS_FILA "
+                           "ou ESTOQUE_ALERTAS_EMAIL_DIR para enviar os alertas novos.")
+            else:
+                st.caption(f"Notificando em: {', '.join(destino.nome for destino in monitor.destinos)} · "
+                           f"{monitor.contagem['enviados']} alertas enviados · "
+                           f"{monitor.contagem['repetidos']} repetições suprimidas · "
+                           f"{monitor.contagem['falhas']} falhas de envio")
+                if monitor.ultimo_erro:
+                    st.warning(f"Último erro do monitor de alertas: {monitor.ultimo_erro}")
+                recentes = monitor.recentes()
+                if recentes:
+                    with st.expander(f"Últimos {len(recentes)} alertas enviados"):
+                        st.dataframe(pd.DataFrame(recentes[::-1]), use_container_width=True, hide_index=True)
             
             # Parâmetros do sistema
             st.markdown("### 📊 Parâmetros do Sistema")
@@ -1196,7 +1206,9 @@ def main():
             
             with col1:
                 dias_historico = st.number_input("Dias de histórico para análise", 
-                                               min_value=7, max_value=365, value=30)
+                                               min_value=7, max_value=365,
+                                               value=st.session_state.estoque_manager.dias_historico,
+                                               disabled=not administrador)
                 taxa_reposicao = st.slider("Taxa de reposição (%)", 
                                          min_value=10, max_value=50, value=20)
             
@@ -1206,43 +1218,138 @@ def main():
                 tema = st.selectbox("Tema da interface", 
                                   ["Claro", "Escuro", "Automático"])
             
+            # Retenção do histórico (janela quente em memória, o restante no arquivo)
+            st.markdown("### 🗄️ Retenção do Histórico")
+            retencao_ativa = st.checkbox("Arquivar registros mais antigos que os dias de histórico",
+                                         value=st.session_state.estoque_manager.retencao_ativa,
+                                         disabled=not administrador)
+            if administrador and (dias_historico, retencao_ativa) != (
+                    st.session_state.estoque_manager.dias_historico,
+                    st.session_state.estoque_manager.retencao_ativa):
+                st.session_state.estoque_manager.configurar_retencao(dias_historico, retencao_ativa)
+            arquivo_historico = st.session_state.estoque_manager.arquivo
+            if arquivo_historico is not None and arquivo_historico.corte is not None:
+                st.caption(f"{len(arquivo_historico.blocos())} blocos diários · "
+                           f"{arquivo_historico.registros:,} registros arquivados · último corte em "
+                           f"{pd.Timestamp(arquivo_historico.corte, unit='s').strftime('%d/%m/%Y')}")
+            else:
+                st.caption("Nenhum registro arquivado. Os registros arquivados saem da memória e do "
+                           "banco, continuam nas estatísticas e podem ser consultados no Histórico.")
+            if administrador and st.button("🗜️ Compactar agora"):
+                try:
+                    resultado = st.session_state.estoque_manager.aplicar_retencao(forcar=True)
+                    if resultado is None:
+                        st.info("Nenhum registro anterior à janela de histórico.")
+                    else:
+                        st.success(f"{resultado['registros']} registros anteriores a "
+                                   f"{resultado['corte'].strftime('%d/%m/%Y')} arquivados em "
+                                   f"{resultado['blocos']} blocos.")
+                except (OSError, ValueError) as e:
+                    st.error(f"Erro ao compactar o histórico: {str(e)}")
+            
             # Backup e restauração
             st.markdown("### 💾 Backup e Restauração")
             col1, col2 = st.columns(2)
             
+            alteracoes = st.session_state.estoque_manager.alteracoes
+            if alteracoes.checkpoint:
+                st.caption(f"Último checkpoint: {alteracoes.checkpoint[:12]} · "
+                           f"{alteracoes.pendentes()} itens/usuários alterados desde então")
+            else:
+                st.caption("Nenhum checkpoint ainda: o primeiro backup deve ser completo.")
+            
             with col1:
+                tipo_backup = st.radio("Tipo de backup", ["Completo", "Incremental"], horizontal=True)
                 if st.button("📥 Fazer Backup", use_container_width=True):
-                    # Criar backup dos dados
-                    backup_data = {
-                        "estoque": st.session_state.estoque_manager.estoque,
-                        "historico": st.session_state.estoque_manager.historico,
-                        "usuarios": st.session_state.estoque_manager.usuarios,
-                        "data_backup": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    
-                    backup_json = json.dumps(backup_data, indent=2, ensure_ascii=False)
-                    
-                    st.download_button(
-                        label="Download Backup JSON",
-                        data=backup_json,
-                        file_name=f"backup_estoque_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
+                    try:
+                        arquivo = tempfile.TemporaryFile()
+                        resumo = st.session_state.estoque_manager.gerar_backup(
+                            arquivo, incremental=tipo_backup == "Incremental")
+                        arquivo.seek(0)
+                        registros = resumo["registros"]
+                        st.success(f"Backup {tipo_backup.lower()} gerado: "
+                                   f"{registros.get('item', 0)} itens, "
+                                   f"{registros.get('historico', 0)} registros de histórico.")
+                        
+                        st.download_button(
+                            label="Download Backup",
+                            data=arquivo,
+                            file_name=(f"backup_estoque_{resumo['tipo']}_"
+                                       f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz"),
+                            mime="application/gzip"
+                        )
+                    except ValueError as e:
+                        st.error(str(e))
             
             with col2:
-                uploaded_file = st.file_uploader("Restaurar Backup", type=['json'])
+                uploaded_file = st.file_uploader("Restaurar Backup", type=['gz', 'json'])
                 if uploaded_file is not None:
-                    try:
-                        backup_data = json.load(uploaded_file)
-                        
-                        if st.button("🔄 Restaurar", use_container_width=True):
-                            st.session_state.estoque_manager.estoque = backup_data["estoque"]
-                            st.session_state.estoque_manager.historico = backup_data["historico"]
-                            st.session_state.estoque_manager.usuarios = backup_data["usuarios"]
+                    st.caption("Backups incrementais são aplicados sobre o backup em que se baseiam; "
+                               "arquivos .json são backups no formato antigo.")
+                    if st.button("🔄 Restaurar", use_container_width=True):
+                        try:
+                            if uploaded_file.name.lower().endswith(".json"):
+                                st.session_state.estoque_manager.restaurar_backup(json.load(uploaded_file))
+                            else:
+                                st.session_state.estoque_manager.restaurar_backup_arquivo(uploaded_file)
                             st.success("Backup restaurado com sucesso!")
                             st.rerun()
-                    except Exception as e:
-                        st.error(f"Erro ao restaurar backup: {str(e)}")
+                        except Exception as e:
+                            st.error(f"Erro ao restaurar backup: {str(e)}")
+            
+            # Snapshot binário (partida rápida), quando ESTOQUE_SNAPSHOT está configurado
+            diretorio_snapshot = os.environ.get("ESTOQUE_SNAPSHOT")
+            if diretorio_snapshot:
+                st.markdown("### ⚡ Snapshot")
+                st.caption(f"Diretório: {diretorio_snapshot}. O snapshot é regravado ao encerrar "
+                           "o servidor e usado na partida seguinte se o banco não mudou.")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    if st.button("📸 Gravar snapshot agora", use_container_width=True):
+                        try:
+                            manifesto = st.session_state.estoque_manager.salvar_snapshot()
+                            st.success(f"Snapshot gravado: {manifesto['itens']} itens, "
+                                       f"{manifesto['historico']['registros']} registros de histórico.")
+                        except (OSError, ValueError) as e:
+                            st.error(f"Erro ao gravar snapshot: {str(e)}")
+                
+                with col2:
+                    if st.button("🔄 Restaurar snapshot", use_container_width=True):
+                        try:
+                            st.session_state.estoque_manager.restaurar_snapshot()
+                            st.success("Snapshot restaurado com sucesso!")
+                            st.rerun()
+                        except (OSError, ValueError) as e:
+                            st.error(f"Erro ao restaurar snapshot: {str(e)}")
+            
+            # Conferência dos agregados incrementais do Dashboard
+            st.markdown("### 🧮 Consistência dos Indicadores")
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.session_state.verificar_indicadores = st.checkbox(
+                    "Conferir indicadores a cada leitura (recálculo completo)",
+                    value=st.session_state.verificar_indicadores
+                )
+            
+            with col2:
+                if st.button("🔍 Verificar indicadores", use_container_width=True):
+                    divergencias = st.session_state.estoque_manager.verificar_agregados()
+                    if divergencias:
+                        st.warning("Indicadores divergentes foram ressincronizados: " +
+                                   ", ".join(f"{campo} ({atual} → {esperado})"
+                                             for campo, (atual, esperado) in divergencias.items()))
+                    else:
+                        st.success("Indicadores consistentes com o recálculo completo.")
+            
+            # Agregados do histórico (estatísticas e tendências do Histórico)
+            st.markdown("### 📈 Agregados do Histórico")
+            st.caption("Contagens por hora e por dia mantidas a cada movimentação. "
+                       "Reconstruir relê todo o histórico.")
+            if st.button("🔁 Reconstruir agregados do histórico"):
+                registros = st.session_state.estoque_manager.reconstruir_resumos_historico()
+                st.success(f"Agregados reconstruídos a partir de {registros} registros.")
             
             # Informações do sistema
             st.markdown("### ℹ️ Informações do Sistema")
@@ -1250,7 +1357,7 @@ def main():
             **Versão:** 1.0.0  
             **Última atualização:** {datetime.now().strftime('%d/%m/%Y')}  
             **Total de registros:** {len(st.session_state.estoque_manager.estoque)}  
-            **Total de movimentações:** {len(st.session_state.estoque_manager.historico)}  
+            **Total de movimentações:** {len(st.session_state.estoque_manager.historico)} em memória, {arquivo_historico.registros if arquivo_historico else 0} arquivadas  
             **Usuários cadastrados:** {len(st.session_state.estoque_manager.usuarios)}
             """)
 
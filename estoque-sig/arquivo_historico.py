@@ -0,0 +1,272 @@
+"""Arquivo do histórico: registros fora da janela quente, compactados em disco.
+
+A retenção tira do log em memória os registros anteriores a um ponto de corte
+(o início de um dia) e os grava aqui, um bloco por dia:
+
+- ``bloco_<n>.npz``: as colunas do log (``np.savez_compressed``), com as
+  categorias do bloco como textos próprios, mais o resumo diário por SKU e
+  tipo (registros, volume e saldo). Um bloco só é lido quando uma consulta
+  cruza o seu dia; do resumo, só os arrays do resumo são descompactados;
+- ``saldos_<corte>.npz``: o saldo de cada SKU no ponto de corte. O saldo em
+  qualquer data continua exato a partir dele, sem os registros anteriores;
+- ``indice.json``: blocos (dia, registros, intervalo de datas e totais por tipo
+  e usuário) e pontos de corte, regravado por troca atômica ao fim de cada
+  compactação: o que não entrou no índice não faz parte do arquivo.
+"""
+import json
+import os
+import shutil
+import threading
+from typing import TYPE_CHECKING, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from historico_colunar import CAMPOS_REGISTRO, COLUNAS_CATEGORIA, COLUNAS_FIXAS, COLUNAS_VALOR, formatar_epoca
+from resumos_historico import MEDIDAS, SEGUNDOS_DIA
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+INDICE = "indice.json"
+
+_SEP_DESCRICAO = "\x00"
+
+
+def _textos(valores: Sequence[str]) -> np.ndarray:
+    # Array de texto fixo (sem pickle) mesmo quando vazio
+    return np.array(list(valores), dtype=str) if len(valores) else np.zeros(0, dtype="<U1")
+
+
+class ArquivoHistorico:
+    """Blocos diários compactados, resumos por SKU e saldos de cada ponto de corte"""
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self._trava = threading.Lock()
+        caminho = os.path.join(diretorio, INDICE)
+        if os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as arquivo:
+                self._indice = json.load(arquivo)
+        else:
+            self._indice = {"blocos": [], "pontos": []}
+
+    # Índice (leitores usam a referência atual; a compactação troca o dicionário inteiro)
+
+    def blocos(self) -> List[Dict]:
+        """Blocos arquivados, em ordem de gravação"""
+        return list(self._indice["blocos"])
+
+    def pontos(self) -> List[Dict]:
+        """Pontos de corte (segundos desde a época) com o arquivo de saldos de cada um, em ordem"""
+        return list(self._indice["pontos"])
+
+    @property
+    def corte(self) -> Optional[int]:
+        """Último ponto de corte: registros anteriores a ele estão no arquivo"""
+        pontos = self._indice["pontos"]
+        return pontos[-1]["corte"] if pontos else None
+
+    @property
+    def registros(self) -> int:
+        return sum(bloco["registros"] for bloco in self._indice["blocos"])
+
+    # Escrita (o chamador serializa as compactações)
+
+    def arquivar(self, colunas: Mapping[str, np.ndarray], descricoes: List[str],
+                 categorias: Mapping[str, List[str]], corte: int,
+                 codigos_saldo: List[str], saldos: np.ndarray) -> int:
+        """Grava registros anteriores a ``corte`` em blocos diários e o saldo de cada SKU no corte.
+
+        ``colunas`` segue ``COLUNAS_FIXAS``, com códigos das tabelas
+        ``categorias`` do log. Retorna o número de blocos gravados.
+        """
+        with self._trava:
+            indice = {"blocos": list(self._indice["blocos"]), "pontos": list(self._indice["pontos"])}
+            dias = np.asarray(colunas["data"]) // SEGUNDOS_DIA
+            ordem = np.argsort(dias, kind="stable")
+            distintos, inicios = np.unique(dias[ordem], return_index=True)
+            for dia, linhas in zip(distintos.tolist(), np.split(ordem, inicios[1:])):
+                nome = f"bloco_{len(indice['blocos']):06d}.npz"
+                parte = {campo: np.asarray(colunas[campo])[linhas] for campo in COLUNAS_FIXAS}
+                totais = self._gravar_bloco(nome, parte, [descricoes[i] for i in linhas.tolist()],
+                                            categorias)
+                datas = parte["data"]
+                indice["blocos"].append({"arquivo": nome, "dia": dia, "registros": len(linhas),
+                                         "data_min": int(datas.min()), "data_max": int(datas.max()),
+                                         "totais": totais})
+
+            nome = f"saldos_{corte}.npz"
+            np.savez_compressed(os.path.join(self.diretorio, nome), codigos=_textos(codigos_saldo),
+                                saldos=np.asarray(saldos, dtype=np.int64))
+            indice["pontos"].append({"corte": int(corte), "arquivo": nome, "itens": len(codigos_saldo)})
+            self._gravar_indice(indice)
+            return len(distintos)
+
+    def _gravar_bloco(self, nome: str, parte: Dict[str, np.ndarray], descricoes: List[str],
+                      categorias: Mapping[str, List[str]]) -> List[List]:
+        """Grava um bloco e devolve os totais por tipo e usuário ([tipo, usuario, *MEDIDAS])"""
+        arrays = dict(parte)
+        for campo in COLUNAS_CATEGORIA:
+            # Só as categorias presentes no bloco, renumeradas
+            usados, locais = np.unique(parte[campo], return_inverse=True)
+            arrays[campo] = locais.astype(np.int32)
+            arrays[f"categorias_{campo}"] = _textos([categorias[campo][c] for c in usados.tolist()])
+        texto = _SEP_DESCRICAO.join(d.replace(_SEP_DESCRICAO, " ") for d in descricoes)
+        arrays["texto"] = np.frombuffer(texto.encode("utf-8"), dtype=np.uint8)
+
+        delta = parte["delta"].astype(np.int64)
+        medidas = np.stack([np.ones(len(delta), dtype=np.int64), np.abs(delta), delta], axis=1)
+        chaves = (arrays["codigo"].astype(np.int64) << 32) | arrays["tipo"]
+        unicas, inverso = np.unique(chaves, return_inverse=True)
+        arrays["resumo_codigo"] = (unicas >> 32).astype(np.int32)
+        arrays["resumo_tipo"] = (unicas & 0xFFFFFFFF).astype(np.int32)
+        arrays["resumo_valores"] = self._somar(inverso, medidas, len(unicas))
+        np.savez_compressed(os.path.join(self.diretorio, nome), **arrays)
+
+        usuarios = len(arrays["categorias_usuario"])
+        celulas, inverso = np.unique(arrays["tipo"].astype(np.int64) * usuarios + arrays["usuario"],
+                                     return_inverse=True)
+        valores = self._somar(inverso, medidas, len(celulas))
+        tipos, nomes_usuarios = arrays["categorias_tipo"].tolist(), arrays["categorias_usuario"].tolist()
+        return [[tipos[c // usuarios], nomes_usuarios[c % usuarios], *linha]
+                for c, linha in zip(celulas.tolist(), valores.tolist())]
+
+    @staticmethod
+    def _somar(grupos: np.ndarray, medidas: np.ndarray, total: int) -> np.ndarray:
+        return np.stack([np.bincount(grupos, weights=medidas[:, m], minlength=total)
+                         for m in range(len(MEDIDAS))], axis=1).astype(np.int64)
+
+    def _gravar_indice(self, indice: Dict):
+        temporario = os.path.join(self.diretorio, INDICE + ".tmp")
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(indice, arquivo, ensure_ascii=False)
+        os.replace(temporario, os.path.join(self.diretorio, INDICE))
+        self._indice = indice
+
+    def limpar(self):
+        """Apaga todo o arquivo (estado substituído por um backup que já contém esses registros)"""
+        with self._trava:
+            self._gravar_indice({"blocos": [], "pontos": []})
+            for nome in os.listdir(self.diretorio):
+                if nome != INDICE:
+                    caminho = os.path.join(self.diretorio, nome)
+                    if os.path.isdir(caminho):
+                        shutil.rmtree(caminho, ignore_errors=True)
+                    else:
+                        os.remove(caminho)
+
+    # Leitura
+
+    def _ler(self, bloco: Dict, nomes: Sequence[str]) -> Dict[str, np.ndarray]:
+        with np.load(os.path.join(self.diretorio, bloco["arquivo"])) as arrays:
+            return {nome: arrays[nome] for nome in nomes}
+
+    def _cruzam(self, inicio: Optional[int], fim: Optional[int]) -> List[Dict]:
+        return [bloco for bloco in self._indice["blocos"]
+                if (inicio is None or bloco["data_max"] >= inicio)
+                and (fim is None or bloco["data_min"] <= fim)]
+
+    def partes(self, inicio: Optional[int] = None, fim: Optional[int] = None
+               ) -> Iterator[Dict[str, np.ndarray]]:
+        """Colunas fixas dos registros com data em [inicio, fim] (segundos), um dict por bloco.
+
+        As colunas de categoria trazem códigos do bloco; ``categorias_<campo>``
+        traz os valores correspondentes.
+        """
+        nomes = (*COLUNAS_FIXAS, *(f"categorias_{campo}" for campo in COLUNAS_CATEGORIA))
+        for bloco in self._cruzam(inicio, fim):
+            parte = self._ler(bloco, nomes)
+            datas = parte["data"]
+            mascara = np.ones(len(datas), dtype=bool)
+            if inicio is not None:
+                mascara &= datas >= inicio
+            if fim is not None:
+                mascara &= datas <= fim
+            if not mascara.all():
+                for campo in COLUNAS_FIXAS:
+                    parte[campo] = parte[campo][mascara]
+            if len(parte["data"]):
+                yield parte
+
+    def quadro(self, inicio: Optional[int] = None, fim: Optional[int] = None,
+               tipo: Optional[str] = None, usuario: Optional[str] = None,
+               codigo: Optional[str] = None) -> "pd.DataFrame":
+        """Registros arquivados com data em [inicio, fim] (segundos) e nos filtros, como DataFrame"""
+        import pandas as pd
+
+        filtros = {"tipo": tipo, "usuario": usuario, "codigo": codigo}
+        quadros = []
+        for bloco in self._cruzam(inicio, fim):
+            nomes = (*COLUNAS_FIXAS, "texto", *(f"categorias_{campo}" for campo in COLUNAS_CATEGORIA))
+            parte = self._ler(bloco, nomes)
+            datas = parte["data"]
+            mascara = np.ones(len(datas), dtype=bool)
+            if inicio is not None:
+                mascara &= datas >= inicio
+            if fim is not None:
+                mascara &= datas <= fim
+            for campo, valor in filtros.items():
+                if valor is not None:
+                    locais = np.flatnonzero(parte[f"categorias_{campo}"] == valor)
+                    mascara &= parte[campo] == (locais[0] if len(locais) else -1)
+            if not mascara.any():
+                continue
+            descricoes = bytes(parte["texto"]).decode("utf-8").split(_SEP_DESCRICAO)
+            quadro = {"data": datas[mascara].astype("datetime64[s]")}
+            for campo in CAMPOS_REGISTRO[1:]:
+                if campo == "descricao":
+                    quadro[campo] = [d for d, m in zip(descricoes, mascara.tolist()) if m]
+                elif campo in COLUNAS_CATEGORIA:
+                    quadro[campo] = parte[f"categorias_{campo}"][parte[campo][mascara]]
+                else:
+                    quadro[campo] = parte[campo][mascara]
+            quadros.append(pd.DataFrame(quadro))
+        if not quadros:
+            return pd.DataFrame({campo: pd.Series(dtype="datetime64[s]" if campo == "data" else object)
+                                 for campo in CAMPOS_REGISTRO})
+        return pd.concat(quadros, ignore_index=True)
+
+    def iterar(self, blocos: Optional[List[Dict]] = None) -> Iterator[Dict]:
+        """Registros arquivados como dicionários do log (backup completo), bloco a bloco.
+
+        ``blocos`` restringe a leitura a uma lista obtida antes com ``blocos()``.
+        """
+        for bloco in self._indice["blocos"] if blocos is None else blocos:
+            quadro = self.quadro(bloco["data_min"], bloco["data_max"])
+            quadro = quadro.assign(data=formatar_epoca(quadro["data"].to_numpy().astype(np.int64)))
+            for campo in COLUNAS_VALOR:
+                quadro[campo] = quadro[campo].astype(object).where(quadro[campo].notna(), None)
+            yield from quadro[list(CAMPOS_REGISTRO)].to_dict("records")
+
+    def totais(self) -> Iterator[Tuple[int, List[List]]]:
+        """Dia e totais por tipo e usuário de cada bloco (só do índice, sem abrir os blocos)"""
+        for bloco in self._indice["blocos"]:
+            yield bloco["dia"], bloco["totais"]
+
+    def resumos(self, inicio_dia: Optional[int] = None, fim_dia: Optional[int] = None
+                ) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+        """Resumo diário por SKU dos blocos com dia em [inicio_dia, fim_dia): dia, códigos, tipos e medidas"""
+        for bloco in self._indice["blocos"]:
+            if (inicio_dia is not None and bloco["dia"] < inicio_dia) or \
+                    (fim_dia is not None and bloco["dia"] >= fim_dia):
+                continue
+            resumo = self._ler(bloco, ("resumo_codigo", "resumo_tipo", "resumo_valores",
+                                       "categorias_codigo", "categorias_tipo"))
+            yield (bloco["dia"], resumo["categorias_codigo"][resumo["resumo_codigo"]],
+                   resumo["categorias_tipo"][resumo["resumo_tipo"]], resumo["resumo_valores"])
+
+    def soma_delta(self, codigo: str, inicio: Optional[int], fim: Optional[int]) -> int:
+        """Soma dos deltas arquivados do SKU com data em [inicio, fim] (segundos)"""
+        total = 0
+        for parte in self.partes(inicio, fim):
+            locais = np.flatnonzero(parte["categorias_codigo"] == codigo)
+            if len(locais):
+                total += int(parte["delta"][parte["codigo"] == locais[0]].sum())
+        return total
+
+    def saldo(self, ponto: Dict, codigo: str) -> Optional[int]:
+        """Saldo do SKU no ponto de corte (None se o item não existia no corte)"""
+        with np.load(os.path.join(self.diretorio, ponto["arquivo"])) as arrays:
+            linhas = np.flatnonzero(arrays["codigos"] == codigo)
+            return int(arrays["saldos"][linhas[0]]) if len(linhas) else None
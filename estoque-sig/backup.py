@@ -0,0 +1,198 @@
+"""Backups completos e incrementais, compactados, com restauração em fluxo.
+
+Um backup é um arquivo JSON Lines compactado com gzip: a primeira linha é o
+cabeçalho (tipo, checkpoint e, nos incrementais, o checkpoint base), seguida
+de um registro por linha (item, histórico, usuário, usuário removido) e de
+uma linha final com a contagem de registros, usada para detectar arquivos
+truncados.
+
+Cada backup cria um checkpoint. O backup incremental (delta) leva só o que
+mudou desde o checkpoint anterior: os itens e usuários marcados pelo
+``RastreadorAlteracoes`` e os registros de histórico acrescentados depois
+dele. Assim o custo acompanha o volume de mudanças, não o tamanho total.
+"""
+import gzip
+import io
+import json
+import threading
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+FORMATO_BACKUP = "estoque-sig-backup"
+VERSAO_BACKUP = 1
+
+# Campos obrigatórios por tipo de registro ("t")
+CAMPOS_REGISTRO = {
+    "item": ("codigo", "descricao", "unidade", "quantidade", "minimo", "maximo",
+             "localizacao", "fornecedor", "valor_unitario", "ultima_atualizacao"),
+    "historico": ("data", "tipo", "codigo", "descricao", "quantidade", "usuario"),
+    "usuario": ("usuario", "senha", "tipo"),
+    "usuario_removido": ("usuario",),
+}
+
+CAMPOS_INTEIROS = ("quantidade", "minimo", "maximo")
+
+# Codificador/decodificador reutilizados em todas as linhas
+_codificar = json.JSONEncoder(ensure_ascii=False).encode
+_decodificar = json.JSONDecoder().decode
+
+
+class RastreadorAlteracoes:
+    """Itens e usuários alterados desde o último checkpoint de backup"""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.checkpoint: Optional[str] = None
+        self.historico_inicio = 0
+        self._itens: Set[str] = set()
+        self._usuarios: Set[str] = set()
+
+    def marcar_item(self, codigo: str):
+        self._itens.add(codigo)
+
+    def marcar_itens(self, codigos: Iterable[str]):
+        self._itens.update(codigos)
+
+    def marcar_usuario(self, usuario: str):
+        self._usuarios.add(usuario)
+
+    def pendentes(self) -> int:
+        """Quantidade de itens e usuários alterados desde o checkpoint"""
+        return len(self._itens) + len(self._usuarios)
+
+    def iniciar_checkpoint(self, historico_fim: int) -> Tuple[Optional[str], Set[str], Set[str], int]:
+        """Abre um novo checkpoint e devolve o que mudou desde o anterior.
+
+        Retorna ``(checkpoint_anterior, itens, usuarios, historico_inicio)``.
+        Mudanças feitas daqui em diante entram no próximo delta.
+        """
+        with self._trava:
+            anterior = (self.checkpoint, self._itens, self._usuarios, self.historico_inicio)
+            self._itens, self._usuarios = set(), set()
+            self.historico_inicio = historico_fim
+            return anterior
+
+    def concluir_checkpoint(self, checkpoint: str):
+        self.checkpoint = checkpoint
+
+    def cancelar_checkpoint(self, anterior: Tuple[Optional[str], Set[str], Set[str], int]):
+        """Devolve as marcações de um checkpoint que não chegou a ser gravado"""
+        with self._trava:
+            self.checkpoint, itens, usuarios, self.historico_inicio = anterior
+            self._itens |= itens
+            self._usuarios |= usuarios
+
+    def redefinir(self, checkpoint: Optional[str], historico_fim: int):
+        """Estado recém-restaurado (ou substituído): nada pendente desde o checkpoint"""
+        with self._trava:
+            self.checkpoint = checkpoint
+            self.historico_inicio = historico_fim
+            self._itens, self._usuarios = set(), set()
+
+    def descontar_historico(self, anteriores: int, posteriores: int, historico_fim: int):
+        """Registros tirados do início do histórico (arquivados pela retenção).
+
+        ``anteriores`` já estavam em algum backup e só deslocam o início do
+        próximo delta. Se algum dos ``posteriores`` ainda não estava, ele não
+        cabe mais num delta: o checkpoint é descartado e o próximo backup
+        precisa ser completo.
+        """
+        with self._trava:
+            if posteriores:
+                self.checkpoint = None
+                self.historico_inicio = historico_fim
+                self._itens, self._usuarios = set(), set()
+            else:
+                self.historico_inicio -= anteriores
+
+
+def novo_cabecalho(tipo: str, base: Optional[str] = None) -> Dict:
+    """Cabeçalho de um backup "completo" ou "delta" com um checkpoint novo"""
+    return {
+        "formato": FORMATO_BACKUP,
+        "versao": VERSAO_BACKUP,
+        "tipo": tipo,
+        "checkpoint": uuid.uuid4().hex,
+        "base": base,
+        "data_backup": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def escrever_backup(destino: BinaryIO, cabecalho: Dict, registros: Iterable[Dict]) -> Dict[str, int]:
+    """Grava cabeçalho, registros e rodapé em JSON Lines compactado; retorna a contagem por tipo"""
+    contagem: Dict[str, int] = {}
+    with gzip.GzipFile(fileobj=destino, mode="wb", compresslevel=6) as compactado:
+        texto = io.TextIOWrapper(compactado, encoding="utf-8", newline="\n")
+        texto.write(_codificar(cabecalho) + "\n")
+        for registro in registros:
+            texto.write(_codificar(registro) + "\n")
+            contagem[registro["t"]] = contagem.get(registro["t"], 0) + 1
+        texto.write(json.dumps({"t": "fim", "contagem": contagem}) + "\n")
+        texto.flush()
+        texto.detach()
+    return contagem
+
+
+def ler_backup(origem: BinaryIO) -> Tuple[Dict, Iterator[Dict]]:
+    """Abre um backup e devolve o cabeçalho e um iterador de registros validados.
+
+    Os registros são lidos e validados um a um; um registro inválido, um
+    arquivo truncado ou uma contagem divergente levantam ``ValueError``.
+    """
+    texto = io.TextIOWrapper(gzip.GzipFile(fileobj=origem, mode="rb"), encoding="utf-8")
+    try:
+        cabecalho = json.loads(texto.readline() or "null")
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        raise ValueError(f"Arquivo de backup ilegível: {e}") from e
+    if not isinstance(cabecalho, dict) or cabecalho.get("formato") != FORMATO_BACKUP:
+        raise ValueError("O arquivo não é um backup do sistema.")
+    if cabecalho.get("versao") != VERSAO_BACKUP or cabecalho.get("tipo") not in ("completo", "delta"):
+        raise ValueError("Versão ou tipo de backup não suportado.")
+    return cabecalho, _registros(texto)
+
+
+def _registros(texto: io.TextIOWrapper) -> Iterator[Dict]:
+    contagem: Dict[str, int] = {}
+    numero = 1
+    try:
+        for numero, linha in enumerate(texto, start=2):
+            registro = _decodificar(linha)
+            if registro.get("t") == "fim":
+                if registro.get("contagem") != contagem:
+                    raise ValueError("Contagem de registros do backup não confere.")
+                return
+            validar_registro(registro, numero)
+            contagem[registro["t"]] = contagem.get(registro["t"], 0) + 1
+            yield registro
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        raise ValueError(f"Backup corrompido perto da linha {numero}: {e}") from e
+    raise ValueError("Backup incompleto (arquivo truncado).")
+
+
+def validar_registro(registro: Dict, numero: int = 0):
+    """Confere tipo, campos obrigatórios e números de um registro do backup"""
+    campos = CAMPOS_REGISTRO.get(registro.get("t"))
+    if campos is None:
+        raise ValueError(f"Linha {numero}: tipo de registro desconhecido.")
+    faltando = [campo for campo in campos if campo not in registro]
+    if faltando:
+        raise ValueError(f"Linha {numero}: campos ausentes ({', '.join(faltando)}).")
+    for campo in CAMPOS_INTEIROS:
+        if campo in registro and (not isinstance(registro[campo], int) or isinstance(registro[campo], bool)):
+            raise ValueError(f"Linha {numero}: {campo} deve ser inteiro.")
+    if registro["t"] == "item":
+        if min(registro["quantidade"], registro["minimo"], registro["maximo"]) < 0:
+            raise ValueError(f"Linha {numero}: quantidades não podem ser negativas.")
+        if not isinstance(registro["valor_unitario"], (int, float)) or registro["valor_unitario"] < 0:
+            raise ValueError(f"Linha {numero}: valor unitário inválido.")
+    elif registro["t"] == "historico":
+        data = registro["data"]
+        try:
+            # Formato fixo "%Y-%m-%d %H:%M:%S" (fromisoformat é bem mais rápido que strptime)
+            valida = isinstance(data, str) and len(data) == 19 and data[10] == " "
+            valida = valida and datetime.fromisoformat(data) is not None
+        except ValueError:
+            valida = False
+        if not valida:
+            raise ValueError(f"Linha {numero}: data inválida.")
@@ -0,0 +1,141 @@
+"""Benchmark de contenção e teste de estresse das movimentações concorrentes.
+
+Uso: ``python benchmark_concorrencia.py [--operacoes N] [--threads 1,2,4,8,16]``
+
+- vazão: threads fazendo saídas e entradas em poucos SKUs disputados
+  (contenção alta) e espalhadas por muitos SKUs (contenção baixa);
+- estresse: saídas concorrentes que somam mais que o saldo de poucos SKUs,
+  com troca de thread forçada o mais cedo possível. Ao fim nenhum saldo pode
+  estar negativo, o saldo de cada SKU deve ser o inicial mais as
+  movimentações aceitas e o histórico de cada SKU deve encadear os saldos.
+
+No CPython as threads dividem o GIL: a vazão total não cresce linearmente com
+as threads. O que se mede é que a trava por SKU não derruba a vazão com mais
+threads, nem quando todas disputam os mesmos itens.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from gerenciador_estoque import EstoqueManager
+
+USUARIO = "benchmark"
+
+
+def novo_gerenciador(itens: int, saldo: int) -> EstoqueManager:
+    """Gerenciador em memória com ``itens`` SKUs de saldo ``saldo``"""
+    manager = EstoqueManager()
+    manager.carregar_estoque({
+        f"B{i:05d}": {"descricao": f"ITEM {i}", "unidade": "UN", "quantidade": saldo,
+                      "minimo": 0, "maximo": saldo * 10, "localizacao": "", "fornecedor": "",
+                      "valor_unitario": 1.0, "ultima_atualizacao": ""}
+        for i in range(itens)
+    })
+    return manager
+
+
+def executar(manager: EstoqueManager, threads: int, operacoes: int, fracao_saida: float = 0.7,
+             maximo: int = 5, semente: int = 0) -> Tuple[float, List[Dict[str, int]]]:
+    """Dispara ``threads`` threads com ``operacoes`` movimentações cada, em SKUs sorteados.
+
+    Retorna o tempo decorrido e, por thread, a soma dos deltas aceitos por SKU
+    (chave "_recusadas" com o número de saídas recusadas).
+    """
+    codigos = list(manager.estoque.keys())
+    largada = threading.Barrier(threads + 1)
+    resultados: List[Dict[str, int]] = [{} for _ in range(threads)]
+
+    def trabalhar(numero: int):
+        sorteio = random.Random(semente * 1000 + numero)
+        aceitos = resultados[numero]
+        aceitos["_recusadas"] = 0
+        largada.wait()
+        for _ in range(operacoes):
+            codigo = sorteio.choice(codigos)
+            quantidade = sorteio.randint(1, maximo)
+            delta = -quantidade if sorteio.random() < fracao_saida else quantidade
+            if manager.movimentar(codigo, delta, usuario=USUARIO) is None:
+                aceitos["_recusadas"] += 1
+            else:
+                aceitos[codigo] = aceitos.get(codigo, 0) + delta
+
+    trabalhadores = [threading.Thread(target=trabalhar, args=(numero,)) for numero in range(threads)]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    largada.wait()
+    inicio = time.perf_counter()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    return time.perf_counter() - inicio, resultados
+
+
+def medir_vazao(lista_threads: List[int], operacoes: int):
+    """Movimentações por segundo por número de threads, com SKUs disputados e espalhados"""
+    print(f"{'cenário':<22}{'threads':>8}{'ops/s':>12}{'recusadas':>11}")
+    for cenario, itens in (("4 SKUs (disputa)", 4), ("10.000 SKUs", 10000)):
+        for threads in lista_threads:
+            manager = novo_gerenciador(itens, 10 ** 9)
+            decorrido, resultados = executar(manager, threads, operacoes // threads)
+            total = (operacoes // threads) * threads
+            recusadas = sum(resultado["_recusadas"] for resultado in resultados)
+            print(f"{cenario:<22}{threads:>8}{total / decorrido:>12,.0f}{recusadas:>11}")
+
+
+def estresse(threads: int = 16, operacoes: int = 2000, itens: int = 4, saldo: int = 50) -> Dict[str, int]:
+    """Saídas concorrentes acima do saldo; levanta AssertionError se algum invariante falhar"""
+    manager = novo_gerenciador(itens, saldo)
+    intervalo = sys.getswitchinterval()
+    # Troca de thread o mais cedo possível: expõe qualquer janela entre conferir e baixar
+    sys.setswitchinterval(1e-6)
+    try:
+        _, resultados = executar(manager, threads, operacoes, fracao_saida=0.8, maximo=10, semente=1)
+    finally:
+        sys.setswitchinterval(intervalo)
+
+    aceitos: Dict[str, int] = {}
+    for resultado in resultados:
+        for codigo, delta in resultado.items():
+            if codigo != "_recusadas":
+                aceitos[codigo] = aceitos.get(codigo, 0) + delta
+    negativos = 0
+    for codigo in manager.estoque.keys():
+        quantidade = int(manager.estoque[codigo]["quantidade"])
+        negativos += quantidade < 0
+        assert quantidade == saldo + aceitos.get(codigo, 0), f"{codigo}: saldo não confere"
+
+    # Cada registro do SKU parte do saldo deixado pelo anterior
+    saldos = {codigo: saldo for codigo in manager.estoque.keys()}
+    registros = 0
+    for registro in manager.historico:
+        codigo = registro["codigo"]
+        assert registro["quantidade"] == saldos[codigo] + registro["delta"], \
+            f"{codigo}: histórico fora da ordem dos saldos"
+        assert registro["quantidade"] >= 0, f"{codigo}: saldo negativo no histórico"
+        saldos[codigo] = registro["quantidade"]
+        registros += 1
+    assert saldos == {codigo: int(manager.estoque[codigo]["quantidade"]) for codigo in saldos}
+    assert negativos == 0, f"{negativos} saldos negativos"
+    return {"movimentacoes": registros,
+            "recusadas": sum(resultado["_recusadas"] for resultado in resultados),
+            "negativos": negativos}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operacoes", type=int, default=40000,
+                        help="movimentações por cenário de vazão (divididas entre as threads)")
+    parser.add_argument("--threads", default="1,2,4,8,16",
+                        help="números de threads separados por vírgula")
+    argumentos = parser.parse_args()
+
+    medir_vazao([int(n) for n in argumentos.threads.split(",")], argumentos.operacoes)
+    resultado = estresse()
+    print(f"estresse: {resultado['movimentacoes']} movimentações aceitas, "
+          f"{resultado['recusadas']} saídas recusadas, {resultado['negativos']} saldos negativos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Cache de resultados derivados, válido por versão do estado.
+
+O gerenciador mantém uma versão monotônica que avança a cada mutação. Um
+resultado calculado (relatório, alertas, estatísticas) fica guardado com a
+versão em que foi calculado e serve enquanto ela for a atual: reruns e abas
+de várias sessões reutilizam o mesmo cálculo até a próxima alteração.
+
+Chaves distintas competem por um número fixo de entradas (as menos usadas
+recentemente saem primeiro). Pedidos simultâneos da mesma chave calculam uma
+única vez: os demais aguardam e recebem o resultado pronto.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+CAPACIDADE_CACHE = 64
+
+
+class CacheVersionado:
+    """Resultados por chave, com descarte LRU e validade atrelada à versão"""
+
+    def __init__(self, capacidade: int = CAPACIDADE_CACHE):
+        self.capacidade = capacidade
+        self._trava = threading.Lock()
+        self._entradas: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        # Uma trava por chave em cálculo: o mesmo resultado não é montado em dobro
+        self._calculando: Dict[Hashable, threading.Lock] = {}
+        self.acertos = 0
+        self.faltas = 0
+
+    def obter(self, chave: Hashable, versao: int, calcular: Callable[[], Any]) -> Any:
+        """Resultado da chave na versão informada (calculado só se ainda não estiver guardado)"""
+        valor = self._consultar(chave, versao)
+        if valor is not _AUSENTE:
+            return valor
+        with self._trava:
+            trava_chave = self._calculando.setdefault(chave, threading.Lock())
+        with trava_chave:
+            # Outro pedido pode ter calculado enquanto esperávamos a trava
+            valor = self._consultar(chave, versao)
+            if valor is not _AUSENTE:
+                return valor
+            valor = calcular()
+            with self._trava:
+                self.faltas += 1
+                atual = self._entradas.get(chave)
+                # Um cálculo atrasado nunca substitui o de uma versão mais nova
+                if atual is None or atual[0] <= versao:
+                    self._entradas[chave] = (versao, valor)
+                    self._entradas.move_to_end(chave)
+                while len(self._entradas) > self.capacidade:
+                    descartada, _ = self._entradas.popitem(last=False)
+                    self._calculando.pop(descartada, None)
+        return valor
+
+    def _consultar(self, chave: Hashable, versao: int) -> Any:
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] != versao:
+                return _AUSENTE
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[1]
+
+    def limpar(self):
+        """Descarta todos os resultados guardados"""
+        with self._trava:
+            self._entradas.clear()
+            self._calculando.clear()
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+
+_AUSENTE = object()
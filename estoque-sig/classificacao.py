@@ -0,0 +1,140 @@
+"""Classificação ABC (valor em estoque) e XYZ (variabilidade da demanda) dos itens.
+
+ABC: em ordem decrescente de valor, os itens até 80% do valor acumulado são
+A, até 95% são B e os demais C. A classificação completa ordena o catálogo;
+depois dela, mudanças de valor só atualizam as classes dos itens alterados,
+desde que nenhum deles cruze o valor de corte entre classes e que a soma das
+mudanças não passe de ``TOLERANCIA_ABC`` do valor total (os cortes por valor
+acumulado praticamente não se movem). Fora disso o catálogo é reordenado.
+
+XYZ: coeficiente de variação do consumo diário (saídas do histórico) nos
+últimos ``DIAS_XYZ`` dias: X até 0,5, Y até 1,0 e Z acima disso ou sem
+consumo no período. Só os códigos com saídas novas são recalculados, exceto
+quando a janela de consumo avança de dia.
+"""
+import threading
+from typing import Hashable, Optional
+
+import numpy as np
+
+from previsao import PrevisaoDemanda
+
+CLASSES_ABC = ["A", "B", "C"]
+CLASSES_XYZ = ["X", "Y", "Z"]
+
+# Percentual acumulado do valor que fecha as classes A e B
+CORTES_ABC = np.array([80.0, 95.0])
+# Coeficiente de variação que fecha as classes X e Y
+LIMITES_XYZ = np.array([0.5, 1.0])
+
+TOLERANCIA_ABC = 0.01
+DIAS_XYZ = 28
+
+
+def classes_xyz(variacao: np.ndarray) -> np.ndarray:
+    """Classe XYZ (índice em ``CLASSES_XYZ``) de cada coeficiente de variação (NaN vai para Z)"""
+    return np.searchsorted(LIMITES_XYZ, variacao, side="left").astype(np.int8)
+
+
+def rotulos_classes(abc: np.ndarray, xyz: np.ndarray) -> np.ndarray:
+    """Rótulo combinado ("AX", "BZ", ...) a partir dos índices das duas classificações"""
+    combinados = np.array([a + x for a in CLASSES_ABC for x in CLASSES_XYZ])
+    return combinados[np.asarray(abc, dtype=np.int64) * len(CLASSES_XYZ) + xyz]
+
+
+class ClassificacaoABC:
+    """Classes ABC por linha do estoque, reordenando o catálogo só quando necessário"""
+
+    def __init__(self, tolerancia: float = TOLERANCIA_ABC):
+        self.tolerancia = tolerancia
+        self._trava = threading.Lock()
+        self._base: Optional[Hashable] = None
+        self._valor = np.zeros(0)
+        self._classes = np.zeros(0, dtype=np.int8)
+        self._total = 0.0
+        self._desvio = 0.0
+        # Por corte: menor valor das classes acima e maior valor das classes abaixo
+        self._acima = np.full(len(CORTES_ABC), np.inf)
+        self._abaixo = np.full(len(CORTES_ABC), -np.inf)
+        self.reclassificacoes = 0
+
+    def atualizar(self, valor: np.ndarray, base: Hashable) -> np.ndarray:
+        """Classe (índice em ``CLASSES_ABC``) de cada linha para os valores informados.
+
+        ``base`` identifica o conjunto e a ordem das linhas (versão do cadastro):
+        quando muda, tudo é reclassificado. O array devolvido não é alterado
+        depois; atualizações seguintes devolvem outro.
+        """
+        with self._trava:
+            if base != self._base or len(valor) != len(self._valor):
+                self._reclassificar(valor, base)
+                return self._classes
+            alterados = np.flatnonzero(valor != self._valor)
+            if not len(alterados):
+                return self._classes
+            novos = valor[alterados]
+            classes = self._classes[alterados]
+            desvio = self._desvio + float(np.abs(novos - self._valor[alterados]).sum())
+            # Limites conservadores: só encolhem a folga entre as classes de cada corte
+            acima = self._acima.copy()
+            abaixo = self._abaixo.copy()
+            for corte in range(len(CORTES_ABC)):
+                superiores = novos[classes <= corte]
+                inferiores = novos[classes > corte]
+                if len(superiores):
+                    acima[corte] = min(acima[corte], superiores.min())
+                if len(inferiores):
+                    abaixo[corte] = max(abaixo[corte], inferiores.max())
+            if desvio > self.tolerancia * self._total or np.any(acima <= abaixo):
+                self._reclassificar(valor, base)
+                return self._classes
+            self._valor[alterados] = novos
+            self._desvio = desvio
+            self._acima, self._abaixo = acima, abaixo
+            return self._classes
+
+    def _reclassificar(self, valor: np.ndarray, base: Hashable):
+        n = len(valor)
+        ordem = np.argsort(-valor, kind="stable")
+        ordenado = valor[ordem]
+        self._total = float(ordenado.sum())
+        classes = np.full(n, len(CLASSES_ABC) - 1, dtype=np.int8)
+        if self._total > 0:
+            percentual = np.cumsum(ordenado) / self._total * 100
+            classes[ordem] = np.searchsorted(CORTES_ABC, percentual, side="left")
+        fim = np.cumsum(np.bincount(classes, minlength=len(CLASSES_ABC)))[:len(CORTES_ABC)]
+        self._acima = np.array([ordenado[p - 1] if p > 0 else np.inf for p in fim])
+        self._abaixo = np.array([ordenado[p] if p < n else -np.inf for p in fim])
+        self._valor = np.array(valor, dtype=np.float64)
+        self._classes = classes
+        self._desvio = 0.0
+        self._base = base
+        self.reclassificacoes += 1
+
+
+class ClassificacaoXYZ:
+    """Coeficiente de variação do consumo por código do histórico, recalculado por alteração"""
+
+    def __init__(self, dias: int = DIAS_XYZ):
+        self.dias = dias
+        self._trava = threading.Lock()
+        self._marca: Optional[int] = None
+        self._variacao = np.zeros(0)
+
+    def atualizar(self, previsao: PrevisaoDemanda) -> np.ndarray:
+        """Coeficiente de variação por código do histórico (NaN sem consumo).
+
+        Chamar depois de ``previsao.atualizar``. O array devolvido não é
+        alterado depois; atualizações seguintes devolvem outro.
+        """
+        with self._trava:
+            linhas, variacao, marca = previsao.variabilidade(self.dias, self._marca)
+            if linhas is None:
+                self._variacao = variacao
+            elif len(linhas):
+                atual = np.full(max(len(self._variacao), int(linhas.max()) + 1), np.nan)
+                atual[:len(self._variacao)] = self._variacao
+                atual[linhas] = variacao
+                self._variacao = atual
+            self._marca = marca
+            return self._variacao
@@ -0,0 +1,48 @@
+"""Primitivas de concorrência do gerenciador de estoque compartilhado.
+
+Leituras não usam travas. Escritas em um item usam uma trava listrada
+(stripe) escolhida pelo código do SKU, de modo que movimentações em itens
+diferentes raramente disputam a mesma trava. Mudanças estruturais (cadastro
+de item, restauração) adquirem todas as listras em ordem fixa.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List
+
+
+class TravasListradas:
+    """Conjunto fixo de travas indexado pelo hash do código do item"""
+
+    def __init__(self, listras: int = 64):
+        self._travas: List[threading.Lock] = [threading.Lock() for _ in range(listras)]
+
+    def indice(self, codigo: str) -> int:
+        """Listra responsável pelo código"""
+        return hash(codigo) % len(self._travas)
+
+    def trava(self, codigo: str) -> threading.Lock:
+        """Trava que protege as escritas no item"""
+        return self._travas[self.indice(codigo)]
+
+    @contextmanager
+    def varias(self, codigos: Iterable[str]) -> Iterator[None]:
+        """Adquire as listras de vários itens (em ordem crescente, sem deadlock)"""
+        indices = sorted({self.indice(codigo) for codigo in codigos})
+        for i in indices:
+            self._travas[i].acquire()
+        try:
+            yield
+        finally:
+            for i in reversed(indices):
+                self._travas[i].release()
+
+    @contextmanager
+    def todas(self) -> Iterator[None]:
+        """Adquire todas as listras (mudanças estruturais no estoque)"""
+        for trava in self._travas:
+            trava.acquire()
+        try:
+            yield
+        finally:
+            for trava in reversed(self._travas):
+                trava.release()
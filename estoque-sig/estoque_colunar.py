@@ -0,0 +1,313 @@
+"""Armazenamento colunar (struct-of-arrays) do estoque.
+
+Os campos numéricos de todos os itens ficam em arrays NumPy contíguos e os
+campos de texto em listas paralelas, com um índice ``codigo → linha``. A
+interface de dicionário usada pelo restante do sistema
+(``estoque[codigo]["quantidade"]``) continua funcionando sobre as colunas.
+
+Carregadas de um snapshot, as colunas numéricas são arrays mapeados em modo
+cópia na escrita e as de texto são ``TextosMapeados``: nos dois casos só o que
+for alterado passa a ocupar memória própria.
+"""
+from collections.abc import Mapping, MutableMapping, MutableSequence
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+import numpy as np
+
+# Ordem dos campos de um item (a mesma do dicionário original)
+CAMPOS = ("descricao", "unidade", "quantidade", "minimo", "maximo",
+          "localizacao", "fornecedor", "valor_unitario", "ultima_atualizacao")
+
+CAMPOS_NUMERICOS = {
+    "quantidade": np.int64,
+    "minimo": np.int64,
+    "maximo": np.int64,
+    "valor_unitario": np.float64,
+}
+
+CAMPOS_TEXTO = tuple(c for c in CAMPOS if c not in CAMPOS_NUMERICOS)
+
+# Separador dos valores no bloco de uma coluna de texto mapeada
+SEP_TEXTO = "\x00"
+
+
+class TextosMapeados(MutableSequence):
+    """Coluna de texto sobre um bloco UTF-8 (valores terminados por SEP_TEXTO) e seus deslocamentos.
+
+    Leituras decodificam só a posição pedida; valores alterados ou
+    acrescentados ficam à parte, sem escrever no bloco original. Como nas
+    demais colunas, só se acrescenta ou remove no final.
+    """
+
+    def __init__(self, texto: np.ndarray, inicio: np.ndarray):
+        self._texto = texto
+        self._inicio = inicio
+        self._n_base = len(inicio) - 1
+        self._alterados: Dict[int, str] = {}
+        self._extra: List[str] = []
+
+    def _posicao(self, indice: int) -> int:
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError("posição fora da coluna")
+        return indice
+
+    def __len__(self) -> int:
+        return self._n_base + len(self._extra)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self[i] for i in range(*indice.indices(len(self)))]
+        indice = self._posicao(indice)
+        if indice >= self._n_base:
+            return self._extra[indice - self._n_base]
+        valor = self._alterados.get(indice)
+        if valor is None:
+            inicio = self._inicio
+            valor = bytes(self._texto[inicio[indice]:inicio[indice + 1] - 1]).decode("utf-8")
+        return valor
+
+    def __setitem__(self, indice: int, valor: str):
+        indice = self._posicao(indice)
+        if indice >= self._n_base:
+            self._extra[indice - self._n_base] = valor
+        else:
+            self._alterados[indice] = valor
+
+    def __delitem__(self, indice: int):
+        if self._posicao(indice) != len(self) - 1:
+            raise TypeError("Só o último valor da coluna pode ser removido")
+        if self._extra:
+            self._extra.pop()
+        else:
+            self._n_base -= 1
+            self._alterados.pop(self._n_base, None)
+
+    def insert(self, indice: int, valor: str):
+        if indice != len(self):
+            raise TypeError("Valores só podem ser acrescentados no final da coluna")
+        self._extra.append(valor)
+
+    def extend(self, valores: Iterable[str]):
+        self._extra.extend(valores)
+
+    def __iter__(self) -> Iterator[str]:
+        # Decodifica o bloco inteiro de uma vez (bem mais rápido que posição a posição)
+        fim = int(self._inicio[self._n_base])
+        valores = bytes(self._texto[:fim]).decode("utf-8").split(SEP_TEXTO)[:self._n_base]
+        for indice, valor in self._alterados.items():
+            valores[indice] = valor
+        valores.extend(self._extra)
+        return iter(valores)
+
+
+class ItemColunar(MutableMapping):
+    """Visão dict-like de um item armazenado nas colunas"""
+
+    __slots__ = ("_estoque", "_codigo")
+
+    def __init__(self, estoque: "EstoqueColunar", codigo: str):
+        self._estoque = estoque
+        self._codigo = codigo
+
+    def __getitem__(self, campo: str):
+        return self._estoque.obter_campo(self._codigo, campo)
+
+    def __setitem__(self, campo: str, valor):
+        self._estoque.definir_campo(self._codigo, campo, valor)
+
+    def __delitem__(self, campo: str):
+        raise TypeError("Campos de um item do estoque não podem ser removidos")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(CAMPOS)
+
+    def __len__(self) -> int:
+        return len(CAMPOS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class EstoqueColunar(MutableMapping):
+    """Estoque em colunas NumPy com índice codigo → linha"""
+
+    def __init__(self, capacidade: int = 1024):
+        self._linhas: Dict[str, int] = {}
+        self._codigos: List[str] = []
+        self._n = 0
+        self._numericos = {campo: np.zeros(capacidade, dtype=dtype)
+                           for campo, dtype in CAMPOS_NUMERICOS.items()}
+        self._textos: Dict[str, List[str]] = {campo: [] for campo in CAMPOS_TEXTO}
+
+    @classmethod
+    def de_dict(cls, dados: Mapping) -> "EstoqueColunar":
+        """Cria o estoque colunar a partir de um dicionário codigo → item"""
+        estoque = cls(capacidade=max(1024, len(dados)))
+        for codigo, item in dados.items():
+            estoque[codigo] = item
+        return estoque
+
+    @classmethod
+    def de_colunas(cls, codigos: List[str], numericos: Mapping[str, np.ndarray],
+                   textos: Mapping[str, MutableSequence]) -> "EstoqueColunar":
+        """Monta o estoque sobre colunas prontas (de um snapshot), sem copiá-las.
+
+        As colunas numéricas podem ter capacidade maior que o número de itens.
+        """
+        estoque = cls(capacidade=0)
+        estoque._codigos = codigos
+        estoque._linhas = dict(zip(codigos, range(len(codigos))))
+        estoque._n = len(codigos)
+        estoque._numericos = dict(numericos)
+        estoque._textos = dict(textos)
+        return estoque
+
+    def para_dict(self) -> Dict[str, Dict]:
+        """Exporta o estoque como dicionário simples (serializável em JSON)"""
+        return {codigo: dict(self[codigo]) for codigo in self._linhas}
+
+    def anexar_lote(self, codigos: List[str], colunas: Mapping[str, Sequence]):
+        """Acrescenta vários itens novos de uma vez (os códigos não podem existir)"""
+        inicio = self._n
+        quantidade = len(codigos)
+        self._garantir_capacidade(inicio + quantidade)
+        for campo in CAMPOS_NUMERICOS:
+            self._numericos[campo][inicio:inicio + quantidade] = colunas[campo]
+        for campo in CAMPOS_TEXTO:
+            self._textos[campo].extend(colunas[campo])
+        self._codigos.extend(codigos)
+        self._linhas.update(zip(codigos, range(inicio, inicio + quantidade)))
+        self._n += quantidade
+
+    # Interface de dicionário
+
+    def __getitem__(self, codigo: str) -> ItemColunar:
+        if codigo not in self._linhas:
+            raise KeyError(codigo)
+        return ItemColunar(self, codigo)
+
+    def __setitem__(self, codigo: str, item: Mapping):
+        linha = self._linhas.get(codigo)
+        if linha is None:
+            linha = self._n
+            self._garantir_capacidade(linha + 1)
+            self._linhas[codigo] = linha
+            self._codigos.append(codigo)
+            for campo in CAMPOS_TEXTO:
+                self._textos[campo].append("")
+            self._n += 1
+
+        for campo in CAMPOS_NUMERICOS:
+            self._numericos[campo][linha] = item.get(campo, 0)
+        for campo in CAMPOS_TEXTO:
+            self._textos[campo][linha] = item.get(campo, "")
+
+    def __delitem__(self, codigo: str):
+        linha = self._linhas.pop(codigo)
+        ultima = self._n - 1
+
+        # Move a última linha para o espaço liberado para manter as colunas contíguas
+        if linha != ultima:
+            codigo_movido = self._codigos[ultima]
+            self._codigos[linha] = codigo_movido
+            self._linhas[codigo_movido] = linha
+            for coluna in self._numericos.values():
+                coluna[linha] = coluna[ultima]
+            for coluna in self._textos.values():
+                coluna[linha] = coluna[ultima]
+
+        self._codigos.pop()
+        for coluna in self._textos.values():
+            coluna.pop()
+        self._n -= 1
+
+    def __contains__(self, codigo) -> bool:
+        return codigo in self._linhas
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._linhas)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __repr__(self) -> str:
+        return f"EstoqueColunar({self._n} itens)"
+
+    # Acesso por campo
+
+    def obter_campo(self, codigo: str, campo: str):
+        """Retorna o valor de um campo do item como tipo Python"""
+        linha = self._linhas[codigo]
+        if campo in CAMPOS_NUMERICOS:
+            return self._numericos[campo][linha].item()
+        if campo in self._textos:
+            return self._textos[campo][linha]
+        raise KeyError(campo)
+
+    def definir_campo(self, codigo: str, campo: str, valor):
+        """Altera o valor de um campo do item"""
+        linha = self._linhas[codigo]
+        if campo in CAMPOS_NUMERICOS:
+            self._numericos[campo][linha] = valor
+        elif campo in self._textos:
+            self._textos[campo][linha] = valor
+        else:
+            raise KeyError(campo)
+
+    # Acesso colunar
+
+    def coluna(self, campo: str) -> np.ndarray:
+        """Retorna visão somente leitura de uma coluna numérica"""
+        visao = self._numericos[campo][:self._n]
+        visao.flags.writeable = False
+        return visao
+
+    def textos(self, campo: str) -> List[str]:
+        """Retorna a coluna de texto (alinhada com as linhas)"""
+        return self._textos[campo]
+
+    def codigos(self) -> List[str]:
+        """Retorna os códigos na ordem das linhas"""
+        return self._codigos
+
+    def linha(self, codigo: str) -> int:
+        """Retorna a linha ocupada pelo código"""
+        return self._linhas[codigo]
+
+    def linhas(self, codigos: Sequence[str]) -> np.ndarray:
+        """Linhas ocupadas pelos códigos (-1 para códigos inexistentes)"""
+        obter = self._linhas.get
+        return np.fromiter((obter(codigo, -1) for codigo in codigos),
+                           dtype=np.int64, count=len(codigos))
+
+    def atribuir(self, campo: str, linhas: np.ndarray, valores: Sequence):
+        """Atribui valores (alinhados com as linhas) a uma coluna"""
+        if campo in CAMPOS_NUMERICOS:
+            self._numericos[campo][linhas] = valores
+        else:
+            coluna = self._textos[campo]
+            for linha, valor in zip(linhas.tolist(), valores):
+                coluna[linha] = valor
+
+    def somar(self, campo: str, linhas: np.ndarray, valores: np.ndarray):
+        """Soma valores a uma coluna numérica nas linhas informadas (linhas repetidas acumulam)"""
+        np.add.at(self._numericos[campo], linhas, valores)
+
+    def preencher(self, campo: str, linhas: np.ndarray, valor: str):
+        """Atribui o mesmo texto a uma coluna nas linhas informadas"""
+        coluna = self._textos[campo]
+        for linha in linhas.tolist():
+            coluna[linha] = valor
+
+    def _garantir_capacidade(self, tamanho: int):
+        capacidade = len(self._numericos["quantidade"])
+        if tamanho <= capacidade:
+            return
+        while capacidade < tamanho:
+            capacidade = max(1, capacidade * 2)
+        for campo, coluna in self._numericos.items():
+            nova = np.zeros(capacidade, dtype=coluna.dtype)
+            nova[:self._n] = coluna[:self._n]
+            self._numericos[campo] = nova
@@ -0,0 +1,86 @@
+"""Exportação em blocos para CSV, CSV compactado (gzip) e Parquet.
+
+Os dados chegam como uma sequência de DataFrames pequenos, produzidos a partir
+do armazenamento (estoque ou segmentos do histórico), e cada bloco é gravado
+no destino antes de o próximo ser montado. A memória usada fica limitada ao
+tamanho de um bloco, mais o buffer do arquivo de saída.
+"""
+import gzip
+import io
+import tempfile
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Formato -> (extensão do arquivo, tipo MIME)
+FORMATOS_EXPORTACAO: Dict[str, Tuple[str, str]] = {
+    "CSV": ("csv", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+TAMANHO_BLOCO_EXPORTACAO = 50000
+
+
+def escrever_blocos(blocos: Iterable["pd.DataFrame"], destino: BinaryIO, formato: str) -> int:
+    """Grava os blocos no destino, um de cada vez; retorna o número de linhas gravadas"""
+    if formato not in FORMATOS_EXPORTACAO:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    if formato == "Parquet":
+        return _escrever_parquet(blocos, destino)
+
+    compactado = gzip.GzipFile(fileobj=destino, mode="wb") if formato == "CSV (gzip)" else None
+    texto = io.TextIOWrapper(compactado or destino, encoding="utf-8", newline="")
+    linhas = 0
+    primeiro = True
+    try:
+        for bloco in blocos:
+            bloco.to_csv(texto, index=False, header=primeiro)
+            primeiro = False
+            linhas += len(bloco)
+    finally:
+        texto.flush()
+        # Solta o destino sem fechá-lo (quem o abriu decide quando fechar)
+        texto.detach()
+        if compactado is not None:
+            compactado.close()
+    return linhas
+
+
+def _escrever_parquet(blocos: Iterable["pd.DataFrame"], destino: BinaryIO) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ValueError("A exportação em Parquet requer o pacote pyarrow.") from e
+
+    escritor = None
+    esquema = None
+    linhas = 0
+    try:
+        for bloco in blocos:
+            tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+            if escritor is None:
+                # Categorias variam entre blocos: grava os valores e deixa a
+                # codificação por dicionário com o próprio Parquet
+                esquema = pa.schema([
+                    campo.with_type(campo.type.value_type)
+                    if pa.types.is_dictionary(campo.type) else campo
+                    for campo in tabela.schema
+                ])
+                escritor = pq.ParquetWriter(destino, esquema)
+            escritor.write_table(tabela.cast(esquema))
+            linhas += len(bloco)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return linhas
+
+
+def exportar_para_arquivo(blocos: Iterable["pd.DataFrame"], formato: str) -> BinaryIO:
+    """Grava os blocos num arquivo temporário e o devolve posicionado no início"""
+    arquivo = tempfile.TemporaryFile()
+    escrever_blocos(blocos, arquivo, formato)
+    arquivo.seek(0)
+    return arquivo
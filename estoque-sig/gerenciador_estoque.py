@@ -0,0 +1,1642 @@
+"""Núcleo do estoque: o ``EstoqueManager`` e sua configuração, sem a interface.
+
+Importar este módulo não carrega o Streamlit nem o pandas: workers, scripts e
+testes abrem o gerenciador e movimentam o estoque de qualquer thread ou
+processo. O usuário que age é passado explicitamente a cada operação; o
+pandas é importado só pelas operações que recebem ou montam DataFrames
+(relatórios, importação do catálogo, lotes de movimentações).
+"""
+import atexit
+import hashlib
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, Iterator, List, Sequence, Tuple, Optional
+
+import numpy as np
+
+from estoque_colunar import EstoqueColunar
+from agregados import AgregadosEstoque, EstadoItem
+from indice_alertas import STATUS_ALERTA, IndiceAlertas
+from indice_valor import GRUPOS_VALOR, IndiceValor
+from indice_busca import IndiceBusca
+from concorrencia import TravasListradas
+from persistencia import COLUNAS_HISTORICO, COLUNAS_ITEM, ArmazenamentoMemoria, ArmazenamentoSQLite
+from historico_colunar import PADROES_REGISTRO, HistoricoColunar, completar_colunas, formatar_epoca, para_epoca
+from arquivo_historico import ArquivoHistorico
+from monitor_alertas import DestinoAlerta, DestinoEmail, DestinoFila, DestinoWebhook, MonitorAlertas
+from exportacao import TAMANHO_BLOCO_EXPORTACAO
+from backup import RastreadorAlteracoes, escrever_backup, ler_backup, novo_cabecalho
+from snapshot import abrir_snapshot, gravar_snapshot, ler_manifesto
+from cache_versionado import CacheVersionado
+from paginacao import pagina_ordenada
+from previsao import JANELA_PREVISAO, SEGUNDOS_DIA, PrevisaoDemanda, dia_da_semana, dias_ate_minimo
+from classificacao import (CLASSES_ABC, CLASSES_XYZ, ClassificacaoABC, ClassificacaoXYZ, classes_xyz,
+                           rotulos_classes)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Usuário registrado no histórico quando a operação não informa quem agiu
+USUARIO_SISTEMA = "sistema"
+
+# Status possíveis de um item (categorias da coluna "Status" do relatório)
+STATUS_ITEM = ["🟢 Normal", "🟡 Abaixo do Mínimo", "🔴 Sem Estoque", "🟠 Acima do Máximo"]
+
+# Colunas do relatório e campos do estoque de onde vêm (ordenação das páginas)
+COLUNAS_NUMERICAS_RELATORIO = {"Quantidade": "quantidade", "Mínimo": "minimo",
+                               "Máximo": "maximo", "Valor Unit.": "valor_unitario"}
+COLUNAS_TEXTO_RELATORIO = {"Código": "codigo", "Descrição": "descricao", "Unidade": "unidade",
+                           "Localização": "localizacao", "Fornecedor": "fornecedor",
+                           "Última Atualização": "ultima_atualizacao"}
+
+# Acima deste número de itens por bloco importado, o índice de busca é
+# reconstruído uma única vez ao final em vez de atualizado item a item
+LIMITE_BUSCA_INCREMENTAL = 2000
+
+# Linhas recusadas guardadas para exibição ao final de uma importação
+LIMITE_RECUSAS = 1000
+
+# Registros por bloco na geração e na restauração de backups
+TAMANHO_BLOCO_BACKUP = 20000
+
+# Dias de histórico mantidos em memória quando a retenção está ativa (padrão)
+DIAS_HISTORICO_PADRAO = 30
+
+class EstoqueManager:
+    def __init__(self, colunar: bool = True,
+                 armazenamento: Optional[ArmazenamentoMemoria] = None,
+                 diretorio_historico: Optional[str] = None,
+                 diretorio_snapshot: Optional[str] = None,
+                 diretorio_arquivo: Optional[str] = None):
+        # Gerenciador compartilhado entre sessões: leituras sem trava, escritas
+        # com trava listrada por SKU e uma trava curta para agregados e índices
+        self._travas = TravasListradas()
+        self._trava_derivados = threading.Lock()
+        self._trava_historico = threading.Lock()
+        self._trava_backup = threading.Lock()
+        
+        # Versão do estado: avança a cada mutação e invalida o cache de resultados
+        # (trava própria: mutações sob listras diferentes avançam a versão em ordem)
+        self._trava_versao = threading.Lock()
+        self.versao = 0
+        self.versao_cadastro = 0
+        self.cache = CacheVersionado()
+        
+        # Sem armazenamento informado os dados vivem apenas na memória do processo
+        self.armazenamento = armazenamento or ArmazenamentoMemoria()
+        # Segmentos selados do histórico são mapeados a partir deste diretório (opcional)
+        self._diretorio_historico = diretorio_historico
+        # Snapshot binário usado na partida quando está em dia com o armazenamento
+        self._diretorio_snapshot = diretorio_snapshot
+        # Registros fora da janela quente do histórico, compactados em disco (opcional)
+        self.arquivo = ArquivoHistorico(diretorio_arquivo) if diretorio_arquivo else None
+        parametros = self.armazenamento.carregar_parametros()
+        self.dias_historico = parametros.get("dias_historico", DIAS_HISTORICO_PADRAO)
+        self.retencao_ativa = bool(parametros.get("retencao_ativa", 0))
+        # Status de alerta que geram notificação (Configurações → Sistema)
+        self.alertas_ativos = {status: bool(parametros.get(f"alerta_{status}", 1)) for status in STATUS_ALERTA}
+        # Avaliação de alertas em segundo plano (iniciada com iniciar_monitor_alertas)
+        self.monitor_alertas: Optional[MonitorAlertas] = None
+        
+        # Estoque colunar (arrays NumPy) por padrão; dicionário simples como alternativa
+        self.estoque = EstoqueColunar() if colunar else {}
+        self.usuarios = self.armazenamento.carregar_usuarios()
+        if not self.usuarios:
+            self.usuarios = {
+                "admin": {"senha": self.hash_senha("admin123"), "tipo": "Administrador"},
+                "user": {"senha": self.hash_senha("user123"), "tipo": "Operador"}
+            }
+            for usuario, dados in self.usuarios.items():
+                self.armazenamento.salvar_usuario(usuario, dados)
+        
+        # Com snapshot em dia, estoque, histórico e índice de busca vêm dele por mmap
+        indice_busca = self._abrir_snapshot() if colunar and diretorio_snapshot else None
+        if indice_busca is None and self.armazenamento.possui_itens():
+            self._carregar_itens_armazenados()
+            # O histórico só é lido do banco na primeira consulta
+            self._historico = None
+        elif indice_busca is None:
+            self.inicializar_estoque()
+            self.armazenamento.salvar_itens(self.estoque)
+            self._historico = self._novo_historico()
+        
+        # Totais do Dashboard mantidos incrementalmente pelas operações
+        self.agregados = AgregadosEstoque()
+        self.agregados.recalcular(self.estoque)
+        # Índice de alertas por status, atualizado a cada mudança de quantidade/limites
+        self.indice_alertas = IndiceAlertas()
+        self.indice_alertas.reconstruir(self.estoque)
+        # Ranking por valor (geral e por fornecedor/localização) para os gráficos de maiores itens
+        self.indice_valor = IndiceValor()
+        self.indice_valor.reconstruir(self.estoque)
+        # Índice de trigramas para busca por código/descrição (pronto, se veio do snapshot)
+        if indice_busca is None:
+            self.indice_busca = IndiceBusca()
+            self._reconstruir_indice_busca()
+        else:
+            self.indice_busca = indice_busca
+        # Quando ativo, toda leitura das estatísticas confere os agregados
+        self.modo_verificacao = False
+        # Consumo diário por SKU, alimentado pelas saídas do histórico
+        self.previsao = PrevisaoDemanda()
+        # Classes ABC (valor) e XYZ (variabilidade do consumo), atualizadas por alteração
+        self.classificacao_abc = ClassificacaoABC()
+        self.classificacao_xyz = ClassificacaoXYZ()
+        # Itens e usuários alterados desde o último backup (base dos incrementais)
+        self.alteracoes = RastreadorAlteracoes()
+    
+    @property
+    def historico(self) -> HistoricoColunar:
+        """Log colunar de movimentações (carregado do armazenamento sob demanda)"""
+        if self._historico is None:
+            with self._trava_historico:
+                if self._historico is None:
+                    historico = self._novo_historico()
+                    for colunas in self.armazenamento.carregar_historico():
+                        historico.anexar_colunas(colunas)
+                    historico = self._ligar_arquivo(historico)
+                    historico.efetivar()
+                    self._historico = historico
+        return self._historico
+    
+    def _novo_historico(self) -> HistoricoColunar:
+        """Log vazio no diretório de segmentos, ligado ao arquivo do histórico"""
+        return HistoricoColunar(self._diretorio_historico, self.arquivo)
+    
+    def _ligar_arquivo(self, historico: HistoricoColunar) -> HistoricoColunar:
+        """Prepara um log carregado (banco ou snapshot) para o arquivo do histórico.
+        
+        Registros anteriores ao último corte já estão no arquivo (compactação
+        interrompida antes de chegar ao banco, snapshot anterior ao corte) e
+        saem do log; os SKUs arquivados da janela da previsão ganham código.
+        O log recortado fica no diretório provisório até ser efetivado.
+        """
+        if self.arquivo is None:
+            return historico
+        corte = self.arquivo.corte
+        if corte is not None:
+            arquivados, historico = historico.recortar(corte)
+            if arquivados is not None:
+                self.armazenamento.compactar_historico(formatar_epoca(np.array([corte]))[0])
+        historico.registrar_arquivados(self._dia_atual() - JANELA_PREVISAO)
+        return historico
+    
+    def _nova_versao(self, cadastro: bool = False):
+        """Avança a versão do estado (chamar logo após cada mutação).
+        
+        ``cadastro`` indica que o conjunto de itens ou seus textos mudaram;
+        movimentações de quantidade não invalidam o que depende só disso.
+        """
+        with self._trava_versao:
+            self.versao += 1
+            if cadastro:
+                self.versao_cadastro = self.versao
+    
+    def _carregar_itens_armazenados(self):
+        """Carrega os itens do armazenamento em lotes de colunas"""
+        for codigos, colunas in self.armazenamento.carregar_itens():
+            if isinstance(self.estoque, EstoqueColunar):
+                self.estoque.anexar_lote(codigos, colunas)
+            else:
+                for i, codigo in enumerate(codigos):
+                    self.estoque[codigo] = {campo: colunas[campo][i] for campo in colunas}
+    
+    def hash_senha(self, senha: str) -> str:
+        """Hash de senha para segurança"""
+        return hashlib.sha256(senha.encode()).hexdigest()
+    
+    def inicializar_estoque(self):
+        """Inicializa estoque com dados de exemplo baseados na planilha"""
+        dados_exemplo = [
+            {"codigo": "001", "descricao": "ABRAÇADEIRA TIPO D 1/2", "unidade": "PÇ", 
+             "quantidade": 50, "minimo": 10, "maximo": 100, "localizacao": "A-01", 
+             "fornecedor": "Fornecedor A", "valor_unitario": 2.50},
+            
+            {"codigo": "002", "descricao": "ABRAÇADEIRA TIPO D 3/4", "unidade": "PÇ", 
+             "quantidade": 30, "minimo": 15, "maximo": 80, "localizacao": "A-02", 
+             "fornecedor": "Fornecedor A", "valor_unitario": 3.00},
+            
+            {"codigo": "003", "descricao": "ABRAÇADEIRA TIPO D 1", "unidade": "PÇ", 
+             "quantidade": 5, "minimo": 20, "maximo": 60, "localizacao": "A-03", 
+             "fornecedor": "Fornecedor A", "valor_unitario": 3.50},
+            
+            {"codigo": "004", "descricao": "ABRAÇADEIRA TIPO D 2", "unidade": "PÇ", 
+             "quantidade": 25, "minimo": 10, "maximo": 50, "localizacao": "A-04", 
+             "fornecedor": "Fornecedor B", "valor_unitario": 4.50},
+            
+            {"codigo": "005", "descricao": "ABRAÇADEIRA TIPO U 1/2", "unidade": "PÇ", 
+             "quantidade": 100, "minimo": 30, "maximo": 200, "localizacao": "B-01", 
+             "fornecedor": "Fornecedor B", "valor_unitario": 1.80},
+            
+            {"codigo": "006", "descricao": "ABRAÇADEIRA TIPO U 3/4", "unidade": "PÇ", 
+             "quantidade": 75, "minimo": 25, "maximo": 150, "localizacao": "B-02", 
+             "fornecedor": "Fornecedor C", "valor_unitario": 2.20},
+            
+            {"codigo": "007", "descricao": "PARAFUSO SEXTAVADO 1/2 x 2", "unidade": "PÇ", 
+             "quantidade": 200, "minimo": 50, "maximo": 300, "localizacao": "C-01", 
+             "fornecedor": "Fornecedor C", "valor_unitario": 0.50},
+            
+            {"codigo": "008", "descricao": "PORCA SEXTAVADA 1/2", "unidade": "PÇ", 
+             "quantidade": 150, "minimo": 50, "maximo": 250, "localizacao": "C-02", 
+             "fornecedor": "Fornecedor D", "valor_unitario": 0.30},
+            
+            {"codigo": "009", "descricao": "ARRUELA LISA 1/2", "unidade": "PÇ", 
+             "quantidade": 180, "minimo": 100, "maximo": 300, "localizacao": "C-03", 
+             "fornecedor": "Fornecedor D", "valor_unitario": 0.15},
+            
+            {"codigo": "010", "descricao": "BUCHA DE REDUÇÃO 1 x 3/4", "unidade": "PÇ", 
+             "quantidade": 8, "minimo": 20, "maximo": 60, "localizacao": "D-01", 
+             "fornecedor": "Fornecedor E", "valor_unitario": 5.00}
+        ]
+        
+        for item in dados_exemplo:
+            self.estoque[item["codigo"]] = {
+                "descricao": item["descricao"],
+                "unidade": item["unidade"],
+                "quantidade": item["quantidade"],
+                "minimo": item["minimo"],
+                "maximo": item["maximo"],
+                "localizacao": item["localizacao"],
+                "fornecedor": item["fornecedor"],
+                "valor_unitario": item["valor_unitario"],
+                "ultima_atualizacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+    
+    def autenticar_usuario(self, usuario: str, senha: str) -> bool:
+        """Autentica usuário"""
+        if usuario in self.usuarios:
+            return self.usuarios[usuario]["senha"] == self.hash_senha(senha)
+        return False
+    
+    def adicionar_item(self, codigo: str, descricao: str, unidade: str, 
+                      quantidade: int, minimo: int, maximo: int, 
+                      localizacao: str, fornecedor: str, valor_unitario: float,
+                      usuario: str = USUARIO_SISTEMA) -> bool:
+        """Adiciona novo item ao estoque"""
+        # Cadastro altera a estrutura das colunas: exige todas as listras
+        with self._travas.todas():
+            if codigo in self.estoque:
+                return False
+            
+            self.estoque[codigo] = {
+                "descricao": descricao,
+                "unidade": unidade,
+                "quantidade": quantidade,
+                "minimo": minimo,
+                "maximo": maximo,
+                "localizacao": localizacao,
+                "fornecedor": fornecedor,
+                "valor_unitario": valor_unitario,
+                "ultima_atualizacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            with self._trava_derivados:
+                self.agregados.adicionar(EstadoItem(quantidade, minimo, maximo, valor_unitario))
+                self.indice_alertas.atualizar(codigo, quantidade, minimo, maximo)
+                self.indice_valor.atualizar(codigo, self.estoque[codigo])
+                self.indice_busca.adicionar(codigo, descricao)
+            self._nova_versao(cadastro=True)
+            self.armazenamento.salvar_item(codigo, self.estoque[codigo])
+            self.alteracoes.marcar_item(codigo)
+            # Ainda sob as travas: o cadastro entra no histórico antes de qualquer movimentação do SKU
+            self.registrar_historico("CADASTRO", codigo, descricao, quantidade, 
+                                   usuario, delta=quantidade)
+            self._avisar_monitor([codigo])
+        return True
+    
+    def importar_catalogo(self, blocos: Iterable["pd.DataFrame"], modo: str = "inserir",
+                          usuario: str = USUARIO_SISTEMA) -> Dict:
+        """Cadastra itens em lote a partir de blocos do catálogo (ver ``ler_blocos``).
+        
+        Cada bloco é validado com as regras do formulário de cadastro e aplicado
+        de uma vez. No modo "inserir" códigos existentes são recusados; no modo
+        "atualizar" (upsert) eles têm todos os campos substituídos. Códigos
+        repetidos no arquivo valem apenas na primeira ocorrência.
+        """
+        if modo not in ("inserir", "atualizar"):
+            raise ValueError(f"Modo de importação desconhecido: {modo}")
+        import pandas as pd
+        from importacao_catalogo import validar_bloco
+        
+        resumo = {"inseridos": 0, "atualizados": 0, "recusados": 0}
+        recusas = []
+        vistos = set()
+        reconstruir_busca = False
+        
+        for bloco in blocos:
+            itens, motivo = validar_bloco(bloco)
+            codigos = itens["codigo"]
+            repetido = (codigos.duplicated() | codigos.isin(vistos)).to_numpy()
+            motivo[(motivo == "") & repetido] = "Código duplicado no arquivo"
+            vistos.update(codigos[motivo == ""].tolist())
+            agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            itens["ultima_atualizacao"] = agora
+            
+            # Cadastro altera a estrutura das colunas: exige todas as listras
+            with self._travas.todas():
+                if isinstance(self.estoque, EstoqueColunar):
+                    existe = self.estoque.linhas(codigos.tolist()) >= 0
+                else:
+                    existe = np.array([codigo in self.estoque for codigo in codigos.tolist()], dtype=bool)
+                if modo == "inserir":
+                    motivo[(motivo == "") & existe] = "Código já existe"
+                validos = motivo == ""
+                novos = itens[validos & ~existe]
+                alterados = itens[validos & existe]
+                anteriores = self._gravar_itens_importados(novos, alterados)
+                reconstruir_busca |= self._atualizar_derivados_importados(
+                    novos, alterados, anteriores, reconstruir_busca)
+                self._nova_versao(cadastro=True)
+                
+                gravados = pd.concat([novos, alterados])
+                colunas = {campo: gravados[campo].tolist() for campo in COLUNAS_ITEM}
+                self.armazenamento.salvar_itens_lote(colunas.pop("codigo"), colunas)
+                self.alteracoes.marcar_itens(gravados["codigo"].tolist())
+                self._avisar_monitor(gravados["codigo"].tolist())
+            
+            delta_alterados = alterados["quantidade"].to_numpy() - anteriores["quantidade"]
+            if len(gravados):
+                self.registrar_historico_lote({
+                    "data": [agora] * len(gravados),
+                    "tipo": ["CADASTRO"] * len(novos) + ["ATUALIZAÇÃO"] * len(alterados),
+                    "codigo": gravados["codigo"].tolist(),
+                    "descricao": novos["descricao"].tolist()
+                                 + ["Importação de catálogo"] * len(alterados),
+                    "quantidade": gravados["quantidade"].tolist(),
+                    "usuario": [usuario] * len(gravados),
+                    "delta": novos["quantidade"].tolist() + delta_alterados.tolist(),
+                })
+            
+            resumo["inseridos"] += len(novos)
+            resumo["atualizados"] += len(alterados)
+            resumo["recusados"] += int(np.count_nonzero(~validos))
+            if sum(len(r) for r in recusas) < LIMITE_RECUSAS:
+                recusas.append(pd.DataFrame({"Linha": itens.index[~validos],
+                                             "Código": codigos[~validos].to_numpy(),
+                                             "Motivo": motivo[~validos]}))
+        
+        if reconstruir_busca:
+            with self._travas.todas(), self._trava_derivados:
+                self._reconstruir_indice_busca()
+            self._nova_versao()
+        
+        resumo["recusas"] = (pd.concat(recusas, ignore_index=True).head(LIMITE_RECUSAS) if recusas
+                             else pd.DataFrame(columns=["Linha", "Código", "Motivo"]))
+        return resumo
+    
+    def _gravar_itens_importados(self, novos: "pd.DataFrame",
+                                 alterados: "pd.DataFrame") -> Dict[str, np.ndarray]:
+        """Grava itens em lote (colunas de ``COLUNAS_ITEM``) e retorna os valores anteriores dos alterados"""
+        campos = ("quantidade", "minimo", "maximo", "valor_unitario", "descricao")
+        if isinstance(self.estoque, EstoqueColunar):
+            linhas = self.estoque.linhas(alterados["codigo"].tolist())
+            anteriores = {campo: self.estoque.coluna(campo)[linhas].copy() for campo in campos[:4]}
+            anteriores["descricao"] = [self.estoque.textos("descricao")[l] for l in linhas.tolist()]
+            for campo in COLUNAS_ITEM[1:]:
+                self.estoque.atribuir(campo, linhas, alterados[campo].to_numpy())
+            
+            colunas = {campo: novos[campo].tolist() for campo in COLUNAS_ITEM[1:]}
+            self.estoque.anexar_lote(novos["codigo"].tolist(), colunas)
+        else:
+            registros = alterados.to_dict("records")
+            anteriores = {campo: np.array([self.estoque[r["codigo"]][campo] for r in registros])
+                          for campo in campos[:4]}
+            anteriores["descricao"] = [self.estoque[r["codigo"]]["descricao"] for r in registros]
+            for registro in registros + novos.to_dict("records"):
+                self.estoque[registro.pop("codigo")] = registro
+        return anteriores
+    
+    def _atualizar_derivados_importados(self, novos: "pd.DataFrame", alterados: "pd.DataFrame",
+                                        anteriores: Dict, adiar_busca: bool) -> bool:
+        """Ajusta agregados e índices após um bloco importado.
+        
+        Retorna True se o índice de busca ficou para ser reconstruído ao final.
+        """
+        import pandas as pd
+        
+        colunas = ("quantidade", "minimo", "maximo", "valor_unitario")
+        desc_alteradas = alterados[alterados["descricao"].to_numpy()
+                                   != np.array(anteriores["descricao"], dtype=object)]
+        adiar_busca = adiar_busca or len(novos) + len(desc_alteradas) > LIMITE_BUSCA_INCREMENTAL
+        with self._trava_derivados:
+            self.agregados.aplicar_colunas(*(novos[c].to_numpy() for c in colunas))
+            self.agregados.aplicar_colunas(*(anteriores[c] for c in colunas), sinal=-1)
+            self.agregados.aplicar_colunas(*(alterados[c].to_numpy() for c in colunas))
+            # Itens novos fora de alerta não entram no índice
+            novos_alerta = novos[(novos["quantidade"] == 0)
+                                 | (novos["quantidade"] < novos["minimo"] * 1.2)
+                                 | (novos["quantidade"] > novos["maximo"])]
+            for itens in (novos_alerta, alterados):
+                for codigo, qtd, minimo, maximo in zip(itens["codigo"].tolist(),
+                                                       itens["quantidade"].tolist(),
+                                                       itens["minimo"].tolist(),
+                                                       itens["maximo"].tolist()):
+                    self.indice_alertas.atualizar(codigo, qtd, minimo, maximo)
+            if len(novos) + len(alterados) > LIMITE_BUSCA_INCREMENTAL:
+                self.indice_valor.reconstruir(self.estoque)
+            else:
+                for codigo in pd.concat([novos["codigo"], alterados["codigo"]]).tolist():
+                    self.indice_valor.atualizar(codigo, self.estoque[codigo])
+            if not adiar_busca:
+                for codigo, descricao in zip(pd.concat([novos["codigo"], desc_alteradas["codigo"]]).tolist(),
+                                             pd.concat([novos["descricao"], desc_alteradas["descricao"]]).tolist()):
+                    self.indice_busca.adicionar(codigo, descricao)
+        return adiar_busca
+    
+    def atualizar_item(self, codigo: str, campo: str, valor, usuario: str = USUARIO_SISTEMA) -> bool:
+        """Atualiza campo específico de um item"""
+        if codigo not in self.estoque:
+            return False
+        
+        with self._travas.trava(codigo):
+            item = self.estoque[codigo]
+            estado_anterior = EstadoItem.de_item(item)
+            valor_anterior = item.get(campo)
+            item[campo] = valor
+            item["ultima_atualizacao"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            estado_atual = EstadoItem.de_item(item)
+            with self._trava_derivados:
+                self.agregados.atualizar(estado_anterior, estado_atual)
+                if campo in ("quantidade", "minimo", "maximo"):
+                    self.indice_alertas.atualizar(codigo, estado_atual.quantidade,
+                                                  estado_atual.minimo, estado_atual.maximo)
+                if campo in ("quantidade", "valor_unitario") + GRUPOS_VALOR:
+                    self.indice_valor.atualizar(codigo, item)
+                elif campo == "descricao":
+                    self.indice_busca.atualizar(codigo, valor)
+            self._nova_versao(cadastro=True)
+            self.armazenamento.salvar_item(codigo, item)
+            self.alteracoes.marcar_item(codigo)
+            # Sob a trava do item, como em movimentar: os registros do SKU seguem a ordem das mudanças
+            self.registrar_historico("ATUALIZAÇÃO", codigo, 
+                                   f"{campo}: {valor_anterior} → {valor}", 
+                                   estado_atual.quantidade, 
+                                   usuario,
+                                   delta=estado_atual.quantidade - estado_anterior.quantidade,
+                                   campo=campo, valor_anterior=valor_numerico(valor_anterior),
+                                   valor_novo=valor_numerico(valor))
+            self._avisar_monitor([codigo])
+        return True
+    
+    def entrada_estoque(self, codigo: str, quantidade: int, observacao: str = "",
+                        usuario: str = USUARIO_SISTEMA) -> bool:
+        """Registra entrada no estoque"""
+        if quantidade <= 0:
+            return False
+        return self.movimentar(codigo, quantidade, observacao, usuario) is not None
+    
+    def saida_estoque(self, codigo: str, quantidade: int, observacao: str = "",
+                      usuario: str = USUARIO_SISTEMA) -> bool:
+        """Registra saída do estoque (recusada se o saldo atual não cobre a quantidade)"""
+        if quantidade <= 0:
+            return False
+        return self.movimentar(codigo, -quantidade, observacao, usuario) is not None
+    
+    def movimentar(self, codigo: str, delta: int, observacao: str = "",
+                   usuario: str = USUARIO_SISTEMA) -> Optional[int]:
+        """Entrada (delta > 0) ou saída (delta < 0) atômica; retorna o novo saldo (None se recusada).
+        
+        Conferência do saldo, baixa e registro no histórico acontecem sob a
+        trava do item: saídas concorrentes nunca deixam o saldo negativo e os
+        registros de cada SKU seguem a ordem em que o saldo mudou.
+        """
+        if codigo not in self.estoque or delta == 0:
+            return None
+        
+        with self._travas.trava(codigo):
+            if self.estoque[codigo]["quantidade"] + delta < 0:
+                return None
+            saldo = self._movimentar(codigo, delta)
+            self.registrar_historico("ENTRADA" if delta > 0 else "SAÍDA", codigo, observacao, saldo,
+                                     usuario, delta=delta)
+        return saldo
+    
+    def _movimentar(self, codigo: str, delta: int) -> int:
+        """Aplica a variação de quantidade e ajusta os derivados (chamar com a trava do item)"""
+        item = self.estoque[codigo]
+        estado_anterior = EstadoItem.de_item(item)
+        saldo = estado_anterior.quantidade + delta
+        item["quantidade"] = saldo
+        agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        item["ultima_atualizacao"] = agora
+        with self._trava_derivados:
+            self.agregados.atualizar(estado_anterior, estado_anterior._replace(quantidade=saldo))
+            self.indice_alertas.atualizar(codigo, saldo, estado_anterior.minimo,
+                                          estado_anterior.maximo)
+            self.indice_valor.atualizar(codigo, item)
+        self._nova_versao()
+        self.armazenamento.salvar_quantidade(codigo, saldo, agora)
+        self.alteracoes.marcar_item(codigo)
+        self._avisar_monitor([codigo])
+        return saldo
+    
+    def movimentar_lote(self, movimentos: "pd.DataFrame", usuario: str = USUARIO_SISTEMA) -> "pd.DataFrame":
+        """Aplica um lote de entradas e saídas numa única operação.
+        
+        ``movimentos`` tem as colunas codigo, tipo, quantidade e, opcionalmente,
+        observacao (o formato de ``ler_movimentos``). As linhas são validadas de
+        forma vetorizada, na ordem em que aparecem, e o histórico recebe um único
+        acréscimo. Retorna uma linha por movimento com aceite, motivo da recusa
+        e saldo do item após a linha.
+        """
+        import pandas as pd
+        from movimentacao_lote import aplicar_saldos, normalizar_tipos
+        
+        n = len(movimentos)
+        codigos = movimentos["codigo"].astype(str).str.strip().to_numpy()
+        tipos = normalizar_tipos(movimentos["tipo"]).to_numpy()
+        qtd_bruta = pd.to_numeric(movimentos["quantidade"], errors="coerce")
+        observacoes = (movimentos["observacao"].fillna("").astype(str).to_numpy()
+                       if "observacao" in movimentos else np.full(n, "", dtype=object))
+        
+        qtd_valida = (qtd_bruta.notna() & (qtd_bruta > 0) & (qtd_bruta % 1 == 0)).to_numpy()
+        quantidades = np.where(qtd_valida, qtd_bruta.fillna(0), 0).astype(np.int64)
+        deltas = np.where(tipos == "SAÍDA", -quantidades, quantidades)
+        grupos, unicos = pd.factorize(codigos)
+        unicos = unicos.tolist()
+        
+        motivo = np.full(n, "", dtype=object)
+        motivo[~qtd_valida] = "Quantidade inválida"
+        motivo[pd.isna(tipos)] = "Tipo inválido"
+        aceito = np.zeros(n, dtype=bool)
+        saldo = np.zeros(n, dtype=np.int64)
+        agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        colunar = isinstance(self.estoque, EstoqueColunar)
+        
+        with self._travas.varias(unicos):
+            # Saldo de cada item lido sob as travas: a validação enxerga o estado atual
+            if colunar:
+                linhas = self.estoque.linhas(unicos)
+                existe = linhas >= 0
+                saldo_inicial = np.zeros(len(unicos), dtype=np.int64)
+                saldo_inicial[existe] = self.estoque.coluna("quantidade")[linhas[existe]]
+            else:
+                existe = np.array([codigo in self.estoque for codigo in unicos], dtype=bool)
+                saldo_inicial = np.array([self.estoque[codigo]["quantidade"] if e else 0
+                                          for codigo, e in zip(unicos, existe)], dtype=np.int64)
+            motivo[~existe[grupos]] = "Código inexistente"
+            
+            validas = np.flatnonzero(motivo == "")
+            aceito_validas, saldo[validas] = aplicar_saldos(
+                grupos[validas], deltas[validas], saldo_inicial[grupos[validas]])
+            aceito[validas] = aceito_validas
+            motivo[validas[~aceito_validas]] = "Saldo insuficiente"
+            
+            total = np.zeros(len(unicos), dtype=np.int64)
+            np.add.at(total, grupos[aceito], deltas[aceito])
+            tocados = np.unique(grupos[aceito])
+            antes = saldo_inicial[tocados]
+            depois = antes + total[tocados]
+            if colunar:
+                linhas_tocadas = linhas[tocados]
+                self.estoque.somar("quantidade", linhas_tocadas, total[tocados])
+                self.estoque.preencher("ultima_atualizacao", linhas_tocadas, agora)
+                limites = {campo: self.estoque.coluna(campo)[linhas_tocadas]
+                           for campo in ("minimo", "maximo", "valor_unitario")}
+            else:
+                itens = [self.estoque[unicos[i]] for i in tocados.tolist()]
+                for item, qtd in zip(itens, depois.tolist()):
+                    item["quantidade"] = qtd
+                    item["ultima_atualizacao"] = agora
+                limites = {campo: np.array([item[campo] for item in itens])
+                           for campo in ("minimo", "maximo", "valor_unitario")}
+            
+            codigos_tocados = [unicos[i] for i in tocados.tolist()]
+            with self._trava_derivados:
+                self.agregados.atualizar_quantidades(antes, depois, limites["minimo"],
+                                                     limites["maximo"], limites["valor_unitario"])
+                for codigo, qtd, minimo, maximo in zip(codigos_tocados, depois.tolist(),
+                                                       limites["minimo"].tolist(),
+                                                       limites["maximo"].tolist()):
+                    self.indice_alertas.atualizar(codigo, qtd, minimo, maximo)
+                if len(codigos_tocados) > LIMITE_BUSCA_INCREMENTAL:
+                    self.indice_valor.reconstruir(self.estoque)
+                else:
+                    for codigo in codigos_tocados:
+                        self.indice_valor.atualizar(codigo, self.estoque[codigo])
+            self._nova_versao()
+            self.armazenamento.salvar_quantidades(codigos_tocados, depois.tolist(), agora)
+            self.alteracoes.marcar_itens(codigos_tocados)
+            self._avisar_monitor(codigos_tocados)
+        
+        selecionadas = np.flatnonzero(aceito)
+        if len(selecionadas):
+            self.registrar_historico_lote({
+                "data": [agora] * len(selecionadas),
+                "tipo": tipos[selecionadas].tolist(),
+                "codigo": codigos[selecionadas].tolist(),
+                "descricao": observacoes[selecionadas].tolist(),
+                "quantidade": saldo[selecionadas].tolist(),
+                "usuario": [usuario] * len(selecionadas),
+                "delta": deltas[selecionadas].tolist(),
+            })
+        
+        return pd.DataFrame({
+            "Linha": np.arange(1, n + 1),
+            "Código": codigos,
+            "Tipo": np.where(pd.isna(tipos), movimentos["tipo"].astype(str).to_numpy(), tipos),
+            "Quantidade": pd.arrays.IntegerArray(quantidades, ~qtd_valida),
+            "Aceito": aceito,
+            "Motivo": motivo,
+            "Saldo": pd.arrays.IntegerArray(saldo, ~(aceito | (motivo == "Saldo insuficiente")))
+        })
+    
+    def registrar_historico(self, tipo: str, codigo: str, descricao: str, 
+                          quantidade: int, usuario: str, delta: int = 0, campo: str = "",
+                          valor_anterior: Optional[float] = None,
+                          valor_novo: Optional[float] = None):
+        """Registra operação no histórico.
+        
+        ``quantidade`` é o saldo após a operação e ``delta`` a variação com sinal;
+        ``descricao`` é a descrição do item no cadastro e a observação nas
+        movimentações. Atualizações informam o ``campo`` e, se ele for
+        numérico, os valores anterior e novo.
+        """
+        data = datetime.now().replace(microsecond=0)
+        registro = {
+            "data": data.strftime("%Y-%m-%d %H:%M:%S"),
+            "tipo": tipo,
+            "codigo": codigo,
+            "descricao": descricao,
+            "quantidade": quantidade,
+            "usuario": usuario,
+            "delta": delta,
+            "campo": campo,
+            "valor_anterior": valor_anterior,
+            "valor_novo": valor_novo
+        }
+        # Mesma trava da carga sob demanda: o registro não se perde nem duplica
+        with self._trava_historico:
+            if self._historico is not None:
+                self._historico.anexar(data, tipo, codigo, descricao, quantidade, usuario, delta,
+                                       campo, valor_anterior, valor_novo)
+            self._nova_versao()
+            self.armazenamento.registrar_historico(registro)
+    
+    def registrar_historico_lote(self, colunas: Dict[str, List]):
+        """Registra várias operações no histórico num único acréscimo (listas por campo).
+        
+        Os campos opcionais do registro (ver ``PADROES_REGISTRO``) podem faltar.
+        """
+        colunas = completar_colunas(colunas, len(colunas["codigo"]))
+        with self._trava_historico:
+            if self._historico is not None:
+                self._historico.anexar_colunas(colunas)
+            self._nova_versao()
+            self.armazenamento.registrar_historico_lote(colunas)
+    
+    def adicionar_usuario(self, usuario: str, senha: str, tipo: str) -> bool:
+        """Cadastra um novo usuário"""
+        if usuario in self.usuarios:
+            return False
+        self.usuarios[usuario] = {"senha": self.hash_senha(senha), "tipo": tipo}
+        self._nova_versao()
+        self.armazenamento.salvar_usuario(usuario, self.usuarios[usuario])
+        self.alteracoes.marcar_usuario(usuario)
+        return True
+    
+    def remover_usuario(self, usuario: str):
+        """Remove um usuário"""
+        if self.usuarios.pop(usuario, None) is not None:
+            self._nova_versao()
+            self.armazenamento.remover_usuario(usuario)
+            self.alteracoes.marcar_usuario(usuario)
+    
+    def obter_alertas(self) -> Dict[str, List]:
+        """Retorna alertas de estoque a partir do índice de alertas (memorizado; não alterar)"""
+        return self.cache.obter("alertas", self.versao, self._calcular_alertas)
+    
+    def _calcular_alertas(self) -> Dict[str, List]:
+        alertas = {}
+        for status in ("critico", "baixo", "reposicao", "excesso"):
+            limite = "maximo" if status == "excesso" else "minimo"
+            alertas[status] = [self._registro_alerta(codigo, limite)
+                               for codigo in self.indice_alertas.itens(status)]
+        return alertas
+    
+    def contagem_status(self) -> Dict[str, int]:
+        """Itens por status do relatório (coluna "Status") a partir dos baldes do índice de alertas.
+        
+        Itens em reposição contam como normais, como no relatório.
+        """
+        contagens = {status: self.indice_alertas.contagem(status) for status in ("critico", "baixo", "excesso")}
+        return {STATUS_ITEM[0]: len(self.estoque) - sum(contagens.values()),
+                STATUS_ITEM[1]: contagens["baixo"],
+                STATUS_ITEM[2]: contagens["critico"],
+                STATUS_ITEM[3]: contagens["excesso"]}
+    
+    def itens_mais_urgentes(self, n: int = 10) -> List[Dict]:
+        """Retorna os n itens em alerta com menor razão quantidade/mínimo (memorizado)"""
+        return self.cache.obter(("urgentes", n), self.versao, lambda: self._calcular_urgentes(n))
+    
+    def _calcular_urgentes(self, n: int) -> List[Dict]:
+        # A consulta ao heap o reorganiza; serializa com as atualizações do índice
+        with self._trava_derivados:
+            codigos = self.indice_alertas.mais_urgentes(n)
+        return [self._registro_alerta(codigo, "minimo") for codigo in codigos]
+    
+    def maiores_valores(self, n: int = 10, campo: Optional[str] = None,
+                        valor: Optional[str] = None) -> List[Dict]:
+        """Os n itens de maior valor em estoque, no catálogo ou num fornecedor/localização.
+        
+        Sai do ranking mantido pelas movimentações, sem percorrer o catálogo
+        (memorizado por versão do estado).
+        """
+        if campo is not None and campo not in GRUPOS_VALOR:
+            raise ValueError(f"Campo sem ranking de valor: {campo}")
+        return self.cache.obter(("maiores_valores", n, campo, valor), self.versao,
+                                lambda: self._calcular_maiores_valores(n, campo, valor))
+    
+    def _calcular_maiores_valores(self, n: int, campo: Optional[str],
+                                  valor: Optional[str]) -> List[Dict]:
+        # A consulta reorganiza os heaps; serializa com as atualizações do índice
+        with self._trava_derivados:
+            maiores = self.indice_valor.maiores(n, campo, valor)
+        return [{"codigo": codigo, "descricao": self.estoque[codigo]["descricao"],
+                 "valor_total": valor_total} for codigo, valor_total in maiores]
+    
+    def _registro_alerta(self, codigo: str, limite: str) -> Dict:
+        item = self.estoque[codigo]
+        return {
+            "codigo": codigo,
+            "descricao": item["descricao"],
+            "quantidade": item["quantidade"],
+            limite: item[limite]
+        }
+    
+    def gerar_relatorio(self, codigos: Optional[List[str]] = None) -> "pd.DataFrame":
+        """Gera relatório do estoque (completo ou dos códigos informados) com colunas tipadas.
+        
+        Valores ficam em float64 e textos repetitivos (unidade, localização,
+        fornecedor, status) como categorias; a formatação em R$ é feita apenas
+        na exibição. O relatório completo é memorizado por versão do estado e
+        compartilhado entre sessões: quem o recebe não deve alterá-lo.
+        """
+        if codigos is None:
+            return self.cache.obter("relatorio", self.versao, self._montar_relatorio)
+        return self._montar_relatorio(codigos)
+    
+    def _montar_relatorio(self, codigos: Optional[List[str]] = None) -> "pd.DataFrame":
+        import pandas as pd
+        
+        if isinstance(self.estoque, EstoqueColunar) and codigos is None:
+            codigos = list(self.estoque.codigos())
+            qtd = self.estoque.coluna("quantidade").copy()
+            minimo = self.estoque.coluna("minimo").copy()
+            maximo = self.estoque.coluna("maximo").copy()
+            valor_unit = self.estoque.coluna("valor_unitario").copy()
+            textos = {campo: list(self.estoque.textos(campo)) for campo in
+                      ("descricao", "unidade", "localizacao", "fornecedor", "ultima_atualizacao")}
+        elif isinstance(self.estoque, EstoqueColunar):
+            linhas = self.estoque.linhas(codigos)
+            linhas = linhas[linhas >= 0]
+            codigos = [self.estoque.codigos()[linha] for linha in linhas.tolist()]
+            qtd = self.estoque.coluna("quantidade")[linhas]
+            minimo = self.estoque.coluna("minimo")[linhas]
+            maximo = self.estoque.coluna("maximo")[linhas]
+            valor_unit = self.estoque.coluna("valor_unitario")[linhas]
+            textos = {campo: [self.estoque.textos(campo)[linha] for linha in linhas.tolist()]
+                      for campo in ("descricao", "unidade", "localizacao", "fornecedor",
+                                    "ultima_atualizacao")}
+        else:
+            if codigos is None:
+                codigos = list(self.estoque.keys())
+            codigos = [codigo for codigo in codigos if codigo in self.estoque]
+            itens = [self.estoque[codigo] for codigo in codigos]
+            qtd = np.array([item["quantidade"] for item in itens], dtype=np.int64)
+            minimo = np.array([item["minimo"] for item in itens], dtype=np.int64)
+            maximo = np.array([item["maximo"] for item in itens], dtype=np.int64)
+            valor_unit = np.array([item["valor_unitario"] for item in itens], dtype=np.float64)
+            textos = {campo: [item[campo] for item in itens] for campo in
+                      ("descricao", "unidade", "localizacao", "fornecedor", "ultima_atualizacao")}
+        
+        # Mesma precedência de get_status
+        status = np.select(
+            [qtd == 0, qtd < minimo, qtd > maximo],
+            [STATUS_ITEM[2], STATUS_ITEM[1], STATUS_ITEM[3]],
+            default=STATUS_ITEM[0]
+        )
+        
+        return pd.DataFrame({
+            "Código": codigos,
+            "Descrição": textos["descricao"],
+            "Unidade": pd.Categorical(textos["unidade"]),
+            "Quantidade": qtd,
+            "Mínimo": minimo,
+            "Máximo": maximo,
+            "Localização": pd.Categorical(textos["localizacao"]),
+            "Fornecedor": pd.Categorical(textos["fornecedor"]),
+            "Valor Unit.": valor_unit,
+            "Valor Total": qtd * valor_unit,
+            "Status": pd.Categorical(status, categories=STATUS_ITEM),
+            "Última Atualização": textos["ultima_atualizacao"]
+        })
+    
+    def blocos_relatorio(self, codigos: Optional[List[str]] = None,
+                         tamanho_bloco: int = TAMANHO_BLOCO_EXPORTACAO) -> Iterator["pd.DataFrame"]:
+        """Relatório em blocos de linhas, montados do estoque sob demanda (exportação)"""
+        if codigos is None:
+            codigos = list(self.estoque.keys())
+        for inicio in range(0, max(len(codigos), 1), tamanho_bloco):
+            yield self._montar_relatorio(codigos[inicio:inicio + tamanho_bloco])
+    
+    def consultar_estoque(self, busca: str = "", fornecedor: Optional[str] = None,
+                          status: Optional[str] = None, localizacao: Optional[str] = None,
+                          classe_abc: Optional[str] = None,
+                          classe_xyz: Optional[str] = None) -> Dict:
+        """Filtra o estoque direto das colunas (base da tabela paginada do Estoque).
+        
+        Retorna as linhas do estoque que passam nos filtros (na ordem de
+        relevância quando há busca), o total e o valor total filtrado; nenhuma
+        linha do relatório é montada aqui. As páginas saem de ``pagina_estoque``.
+        """
+        colunas = self._colunas_consulta()
+        n = len(colunas["quantidade"])
+        if busca:
+            linhas = self._linhas_codigos(self.buscar_codigos(busca))
+            linhas = linhas[(linhas >= 0) & (linhas < n)]
+        else:
+            linhas = np.arange(n)
+        for campo, valor in (("fornecedor", fornecedor), ("localizacao", localizacao)):
+            if valor is not None:
+                codigos, valores = self._codigos_texto(campo)
+                linhas = linhas[codigos[linhas] == valores.get_indexer([valor])[0]]
+        if status is not None:
+            linhas = linhas[self._codigos_status(colunas, linhas) == STATUS_ITEM.index(status)]
+        for campo, valor, classes in (("abc", classe_abc, CLASSES_ABC),
+                                      ("xyz", classe_xyz, CLASSES_XYZ)):
+            if valor is not None:
+                linhas = linhas[self.classificar_itens()[campo][linhas] == classes.index(valor)]
+        return {
+            "linhas": linhas,
+            "total": len(linhas),
+            "valor_total": float(np.dot(colunas["quantidade"][linhas], colunas["valor_unitario"][linhas])),
+        }
+    
+    def pagina_estoque(self, consulta: Dict, ordem: Optional[str] = None, decrescente: bool = False,
+                       deslocamento: int = 0, limite: int = 50) -> "pd.DataFrame":
+        """Relatório só das linhas de uma página da consulta, ordenada por uma coluna do relatório.
+        
+        Sem ``ordem`` as linhas seguem a ordem da consulta (cadastro ou relevância).
+        """
+        linhas = consulta["linhas"]
+        if ordem is None:
+            linhas = linhas[deslocamento:deslocamento + limite]
+        else:
+            chaves = self._chaves_ordenacao(ordem, linhas)
+            linhas = linhas[pagina_ordenada(chaves, deslocamento, limite, decrescente)]
+        return self._montar_relatorio(self.codigos_consulta({"linhas": linhas}))
+    
+    def codigos_consulta(self, consulta: Dict) -> List[str]:
+        """Códigos das linhas de uma consulta, na ordem dela (exportação)"""
+        codigos = self._textos_campo("codigo")
+        return [codigos[linha] for linha in consulta["linhas"].tolist()]
+    
+    def _colunas_consulta(self) -> Dict[str, np.ndarray]:
+        """Colunas numéricas do estoque, alinhadas às linhas usadas pelas consultas"""
+        campos = ("quantidade", "minimo", "maximo", "valor_unitario")
+        if isinstance(self.estoque, EstoqueColunar):
+            return {campo: self.estoque.coluna(campo) for campo in campos}
+        return self.cache.obter("colunas_consulta", self.versao, lambda: {
+            campo: np.array([item[campo] for item in self.estoque.values()],
+                            dtype=np.float64 if campo == "valor_unitario" else np.int64)
+            for campo in campos})
+    
+    def _textos_campo(self, campo: str) -> Sequence[str]:
+        """Valores de um campo de texto (ou do código) por linha do estoque"""
+        if isinstance(self.estoque, EstoqueColunar):
+            return self.estoque.codigos() if campo == "codigo" else self.estoque.textos(campo)
+        if campo == "codigo":
+            return list(self.estoque.keys())
+        return [item[campo] for item in self.estoque.values()]
+    
+    def _codigos_texto(self, campo: str) -> Tuple[np.ndarray, "pd.Index"]:
+        """Campo de texto codificado: posto alfabético por linha e valores distintos em ordem.
+        
+        Memorizado pela versão do cadastro: movimentações não refazem a codificação.
+        """
+        import pandas as pd
+        
+        versao = self.versao if campo == "ultima_atualizacao" else self.versao_cadastro
+        def calcular():
+            codigos, valores = pd.factorize(np.asarray(self._textos_campo(campo), dtype=object),
+                                            sort=True)
+            return codigos, pd.Index(valores)
+        return self.cache.obter(("texto", campo), versao, calcular)
+    
+    def _linhas_codigos(self, codigos: List[str]) -> np.ndarray:
+        """Linhas do estoque dos códigos informados (-1 para os inexistentes)"""
+        if isinstance(self.estoque, EstoqueColunar):
+            return self.estoque.linhas(codigos)
+        return self._codigos_texto("codigo")[1].get_indexer(codigos)
+    
+    def _codigos_status(self, colunas: Dict[str, np.ndarray], linhas: np.ndarray) -> np.ndarray:
+        """Índice em ``STATUS_ITEM`` do status de cada linha (mesma precedência de get_status)"""
+        qtd = colunas["quantidade"][linhas]
+        return np.select([qtd == 0, qtd < colunas["minimo"][linhas], qtd > colunas["maximo"][linhas]],
+                         [2, 1, 3], default=0)
+    
+    def _chaves_ordenacao(self, coluna: str, linhas: np.ndarray) -> np.ndarray:
+        """Chave numérica de ordenação das linhas por uma coluna do relatório"""
+        colunas = self._colunas_consulta()
+        if coluna in COLUNAS_NUMERICAS_RELATORIO:
+            return colunas[COLUNAS_NUMERICAS_RELATORIO[coluna]][linhas]
+        if coluna == "Valor Total":
+            return colunas["quantidade"][linhas] * colunas["valor_unitario"][linhas]
+        if coluna == "Status":
+            return self._codigos_status(colunas, linhas)
+        if coluna not in COLUNAS_TEXTO_RELATORIO:
+            raise ValueError(f"Coluna de ordenação desconhecida: {coluna}")
+        return self._codigos_texto(COLUNAS_TEXTO_RELATORIO[coluna])[0][linhas]
+    
+    def previsao_reposicao(self, modo: str = "media_movel", dias: int = 28,
+                           horizonte: int = 30) -> "pd.DataFrame":
+        """Itens que atingem o estoque mínimo em menos de ``horizonte`` dias, pelo consumo previsto.
+        
+        O consumo vem das saídas do histórico (ver ``previsao``), estimado pelo
+        modo escolhido sobre os últimos ``dias`` dias. Memorizado por versão do
+        estado e dia: quem recebe o resultado não deve alterá-lo.
+        """
+        hoje = self._dia_atual()
+        return self.cache.obter(("previsao", modo, dias, horizonte, hoje), self.versao,
+                                lambda: self._calcular_previsao(modo, dias, horizonte, hoje))
+    
+    def _dia_atual(self) -> int:
+        """Dia de hoje, em dias desde a época (mesma contagem do histórico)"""
+        return int(para_epoca(datetime.now())) // SEGUNDOS_DIA
+    
+    def _linhas_historico(self) -> np.ndarray:
+        """Código de cada linha do estoque na categoria "codigo" do histórico (-1 se ausente).
+        
+        Muda só com o cadastro ou com códigos novos no histórico.
+        """
+        historico = self.historico
+        codigos = self._textos_campo("codigo")
+        chave = ("codigos_historico", id(historico), historico.total_categoria("codigo"))
+        return self.cache.obter(chave, self.versao_cadastro,
+                                lambda: historico.codigos_categoria("codigo", codigos))
+    
+    def _calcular_previsao(self, modo: str, dias: int, horizonte: int, hoje: int) -> "pd.DataFrame":
+        import pandas as pd
+        
+        self.previsao.atualizar(self.historico, hoje)
+        consumo_hist, perfil_hist = self.previsao.estimar(modo, dias)
+        
+        codigos = self._textos_campo("codigo")
+        linhas_hist = self._linhas_historico()
+        colunas = self._colunas_consulta()
+        n = min(len(colunas["quantidade"]), len(linhas_hist))
+        linhas_hist = linhas_hist[:n]
+        com_consumo = np.flatnonzero((linhas_hist >= 0) & (linhas_hist < len(consumo_hist)))
+        consumo = np.zeros(n)
+        consumo[com_consumo] = consumo_hist[linhas_hist[com_consumo]]
+        perfil = None
+        if perfil_hist is not None:
+            perfil = np.zeros((n, 7))
+            perfil[com_consumo] = perfil_hist[linhas_hist[com_consumo]]
+        
+        qtd = colunas["quantidade"][:n]
+        minimo = colunas["minimo"][:n]
+        dias_minimo = dias_ate_minimo(np.maximum(qtd - minimo, 0), consumo, perfil,
+                                      amanha=int(dia_da_semana(hoje + 1)))
+        selecionadas = np.flatnonzero(dias_minimo < horizonte)
+        selecionadas = selecionadas[np.argsort(dias_minimo[selecionadas], kind="stable")]
+        
+        descricoes = self._textos_campo("descricao")
+        classes = self.classificar_itens()
+        previstos = dias_minimo[selecionadas]
+        datas = pd.Timestamp.now() + pd.to_timedelta(previstos, unit="D")
+        return pd.DataFrame({
+            "Código": [codigos[linha] for linha in selecionadas.tolist()],
+            "Descrição": [descricoes[linha] for linha in selecionadas.tolist()],
+            "Classe": rotulos_classes(classes["abc"][selecionadas], classes["xyz"][selecionadas]),
+            "Quantidade Atual": qtd[selecionadas],
+            "Estoque Mínimo": minimo[selecionadas],
+            "Consumo Diário Médio": np.round(consumo[selecionadas], 1),
+            "Dias até Mínimo": np.round(previstos, 0),
+            "Data Prevista": datas.strftime("%d/%m/%Y"),
+            "Qtd. Sugerida para Compra": colunas["maximo"][selecionadas] - qtd[selecionadas]
+        })
+    
+    def classificar_itens(self) -> Dict[str, np.ndarray]:
+        """Classes ABC e XYZ por linha do estoque (índices em ``CLASSES_ABC``/``CLASSES_XYZ``).
+        
+        Inclui o valor em estoque ("valor") e o coeficiente de variação do
+        consumo ("variacao", NaN sem consumo) de cada linha. Memorizado por
+        versão do estado e dia: quem recebe os arrays não deve alterá-los.
+        """
+        hoje = self._dia_atual()
+        return self.cache.obter(("classes", hoje), self.versao,
+                                lambda: self._calcular_classes(hoje))
+    
+    def _calcular_classes(self, hoje: int) -> Dict[str, np.ndarray]:
+        colunas = self._colunas_consulta()
+        valor = colunas["quantidade"] * colunas["valor_unitario"]
+        abc = self.classificacao_abc.atualizar(valor, self.versao_cadastro)
+        
+        self.previsao.atualizar(self.historico, hoje)
+        variacao_hist = self.classificacao_xyz.atualizar(self.previsao)
+        linhas_hist = self._linhas_historico()[:len(valor)]
+        variacao = np.full(len(valor), np.nan)
+        com_consumo = np.flatnonzero((linhas_hist >= 0) & (linhas_hist < len(variacao_hist)))
+        variacao[com_consumo] = variacao_hist[linhas_hist[com_consumo]]
+        return {"abc": abc, "xyz": classes_xyz(variacao), "valor": valor, "variacao": variacao}
+    
+    def resumo_classes(self) -> Dict[str, "pd.DataFrame"]:
+        """Itens e valor por classe ABC e a matriz de itens ABC × XYZ (memorizado)"""
+        import pandas as pd
+        
+        def calcular():
+            classes = self.classificar_itens()
+            abc = classes["abc"].astype(np.int64)
+            n_abc, n_xyz = len(CLASSES_ABC), len(CLASSES_XYZ)
+            matriz = np.bincount(abc * n_xyz + classes["xyz"], minlength=n_abc * n_xyz)
+            return {
+                "abc": pd.DataFrame({
+                    "Itens": np.bincount(abc, minlength=n_abc),
+                    "Valor Total": np.bincount(abc, weights=classes["valor"], minlength=n_abc),
+                }, index=pd.Index(CLASSES_ABC, name="Classe ABC")),
+                "matriz": pd.DataFrame(matriz.reshape(n_abc, n_xyz),
+                                       index=pd.Index(CLASSES_ABC, name="Classe ABC"),
+                                       columns=CLASSES_XYZ),
+            }
+        return self.cache.obter("resumo_classes", self.versao, calcular)
+    
+    def pagina_valor(self, deslocamento: int = 0, limite: int = 50) -> "pd.DataFrame":
+        """Página da curva ABC: itens em ordem decrescente de valor, com o percentual acumulado.
+        
+        Só os itens da página e os que vêm antes dela são somados; o catálogo
+        não é ordenado por inteiro.
+        """
+        import pandas as pd
+        
+        classes = self.classificar_itens()
+        valor = classes["valor"]
+        linhas = pagina_ordenada(valor, deslocamento, limite, decrescente=True)
+        anteriores = valor[pagina_ordenada(valor, 0, deslocamento, decrescente=True)].sum()
+        total = valor.sum()
+        acumulado = (anteriores + np.cumsum(valor[linhas])) / total * 100 if total else np.zeros(len(linhas))
+        codigos = self._textos_campo("codigo")
+        descricoes = self._textos_campo("descricao")
+        colunas = self._colunas_consulta()
+        return pd.DataFrame({
+            "Código": [codigos[linha] for linha in linhas.tolist()],
+            "Descrição": [descricoes[linha] for linha in linhas.tolist()],
+            "Quantidade": colunas["quantidade"][linhas],
+            "Valor Unit.": colunas["valor_unitario"][linhas],
+            "Valor Total": valor[linhas],
+            "Percentual Acumulado": np.round(acumulado, 2),
+            "Classe ABC": np.asarray(CLASSES_ABC)[classes["abc"][linhas]],
+            "Classe XYZ": np.asarray(CLASSES_XYZ)[classes["xyz"][linhas]],
+            "Variação do Consumo": np.round(classes["variacao"][linhas], 2),
+        })
+    
+    def get_status(self, qtd: int, minimo: int, maximo: int) -> str:
+        """Retorna status do item baseado na quantidade"""
+        if qtd == 0:
+            return STATUS_ITEM[2]
+        elif qtd < minimo:
+            return STATUS_ITEM[1]
+        elif qtd > maximo:
+            return STATUS_ITEM[3]
+        else:
+            return STATUS_ITEM[0]
+    
+    def valores_distintos(self, campo: str) -> List[str]:
+        """Valores distintos de um campo de texto dos itens, em ordem (filtros da barra lateral)"""
+        return self._codigos_texto(campo)[1].tolist()
+    
+    def buscar_item(self, termo: str, limite: Optional[int] = None) -> Dict:
+        """Busca item por código ou descrição (sem acentos/maiúsculas), por relevância"""
+        return {codigo: self.estoque[codigo]
+                for codigo in self.buscar_codigos(termo, limite)}
+    
+    def buscar_codigos(self, termo: str, limite: Optional[int] = None) -> List[str]:
+        """Retorna os códigos encontrados pelo índice de busca, por relevância"""
+        return self.indice_busca.buscar(termo, limite)
+    
+    def _reconstruir_indice_busca(self):
+        if isinstance(self.estoque, EstoqueColunar):
+            self.indice_busca.reconstruir(self.estoque.codigos(), self.estoque.textos("descricao"))
+        else:
+            self.indice_busca.reconstruir(list(self.estoque.keys()),
+                                          [item["descricao"] for item in self.estoque.values()])
+    
+    def calcular_valor_total(self) -> float:
+        """Calcula valor total do estoque"""
+        if isinstance(self.estoque, EstoqueColunar):
+            return float(np.dot(self.estoque.coluna("quantidade"),
+                                self.estoque.coluna("valor_unitario")))
+        
+        total = 0
+        for item in self.estoque.values():
+            total += item["quantidade"] * item["valor_unitario"]
+        return total
+    
+    def obter_estatisticas(self, verificar: bool = False) -> Dict:
+        """Retorna estatísticas do estoque a partir dos agregados incrementais"""
+        if verificar or self.modo_verificacao:
+            self.verificar_agregados()
+            return self.agregados.estatisticas()
+        return self.cache.obter("estatisticas", self.versao, self.agregados.estatisticas)
+    
+    def verificar_agregados(self) -> Dict[str, Tuple]:
+        """Confere os agregados contra um recálculo completo e ressincroniza se divergirem"""
+        # Todas as listras: o recálculo precisa de uma foto consistente do estoque
+        with self._travas.todas(), self._trava_derivados:
+            divergencias = self.agregados.comparar(self.estoque)
+            if divergencias:
+                self.agregados.recalcular(self.estoque)
+                self._nova_versao()
+        return divergencias
+    
+    def reconstruir_resumos_historico(self) -> int:
+        """Refaz os agregados por hora e por dia do histórico a partir dos registros"""
+        with self._trava_historico:
+            return self.historico.reconstruir_resumos()
+    
+    def configurar_retencao(self, dias: int, ativa: bool):
+        """Define a janela quente do histórico e liga/desliga a retenção (gravados no armazenamento)"""
+        self.dias_historico = int(dias)
+        self.retencao_ativa = bool(ativa)
+        self.armazenamento.salvar_parametro("dias_historico", self.dias_historico)
+        self.armazenamento.salvar_parametro("retencao_ativa", int(self.retencao_ativa))
+    
+    def configurar_alertas(self, ativos: Dict[str, bool]):
+        """Liga/desliga a notificação de cada status de alerta (gravado no armazenamento)"""
+        for status, ativo in ativos.items():
+            self.alertas_ativos[status] = bool(ativo)
+            self.armazenamento.salvar_parametro(f"alerta_{status}", int(bool(ativo)))
+    
+    def iniciar_monitor_alertas(self, destinos: Sequence[DestinoAlerta], **opcoes) -> MonitorAlertas:
+        """Inicia a thread que avalia os itens alterados e notifica os destinos.
+        
+        Os alertas já existentes na partida viram referência e não são
+        notificados; ``opcoes`` vai para ``MonitorAlertas`` (atraso, intervalo_repeticao).
+        """
+        self.parar_monitor_alertas()
+        monitor = MonitorAlertas(self, destinos, **opcoes)
+        monitor.iniciar()
+        self.monitor_alertas = monitor
+        return monitor
+    
+    def parar_monitor_alertas(self):
+        """Avalia as mudanças pendentes e encerra o monitor de alertas, se houver"""
+        monitor, self.monitor_alertas = self.monitor_alertas, None
+        if monitor is not None:
+            monitor.parar()
+    
+    def _avisar_monitor(self, codigos: Optional[List[str]]):
+        """Marca os SKUs alterados para o monitor de alertas (None: estoque todo substituído)"""
+        monitor = self.monitor_alertas
+        if monitor is None:
+            return
+        if codigos is None:
+            monitor.marcar_todos()
+        else:
+            monitor.marcar(codigos)
+    
+    def aplicar_retencao(self, forcar: bool = False) -> Optional[Dict]:
+        """Arquiva os registros anteriores à janela quente de ``dias_historico`` dias.
+        
+        O corte é o início do dia ``dias_historico`` dias antes de hoje. Os
+        registros anteriores vão para blocos diários compactados no arquivo,
+        junto com o saldo de cada SKU no corte, e saem do log e do banco.
+        Com a retenção desligada (e sem ``forcar``) ou nada anterior ao corte
+        não faz nada: a checagem é barata e roda a cada execução da página.
+        Retorna o corte, os registros arquivados e os blocos gravados.
+        """
+        if not (self.retencao_ativa or forcar):
+            return None
+        corte = (datetime.now() - timedelta(days=self.dias_historico)).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        corte_s = int(para_epoca(corte))
+        minima = self.historico.data_minima()
+        if minima is None or minima >= corte_s:
+            return None
+        arquivo = self._arquivo_retencao()
+        with self._travas.todas(), self._trava_derivados, self._trava_historico:
+            historico = self._historico
+            historico.arquivo = arquivo
+            arquivados, novo = historico.recortar(corte_s)
+            if arquivados is None:
+                return None
+            try:
+                codigos, saldos = self._saldos_inicio(novo)
+                blocos = arquivo.arquivar(arquivados, arquivados["descricao"], historico.categorias(),
+                                          corte_s, codigos, saldos)
+                novo.efetivar()
+            except BaseException:
+                novo.descartar()
+                raise
+            self.armazenamento.compactar_historico(formatar_epoca(np.array([corte_s]))[0])
+            posicoes = arquivados["posicao"]
+            anteriores = int(np.count_nonzero(posicoes < self.alteracoes.historico_inicio))
+            self.alteracoes.descontar_historico(anteriores, len(posicoes) - anteriores, len(novo))
+            self._historico = novo
+            self._nova_versao()
+        return {"corte": corte, "registros": len(posicoes), "blocos": blocos}
+    
+    def _arquivo_retencao(self) -> ArquivoHistorico:
+        if self.arquivo is None:
+            if self.armazenamento.persistente:
+                raise ValueError("Configure o diretório do arquivo do histórico (ESTOQUE_ARQUIVO_DIR) "
+                                 "para aplicar a retenção.")
+            # Dados só em memória: o arquivo vive o mesmo que o processo
+            self.arquivo = ArquivoHistorico(tempfile.mkdtemp(prefix="estoque_arquivo_"))
+        return self.arquivo
+    
+    def _saldos_inicio(self, historico: HistoricoColunar) -> Tuple[List[str], np.ndarray]:
+        """Saldo de cada item antes do primeiro registro do log: quantidade atual menos os deltas do log"""
+        if isinstance(self.estoque, EstoqueColunar):
+            codigos = list(self.estoque.codigos())
+            saldos = np.asarray(self.estoque.coluna("quantidade"), dtype=np.int64).copy()
+        else:
+            codigos = list(self.estoque.keys())
+            saldos = np.array([item["quantidade"] for item in self.estoque.values()], dtype=np.int64)
+        total = historico.total_categoria("codigo")
+        deltas = np.zeros(total, dtype=np.int64)
+        for colunas in historico.colunas():
+            deltas += np.bincount(colunas["codigo"], weights=colunas["delta"],
+                                  minlength=total)[:total].astype(np.int64)
+        linhas = historico.codigos_categoria("codigo", codigos)
+        presentes = linhas >= 0
+        saldos[presentes] -= deltas[linhas[presentes]]
+        return codigos, saldos
+    
+    def saldo_em(self, codigo: str, data: datetime) -> Optional[int]:
+        """Saldo exato do item ao fim do segundo ``data``, mesmo com os registros arquivados.
+        
+        Parte do primeiro ponto de corte posterior à data (ou do estoque atual)
+        e desconta os deltas registrados entre a data e ele. None se o item
+        não existia nesse ponto.
+        """
+        data_s = int(para_epoca(data))
+        pontos = sorted(self.arquivo.pontos(), key=lambda ponto: ponto["corte"]) if self.arquivo else []
+        posteriores = [ponto for ponto in pontos if ponto["corte"] > data_s]
+        if posteriores:
+            ponto = posteriores[0]
+            saldo = self.arquivo.saldo(ponto, codigo)
+            if saldo is None:
+                return None
+            return saldo - self.arquivo.soma_delta(codigo, data_s + 1, ponto["corte"] - 1)
+        with self._travas.varias([codigo]):
+            if codigo not in self.estoque:
+                return None
+            saldo = int(self.estoque[codigo]["quantidade"])
+            return saldo - self.historico.soma_delta(codigo, data_s + 1)
+    
+    def exportar_estoque(self) -> Dict[str, Dict]:
+        """Retorna o estoque como dicionário simples (para backup)"""
+        with self._travas.todas():
+            return {codigo: dict(item) for codigo, item in self.estoque.items()}
+    
+    def carregar_estoque(self, dados: Dict[str, Dict]):
+        """Substitui o estoque pelos itens informados (restauração de backup)"""
+        with self._travas.todas(), self._trava_derivados:
+            if isinstance(self.estoque, EstoqueColunar):
+                self.estoque = EstoqueColunar.de_dict(dados)
+            else:
+                self.estoque = dict(dados)
+            self.agregados.recalcular(self.estoque)
+            self.indice_alertas.reconstruir(self.estoque)
+            self.indice_valor.reconstruir(self.estoque)
+            self._reconstruir_indice_busca()
+            self._nova_versao(cadastro=True)
+            self.armazenamento.substituir_itens(dados)
+        self._avisar_monitor(None)
+        # Estado substituído por inteiro: o próximo backup precisa ser completo
+        self.alteracoes.redefinir(None, 0)
+    
+    def restaurar_backup(self, backup: Dict):
+        """Substitui estoque, histórico e usuários pelo conteúdo de um backup JSON (formato antigo).
+
+        Tudo é montado antes da troca: um backup inválido não altera o estado.
+        """
+        with self._trava_backup:
+            if isinstance(self.estoque, EstoqueColunar):
+                estoque = EstoqueColunar.de_dict(backup["estoque"])
+            else:
+                estoque = dict(backup["estoque"])
+            usuarios = dict(backup["usuarios"])
+            historico = HistoricoColunar.provisorio(self._diretorio_historico)
+            try:
+                historico.anexar_registros(backup["historico"])
+                # O backup traz o histórico inteiro: o arquivo anterior é descartado
+                self._substituir_estado(estoque, historico, usuarios, limpar_arquivo=True)
+            except BaseException:
+                historico.descartar()
+                raise
+            # Estado substituído por inteiro: o próximo backup precisa ser completo
+            self.alteracoes.redefinir(None, 0)
+    
+    def gerar_backup(self, destino: BinaryIO, incremental: bool = False) -> Dict:
+        """Grava um backup compactado (ver ``backup``) e abre um novo checkpoint.
+        
+        O backup completo leva todo o estoque, histórico (inclusive o arquivado)
+        e usuários; o incremental, só os itens e usuários alterados e o
+        histórico acrescentado desde o checkpoint anterior. Os itens são lidos em blocos, com as travas
+        apenas do bloco: mudanças concorrentes entram neste backup ou no próximo.
+        """
+        with self._trava_backup:
+            if incremental and self.alteracoes.checkpoint is None:
+                raise ValueError("Faça um backup completo antes do primeiro incremental.")
+            self.historico
+            with self._trava_historico:
+                # Log e blocos arquivados do mesmo instante (a retenção troca os dois juntos)
+                historico = self._historico
+                historico_fim = len(historico)
+                blocos = self.arquivo.blocos() if self.arquivo is not None else []
+                anterior = self.alteracoes.iniciar_checkpoint(historico_fim)
+            checkpoint_base, itens, usuarios, historico_inicio = anterior
+            if incremental:
+                cabecalho = novo_cabecalho("delta", base=checkpoint_base)
+                codigos, blocos = sorted(itens), []
+            else:
+                cabecalho = novo_cabecalho("completo")
+                codigos, usuarios, historico_inicio = None, set(self.usuarios), 0
+            try:
+                contagem = escrever_backup(destino, cabecalho, self._registros_backup(
+                    codigos, sorted(usuarios), historico, historico_inicio, historico_fim, blocos))
+            except Exception:
+                self.alteracoes.cancelar_checkpoint(anterior)
+                raise
+            self.alteracoes.concluir_checkpoint(cabecalho["checkpoint"])
+        return {"tipo": cabecalho["tipo"], "checkpoint": cabecalho["checkpoint"],
+                "base": cabecalho["base"], "registros": contagem}
+    
+    def _registros_backup(self, codigos: Optional[List[str]], usuarios: List[str],
+                          historico: HistoricoColunar, historico_inicio: int, historico_fim: int,
+                          blocos: List[Dict]) -> Iterator[Dict]:
+        if codigos is None:
+            codigos = list(self.estoque.keys())
+        for inicio in range(0, len(codigos), TAMANHO_BLOCO_BACKUP):
+            bloco = codigos[inicio:inicio + TAMANHO_BLOCO_BACKUP]
+            with self._travas.varias(bloco):
+                if isinstance(self.estoque, EstoqueColunar):
+                    linhas = self.estoque.linhas(bloco)
+                    linhas = linhas[linhas >= 0]
+                    colunas = []
+                    for campo in COLUNAS_ITEM:
+                        if campo in ("quantidade", "minimo", "maximo", "valor_unitario"):
+                            colunas.append(self.estoque.coluna(campo)[linhas].tolist())
+                        else:
+                            textos = self.estoque.codigos() if campo == "codigo" else self.estoque.textos(campo)
+                            colunas.append([textos[linha] for linha in linhas.tolist()])
+                    itens = [dict(zip(COLUNAS_ITEM, valores)) for valores in zip(*colunas)]
+                else:
+                    itens = [{"codigo": codigo, **self.estoque[codigo]} for codigo in bloco
+                             if codigo in self.estoque]
+            for item in itens:
+                yield {"t": "item", **item}
+        # Registros arquivados antes dos do log, na ordem do histórico
+        if blocos:
+            for registro in self.arquivo.iterar(blocos):
+                yield {"t": "historico", **registro}
+        for registro in historico.iterar(historico_inicio, historico_fim):
+            yield {"t": "historico", **registro}
+        for usuario in usuarios:
+            dados = self.usuarios.get(usuario)
+            if dados is None:
+                yield {"t": "usuario_removido", "usuario": usuario}
+            else:
+                yield {"t": "usuario", "usuario": usuario, **dados}
+    
+    def restaurar_backup_arquivo(self, origem: BinaryIO) -> Dict:
+        """Restaura um backup compactado, validando os registros conforme são lidos.
+        
+        Um backup completo é montado em estruturas novas e só substitui o estado
+        atual depois de lido e validado por inteiro. Um incremental é aplicado
+        sobre o estado atual, que precisa estar no checkpoint base do delta (o
+        último backup gerado ou restaurado).
+        """
+        with self._trava_backup:
+            cabecalho, registros = ler_backup(origem)
+            if cabecalho["tipo"] == "delta":
+                if cabecalho["base"] != self.alteracoes.checkpoint:
+                    raise ValueError("O backup incremental não parte do checkpoint atual: "
+                                     "restaure antes o backup em que ele se baseia.")
+                contagem = self._restaurar_delta(registros)
+            else:
+                contagem = self._restaurar_completo(registros)
+            self.alteracoes.redefinir(cabecalho["checkpoint"], len(self.historico))
+        return {"tipo": cabecalho["tipo"], "checkpoint": cabecalho["checkpoint"],
+                "data_backup": cabecalho.get("data_backup"), "registros": contagem}
+    
+    def _restaurar_completo(self, registros: Iterator[Dict]) -> Dict[str, int]:
+        estoque = EstoqueColunar() if isinstance(self.estoque, EstoqueColunar) else {}
+        # Log montado num diretório temporário: os segmentos atuais só saem na troca
+        historico = HistoricoColunar.provisorio(self._diretorio_historico)
+        try:
+            return self._montar_restauracao(registros, estoque, historico)
+        except BaseException:
+            historico.descartar()
+            raise
+    
+    def _montar_restauracao(self, registros: Iterator[Dict], estoque, historico: HistoricoColunar) -> Dict[str, int]:
+        colunar = isinstance(estoque, EstoqueColunar)
+        usuarios: Dict[str, Dict] = {}
+        lote_itens: List[Dict] = []
+        lote_historico: List[Dict] = []
+        vistos = set()
+        contagem = {"item": 0, "historico": 0, "usuario": 0}
+        
+        def descarregar_itens():
+            if colunar:
+                estoque.anexar_lote([item.pop("codigo") for item in lote_itens],
+                                    {campo: [item[campo] for item in lote_itens]
+                                     for campo in COLUNAS_ITEM[1:]})
+            else:
+                for item in lote_itens:
+                    estoque[item.pop("codigo")] = {campo: item[campo] for campo in COLUNAS_ITEM[1:]}
+            lote_itens.clear()
+        
+        for registro in registros:
+            tipo = registro.pop("t")
+            if tipo == "item":
+                if registro["codigo"] in vistos:
+                    raise ValueError(f"Código repetido no backup: {registro['codigo']}")
+                vistos.add(registro["codigo"])
+                lote_itens.append(registro)
+                if len(lote_itens) == TAMANHO_BLOCO_BACKUP:
+                    descarregar_itens()
+            elif tipo == "historico":
+                lote_historico.append(registro)
+                if len(lote_historico) == TAMANHO_BLOCO_BACKUP:
+                    historico.anexar_registros(lote_historico)
+                    lote_historico.clear()
+            elif tipo == "usuario":
+                usuarios[registro["usuario"]] = {"senha": registro["senha"], "tipo": registro["tipo"]}
+            else:
+                raise ValueError("Backup completo não pode conter usuários removidos.")
+            contagem[tipo] += 1
+        descarregar_itens()
+        historico.anexar_registros(lote_historico)
+        if not usuarios:
+            raise ValueError("O backup não contém usuários.")
+        
+        # Arquivo íntegro: troca o estado de uma vez e regrava o armazenamento
+        self._substituir_estado(estoque, historico, usuarios, limpar_arquivo=True)
+        return contagem
+    
+    def _substituir_estado(self, estoque, historico: HistoricoColunar, usuarios: Dict[str, Dict],
+                           indice_busca: Optional[IndiceBusca] = None, limpar_arquivo: bool = False):
+        """Troca estoque, histórico e usuários de uma vez e regrava o armazenamento.
+        
+        ``limpar_arquivo`` descarta o arquivo do histórico (o novo log já traz
+        os registros arquivados).
+        """
+        with self._travas.todas(), self._trava_derivados:
+            self.estoque = estoque
+            self.agregados.recalcular(self.estoque)
+            self.indice_alertas.reconstruir(self.estoque)
+            self.indice_valor.reconstruir(self.estoque)
+            if indice_busca is None:
+                self._reconstruir_indice_busca()
+            else:
+                self.indice_busca = indice_busca
+            with self._trava_historico:
+                # Log provisório (restauração) ocupa agora o diretório do histórico
+                historico.efetivar()
+                if limpar_arquivo and self.arquivo is not None:
+                    self.arquivo.limpar()
+                    historico.arquivo = self.arquivo
+                self._historico = historico
+                self.usuarios = usuarios
+                self._nova_versao(cadastro=True)
+                # Trecho fixo do log: acréscimos depois da troca vão em gravações próprias
+                self.armazenamento.substituir_tudo(self.estoque, historico.iterar(0, len(historico)),
+                                                   usuarios)
+        self._avisar_monitor(None)
+    
+    def salvar_snapshot(self, diretorio: Optional[str] = None) -> Dict:
+        """Grava o estado atual num snapshot binário (ver ``snapshot``); retorna o manifesto"""
+        diretorio = diretorio or self._diretorio_snapshot
+        if not diretorio:
+            raise ValueError("Nenhum diretório de snapshot configurado.")
+        if not isinstance(self.estoque, EstoqueColunar):
+            raise ValueError("Snapshots exigem o estoque colunar.")
+        historico = self.historico
+        # Foto consistente: nenhuma escrita entre a geração do banco e os arquivos
+        with self._travas.todas(), self._trava_derivados, self._trava_historico:
+            return gravar_snapshot(diretorio, self.estoque, historico, self.indice_busca,
+                                   self.usuarios, self.armazenamento.geracao())
+    
+    def restaurar_snapshot(self, diretorio: Optional[str] = None) -> Dict:
+        """Substitui o estado pelo conteúdo de um snapshot e regrava o armazenamento"""
+        diretorio = diretorio or self._diretorio_snapshot
+        manifesto = ler_manifesto(diretorio) if diretorio else None
+        if manifesto is None:
+            raise ValueError("Nenhum snapshot encontrado.")
+        if not isinstance(self.estoque, EstoqueColunar):
+            raise ValueError("Snapshots exigem o estoque colunar.")
+        estoque, historico, indice_busca = abrir_snapshot(diretorio, manifesto,
+                                                          self._diretorio_historico, self.arquivo)
+        # O arquivo é mantido: o que o snapshot traz de anterior ao corte já está nele
+        historico = self._ligar_arquivo(historico)
+        self._substituir_estado(estoque, historico, dict(manifesto["usuarios"]), indice_busca)
+        self.alteracoes.redefinir(None, 0)
+        return manifesto
+    
+    def _abrir_snapshot(self) -> Optional[IndiceBusca]:
+        """Carrega estoque e histórico do snapshot, se ele estiver em dia com o armazenamento.
+        
+        Retorna o índice de busca do snapshot (None se o snapshot não foi usado).
+        """
+        try:
+            manifesto = ler_manifesto(self._diretorio_snapshot)
+        except (OSError, ValueError):
+            return None
+        # Gravações no banco depois do snapshot o tornam obsoleto: a carga volta ao banco
+        if manifesto is None or manifesto["geracao"] != self.armazenamento.geracao():
+            return None
+        self.estoque, historico, indice_busca = abrir_snapshot(
+            self._diretorio_snapshot, manifesto, self._diretorio_historico, self.arquivo)
+        self._historico = self._ligar_arquivo(historico)
+        self._historico.efetivar()
+        if not self.armazenamento.persistente:
+            self.usuarios = dict(manifesto["usuarios"])
+        return indice_busca
+    
+    def _restaurar_delta(self, registros: Iterator[Dict]) -> Dict[str, int]:
+        import pandas as pd
+        
+        # O delta é pequeno: é lido por inteiro (e validado) antes de tocar o estado
+        itens: Dict[str, Dict] = {}
+        historico: List[Dict] = []
+        usuarios: Dict[str, Optional[Dict]] = {}
+        for registro in registros:
+            tipo = registro.pop("t")
+            if tipo == "item":
+                itens[registro["codigo"]] = registro
+            elif tipo == "historico":
+                historico.append(registro)
+            elif tipo == "usuario":
+                usuarios[registro["usuario"]] = {"senha": registro["senha"], "tipo": registro["tipo"]}
+            else:
+                usuarios[registro["usuario"]] = None
+        
+        if itens:
+            quadro = pd.DataFrame(list(itens.values()), columns=list(COLUNAS_ITEM))
+            with self._travas.todas():
+                if isinstance(self.estoque, EstoqueColunar):
+                    existe = self.estoque.linhas(quadro["codigo"].tolist()) >= 0
+                else:
+                    existe = quadro["codigo"].isin(list(self.estoque.keys())).to_numpy()
+                novos, alterados = quadro[~existe], quadro[existe]
+                anteriores = self._gravar_itens_importados(novos, alterados)
+                if self._atualizar_derivados_importados(novos, alterados, anteriores, False):
+                    with self._trava_derivados:
+                        self._reconstruir_indice_busca()
+                self._nova_versao(cadastro=True)
+                colunas = {campo: quadro[campo].tolist() for campo in COLUNAS_ITEM}
+                self.armazenamento.salvar_itens_lote(colunas.pop("codigo"), colunas)
+            self._avisar_monitor(quadro["codigo"].tolist())
+        if historico:
+            self.registrar_historico_lote({campo: [registro.get(campo, PADROES_REGISTRO.get(campo))
+                                                   for registro in historico]
+                                           for campo in COLUNAS_HISTORICO})
+        for usuario, dados in usuarios.items():
+            if dados is None:
+                if self.usuarios.pop(usuario, None) is not None:
+                    self.armazenamento.remover_usuario(usuario)
+            else:
+                self.usuarios[usuario] = dados
+                self.armazenamento.salvar_usuario(usuario, dados)
+        if usuarios:
+            self._nova_versao()
+        return {"item": len(itens), "historico": len(historico), "usuario": len(usuarios)}
+
+def valor_numerico(valor) -> Optional[float]:
+    """Valor como float para as colunas tipadas do histórico (None se não for numérico)"""
+    if isinstance(valor, (int, float, np.integer, np.floating)) and not isinstance(valor, bool):
+        return float(valor)
+    return None
+
+def criar_gerenciador() -> EstoqueManager:
+    """Gerenciador configurado pelas variáveis de ambiente (interface, workers e scripts)"""
+    # ESTOQUE_DB vazio mantém os dados apenas em memória
+    caminho = os.environ.get("ESTOQUE_DB", "estoque.db")
+    # ESTOQUE_SNAPSHOT: diretório do snapshot binário lido na partida e regravado ao sair
+    snapshot = os.environ.get("ESTOQUE_SNAPSHOT") or None
+    # ESTOQUE_ARQUIVO_DIR: blocos do histórico fora da janela quente (padrão: ao lado do banco)
+    arquivo = os.environ.get("ESTOQUE_ARQUIVO_DIR") or (caminho + ".arquivo" if caminho else None)
+    manager = EstoqueManager(armazenamento=ArmazenamentoSQLite(caminho) if caminho else None,
+                             diretorio_historico=os.environ.get("ESTOQUE_HISTORICO_DIR") or None,
+                             diretorio_snapshot=snapshot, diretorio_arquivo=arquivo)
+    if snapshot:
+        # Registrado depois do armazenamento: roda antes de o banco ser fechado
+        atexit.register(manager.salvar_snapshot)
+    # Destinos das notificações de alerta; sem nenhum o monitor não é iniciado
+    destinos = []
+    if os.environ.get("ESTOQUE_ALERTAS_WEBHOOK"):
+        destinos.append(DestinoWebhook(os.environ["ESTOQUE_ALERTAS_WEBHOOK"]))
+    if os.environ.get("ESTOQUE_ALERTAS_FILA"):
+        destinos.append(DestinoFila(os.environ["ESTOQUE_ALERTAS_FILA"]))
+    if os.environ.get("ESTOQUE_ALERTAS_EMAIL_DIR"):
+        destinos.append(DestinoEmail(os.environ["ESTOQUE_ALERTAS_EMAIL_DIR"]))
+    if destinos:
+        manager.iniciar_monitor_alertas(destinos)
+        atexit.register(manager.parar_monitor_alertas)
+    return manager
@@ -0,0 +1,917 @@
+"""Log colunar, somente de acréscimo, do histórico de movimentações.
+
+Os registros são gravados em segmentos de tamanho fixo com colunas NumPy:
+data em segundos desde a época (hora local, sem fuso), tipo, usuário, código
+e campo alterado como códigos inteiros de categorias, quantidade (saldo após a
+operação) e delta (variação com sinal) inteiros, valores anterior e novo de
+atualizações de campos numéricos em float (NaN quando não se aplicam). A
+descrição (descrição do item no cadastro, observação nas movimentações), única
+coluna de tamanho variável, fica numa lista enquanto o segmento está ativo e
+vira um bloco UTF-8 com deslocamentos ao ser selado.
+
+Totais movimentados e taxas de consumo saem de reduções sobre essas colunas,
+sem interpretar textos.
+
+Segmentos selados são imutáveis e, se houver um diretório configurado, são
+gravados em ``.npy`` e reabertos por mmap. Cada segmento guarda a menor e a
+maior data que contém; os filtros por período só leem os segmentos cujo
+intervalo cruza o pedido.
+
+Contagens por período e tendências saem dos agregados por hora e por dia
+(ver ``resumos_historico``), alimentados a cada registro acrescentado.
+
+Com um arquivo (ver ``arquivo_historico``), ``recortar`` tira do log os
+registros anteriores a um ponto de corte; contagens, tendências por SKU e o
+consumo para a previsão que alcançam datas anteriores ao corte completam o log
+com os totais e resumos diários do arquivo.
+"""
+import glob
+import os
+import shutil
+import tempfile
+from collections.abc import Sequence
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from paginacao import pagina_ordenada, postos
+from resumos_historico import (GRANULARIDADES, MEDIDAS, SEGUNDOS_DIA, SEGUNDOS_HORA, ResumosHistorico,
+                               decompor_periodo)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from arquivo_historico import ArquivoHistorico
+
+TAMANHO_SEGMENTO = 65536
+
+# Ordem dos campos de um registro (os do dicionário original e os campos tipados)
+CAMPOS_REGISTRO = ("data", "tipo", "codigo", "descricao", "quantidade", "usuario", "delta",
+                   "campo", "valor_anterior", "valor_novo")
+
+# Campos que um registro pode omitir (registros antigos, movimentações) e seu valor padrão
+PADROES_REGISTRO = {"delta": 0, "campo": "", "valor_anterior": None, "valor_novo": None}
+
+COLUNAS_FIXAS = {
+    "data": np.int64,
+    "tipo": np.int32,
+    "codigo": np.int32,
+    "usuario": np.int32,
+    "quantidade": np.int64,
+    "delta": np.int64,
+    "campo": np.int32,
+    "valor_anterior": np.float64,
+    "valor_novo": np.float64,
+}
+
+# Colunas com código de categoria (índice na tabela de valores do log)
+COLUNAS_CATEGORIA = ("tipo", "codigo", "usuario", "campo")
+
+# Colunas de valores de atualização (None no registro, NaN na coluna)
+COLUNAS_VALOR = ("valor_anterior", "valor_novo")
+
+# Colunas pelas quais uma página do histórico pode ser ordenada
+ORDENACOES_HISTORICO = ("data", "tipo", "codigo", "quantidade", "usuario", "delta")
+
+_SEP_DESCRICAO = "\x00"
+
+_EPOCA = datetime(1970, 1, 1)
+
+
+def para_epoca(datas) -> np.ndarray:
+    """Converte datas ("%Y-%m-%d %H:%M:%S" ou datetime) em segundos desde a época"""
+    return np.array(datas, dtype="datetime64[s]").astype(np.int64)
+
+
+def completar_colunas(colunas: Mapping[str, Sequence], total: int) -> Dict[str, Sequence]:
+    """Colunas de registros com os campos opcionais ausentes preenchidos pelo padrão"""
+    completas = dict(colunas)
+    for campo, padrao in PADROES_REGISTRO.items():
+        if campo not in completas:
+            completas[campo] = [padrao] * total
+    return completas
+
+
+def formatar_epoca(segundos: np.ndarray) -> List[str]:
+    """Converte segundos desde a época no texto "%Y-%m-%d %H:%M:%S" """
+    textos = np.datetime_as_string(np.asarray(segundos, dtype=np.int64).astype("datetime64[s]"))
+    return [texto.replace("T", " ") for texto in textos.tolist()]
+
+
+class SegmentoHistorico:
+    """Bloco de registros com colunas de largura fixa"""
+
+    def __init__(self, capacidade: int = TAMANHO_SEGMENTO):
+        self.colunas = {campo: np.zeros(capacidade, dtype=dtype)
+                        for campo, dtype in COLUNAS_FIXAS.items()}
+        self.n = 0
+        self.data_min = np.iinfo(np.int64).max
+        self.data_max = np.iinfo(np.int64).min
+        # Descrições: lista enquanto ativo; bloco UTF-8 + deslocamentos quando selado
+        self._descricoes: Optional[List[str]] = []
+        self._texto: Optional[np.ndarray] = None
+        self._inicio_texto: Optional[np.ndarray] = None
+
+    @property
+    def capacidade(self) -> int:
+        return len(self.colunas["data"])
+
+    @property
+    def selado(self) -> bool:
+        return self._descricoes is None
+
+    def anexar(self, colunas: Mapping[str, np.ndarray], descricoes: List[str]):
+        """Acrescenta registros (cabem no espaço livre do segmento)"""
+        inicio, quantidade = self.n, len(descricoes)
+        for campo, coluna in self.colunas.items():
+            coluna[inicio:inicio + quantidade] = colunas[campo]
+        self._descricoes.extend(descricoes)
+        datas = colunas["data"]
+        self.data_min = min(self.data_min, int(np.min(datas)))
+        self.data_max = max(self.data_max, int(np.max(datas)))
+        # Leitores sem trava enxergam apenas as linhas já completas
+        self.n = inicio + quantidade
+
+    def anexar_um(self, valores: Mapping[str, int], descricao: str):
+        """Acrescenta um único registro já codificado (caminho rápido)"""
+        linha = self.n
+        for campo, coluna in self.colunas.items():
+            coluna[linha] = valores[campo]
+        self._descricoes.append(descricao)
+        self.data_min = min(self.data_min, valores["data"])
+        self.data_max = max(self.data_max, valores["data"])
+        self.n = linha + 1
+
+    def selar(self, diretorio: Optional[str] = None, numero: int = 0) -> "SegmentoHistorico":
+        """Retorna a versão imutável do segmento (mapeada em disco, se houver diretório)"""
+        selado = SegmentoHistorico(capacidade=0)
+        n = self.n
+        texto = _SEP_DESCRICAO.join(self._descricoes[:n]).encode("utf-8")
+        tamanhos = np.fromiter((len(d.encode("utf-8")) + 1 for d in self._descricoes[:n]),
+                               dtype=np.int64, count=n)
+        arrays = {campo: coluna[:n].copy() for campo, coluna in self.colunas.items()}
+        arrays["_texto"] = np.frombuffer(texto, dtype=np.uint8)
+        arrays["_inicio_texto"] = np.concatenate([[0], np.cumsum(tamanhos)]).astype(np.int64)
+
+        if diretorio is not None:
+            for nome, array in arrays.items():
+                caminho = os.path.join(diretorio, f"segmento_{numero:06d}_{nome.lstrip('_')}.npy")
+                np.save(caminho, array)
+                arrays[nome] = np.load(caminho, mmap_mode="r")
+        else:
+            for array in arrays.values():
+                array.flags.writeable = False
+
+        selado._texto = arrays.pop("_texto")
+        selado._inicio_texto = arrays.pop("_inicio_texto")
+        selado.colunas = arrays
+        selado._descricoes = None
+        selado.n = n
+        selado.data_min, selado.data_max = self.data_min, self.data_max
+        return selado
+
+    def gravar(self, diretorio: str, numero: int) -> Dict[str, int]:
+        """Grava o segmento em ``diretorio`` (snapshot) e retorna n e o intervalo de datas.
+
+        Arquivos de um segmento selado já mapeado entram por link, sem cópia.
+        """
+        if not self.selado:
+            self.selar(diretorio, numero)
+        else:
+            arrays = dict(self.colunas, texto=self._texto, inicio_texto=self._inicio_texto)
+            for nome, array in arrays.items():
+                caminho = os.path.join(diretorio, f"segmento_{numero:06d}_{nome}.npy")
+                origem = getattr(array, "filename", None)
+                try:
+                    os.link(origem, caminho)
+                except (TypeError, OSError):
+                    np.save(caminho, array)
+        return {"n": self.n, "data_min": self.data_min, "data_max": self.data_max}
+
+    def cruza(self, inicio: Optional[int], fim: Optional[int]) -> bool:
+        """Indica se o segmento tem registros que podem estar no intervalo"""
+        if self.n == 0:
+            return False
+        return (inicio is None or self.data_max >= inicio) and (fim is None or self.data_min <= fim)
+
+    def descricoes(self, linhas: Optional[np.ndarray] = None, n: Optional[int] = None) -> List[str]:
+        """Descrições das linhas informadas (ou das n primeiras)"""
+        n = self.n if n is None else n
+        if not self.selado:
+            todas = self._descricoes
+            if linhas is None:
+                return todas[:n]
+            return [todas[i] for i in linhas.tolist()]
+        if linhas is None or len(linhas) > n // 4:
+            todas = bytes(self._texto).decode("utf-8").split(_SEP_DESCRICAO)
+            return todas[:n] if linhas is None else [todas[i] for i in linhas.tolist()]
+        inicio = self._inicio_texto
+        return [bytes(self._texto[inicio[i]:inicio[i + 1] - 1]).decode("utf-8")
+                for i in linhas.tolist()]
+
+
+class SegmentoMapeado(SegmentoHistorico):
+    """Segmento selado gravado com ``gravar``, mapeado por mmap só no primeiro acesso às colunas"""
+
+    def __init__(self, diretorio: str, numero: int, n: int, data_min: int, data_max: int):
+        self._diretorio = diretorio
+        self._numero = numero
+        self._arquivos: Optional[Dict[str, np.ndarray]] = None
+        self._descricoes = None
+        self.n = n
+        # O intervalo de datas vem do índice: filtros por período nem abrem os arquivos
+        self.data_min, self.data_max = data_min, data_max
+
+    def _mapear(self) -> Dict[str, np.ndarray]:
+        if self._arquivos is None:
+            self._arquivos = {
+                nome: np.load(os.path.join(self._diretorio, f"segmento_{self._numero:06d}_{nome}.npy"),
+                              mmap_mode="r")
+                for nome in (*COLUNAS_FIXAS, "texto", "inicio_texto")}
+        return self._arquivos
+
+    @property
+    def colunas(self) -> Dict[str, np.ndarray]:
+        arquivos = self._mapear()
+        return {campo: arquivos[campo] for campo in COLUNAS_FIXAS}
+
+    @property
+    def _texto(self) -> np.ndarray:
+        return self._mapear()["texto"]
+
+    @property
+    def _inicio_texto(self) -> np.ndarray:
+        return self._mapear()["inicio_texto"]
+
+
+class HistoricoColunar(Sequence):
+    """Histórico em segmentos colunares; indexável como lista de registros"""
+
+    def __init__(self, diretorio: Optional[str] = None, arquivo: Optional["ArquivoHistorico"] = None):
+        self.diretorio = diretorio
+        # Diretório que o log provisório vai ocupar ao ser efetivado (ver provisorio)
+        self._destino: Optional[str] = None
+        # Registros anteriores ao último corte do arquivo não estão no log
+        self.arquivo = arquivo
+        if diretorio is not None:
+            os.makedirs(diretorio, exist_ok=True)
+            # O diretório pertence ao log: segmentos de execuções anteriores são descartados
+            for caminho in glob.glob(os.path.join(diretorio, "segmento_*.npy")):
+                os.remove(caminho)
+        # Tabelas de categorias (valor -> código e código -> valor)
+        self._categorias: Dict[str, List[str]] = {campo: [] for campo in COLUNAS_CATEGORIA}
+        self._codigos_categoria: Dict[str, Optional[Dict[str, int]]] = {campo: {} for campo in COLUNAS_CATEGORIA}
+        # Postos alfabéticos das categorias, para ordenar páginas (ver _postos)
+        self._postos_categoria: Dict[str, Tuple[int, np.ndarray]] = {}
+        # Segmentos selados e segmento ativo, trocados juntos numa única atribuição
+        self._estado: Tuple[Tuple[SegmentoHistorico, ...], SegmentoHistorico] = ((), SegmentoHistorico())
+        # Agregados por hora e por dia (num log montado de segmentos ou com arquivo,
+        # semeados e lidos na primeira consulta)
+        self._resumos = ResumosHistorico(self)
+        if arquivo is None:
+            self._resumos.semear()
+
+    @classmethod
+    def de_segmentos(cls, categorias: Mapping[str, List[str]], segmentos: Iterable[SegmentoHistorico],
+                     diretorio: Optional[str] = None,
+                     arquivo: Optional["ArquivoHistorico"] = None) -> "HistoricoColunar":
+        """Monta o log sobre segmentos já selados (de um snapshot); novos registros vão para ``diretorio``"""
+        historico = cls(diretorio, arquivo)
+        historico._categorias = {campo: list(categorias[campo]) for campo in COLUNAS_CATEGORIA}
+        # Tabelas valor -> código montadas só no primeiro uso (ver _tabela_codigos)
+        historico._codigos_categoria = {campo: None for campo in COLUNAS_CATEGORIA}
+        historico._estado = (tuple(segmentos), SegmentoHistorico())
+        return historico
+
+    @classmethod
+    def provisorio(cls, diretorio: Optional[str] = None,
+                   arquivo: Optional["ArquivoHistorico"] = None) -> "HistoricoColunar":
+        """Log novo num diretório temporário ao lado de ``diretorio``, sem tocar nos segmentos atuais.
+
+        ``efetivar`` põe o log no lugar de ``diretorio``; ``descartar`` apaga o
+        temporário (montagem que falhou).
+        """
+        if diretorio is None:
+            return cls(None, arquivo)
+        pai, nome = os.path.split(os.path.abspath(diretorio))
+        os.makedirs(pai, exist_ok=True)
+        historico = cls(tempfile.mkdtemp(prefix=nome + ".tmp", dir=pai), arquivo)
+        historico._destino = diretorio
+        return historico
+
+    def efetivar(self):
+        """Troca o diretório de destino pelo do log provisório (nada a fazer nos demais logs).
+
+        O chamador serializa os escritores do log atual: nenhum segmento pode
+        ser selado no destino durante a troca.
+        """
+        if self._destino is None:
+            return
+        # Arquivos ainda mapeados pelo log anterior continuam válidos
+        antigo = self._destino.rstrip(os.sep) + ".antigo"
+        shutil.rmtree(antigo, ignore_errors=True)
+        if os.path.exists(self._destino):
+            os.rename(self._destino, antigo)
+        os.replace(self.diretorio, self._destino)
+        shutil.rmtree(antigo, ignore_errors=True)
+        self.diretorio, self._destino = self._destino, None
+
+    def descartar(self):
+        """Apaga o diretório de um log provisório não efetivado"""
+        if self._destino is not None:
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def categorias(self) -> Dict[str, List[str]]:
+        """Tabelas de valores das colunas de categoria (código -> valor)"""
+        return {campo: list(valores) for campo, valores in self._categorias.items()}
+
+    def segmentos(self) -> Tuple[SegmentoHistorico, ...]:
+        """Segmentos selados e o ativo, numa foto consistente"""
+        selados, ativo = self._estado
+        return selados + (ativo,)
+
+    # Escrita (o chamador serializa os escritores)
+
+    def anexar(self, data: datetime, tipo: str, codigo: str, descricao: str,
+               quantidade: int, usuario: Optional[str], delta: int = 0, campo: str = "",
+               valor_anterior: Optional[float] = None, valor_novo: Optional[float] = None):
+        """Acrescenta um registro"""
+        valores = {
+            "data": int((data - _EPOCA).total_seconds()),
+            "tipo": self._codificar_um("tipo", tipo),
+            "codigo": self._codificar_um("codigo", codigo),
+            "usuario": self._codificar_um("usuario", usuario),
+            "quantidade": quantidade,
+            "delta": delta,
+            "campo": self._codificar_um("campo", campo),
+            "valor_anterior": np.nan if valor_anterior is None else valor_anterior,
+            "valor_novo": np.nan if valor_novo is None else valor_novo,
+        }
+        selados, ativo = self._estado
+        ativo.anexar_um(valores, "" if descricao is None else str(descricao).replace(_SEP_DESCRICAO, " "))
+        posicao = sum(segmento.n for segmento in selados) + ativo.n - 1
+        if ativo.n == ativo.capacidade:
+            self._estado = (selados + (ativo.selar(self.diretorio, len(selados)),),
+                            SegmentoHistorico())
+        self._resumos.acumular_um(posicao, valores["data"], valores["tipo"], valores["usuario"],
+                                  valores["codigo"], delta)
+
+    def anexar_registros(self, registros: Iterable[Dict]):
+        """Acrescenta registros no formato de dicionário (backup, carga do banco)"""
+        registros = list(registros)
+        if registros:
+            self.anexar_colunas({campo: [registro.get(campo, PADROES_REGISTRO.get(campo))
+                                         for registro in registros]
+                                 for campo in CAMPOS_REGISTRO})
+
+    def anexar_colunas(self, colunas: Mapping[str, Sequence]):
+        """Acrescenta registros em lote (listas alinhadas por campo; opcionais podem faltar)"""
+        total = len(colunas["descricao"])
+        if not total:
+            return
+        colunas = completar_colunas(colunas, total)
+        convertidas = {
+            "data": para_epoca(colunas["data"]),
+            "quantidade": np.asarray(colunas["quantidade"], dtype=np.int64),
+            "delta": np.asarray(colunas["delta"], dtype=np.int64),
+        }
+        for campo in COLUNAS_VALOR:
+            # None vira NaN na conversão para float
+            convertidas[campo] = np.asarray(colunas[campo], dtype=np.float64)
+        for campo in COLUNAS_CATEGORIA:
+            convertidas[campo] = self._codificar(campo, colunas[campo])
+        descricoes = ["" if d is None else str(d).replace(_SEP_DESCRICAO, " ")
+                      for d in colunas["descricao"]]
+
+        posicao = len(self)
+        self._anexar_codificadas(convertidas, descricoes)
+        self._resumos.acumular(posicao, convertidas)
+
+    def _anexar_codificadas(self, convertidas: Mapping[str, np.ndarray], descricoes: List[str]):
+        """Acrescenta colunas já no formato de ``COLUNAS_FIXAS``, preenchendo e selando segmentos"""
+        total = len(descricoes)
+        feito = 0
+        while feito < total:
+            selados, ativo = self._estado
+            livre = ativo.capacidade - ativo.n
+            parte = min(livre, total - feito)
+            ativo.anexar({campo: coluna[feito:feito + parte] for campo, coluna in convertidas.items()},
+                         descricoes[feito:feito + parte])
+            feito += parte
+            if ativo.n == ativo.capacidade:
+                self._estado = (selados + (ativo.selar(self.diretorio, len(selados)),),
+                                SegmentoHistorico())
+
+    def recortar(self, corte: int) -> Tuple[Optional[Dict], "HistoricoColunar"]:
+        """Separa os registros com data anterior a ``corte`` (segundos desde a época).
+
+        Retorna as colunas fixas, descrições (``"descricao"``) e posições
+        (``"posicao"``) dos registros separados, ou None se não houver nenhum,
+        e um log novo com os demais, na mesma ordem, com as mesmas categorias e
+        o mesmo arquivo. Os agregados já semeados passam para o log novo (os
+        registros separados devem ir para o arquivo). O chamador serializa os
+        escritores; o log original e seus segmentos não mudam: o log novo fica
+        num diretório provisório até o chamador o ``efetivar`` (ver ``provisorio``).
+        """
+        minima = self.data_minima()
+        if minima is None or minima >= corte:
+            return None, self
+        if self._resumos.semeado:
+            self._resumos.atualizar(self)
+        separados: Dict[str, List] = {campo: [] for campo in (*COLUNAS_FIXAS, "descricao", "posicao")}
+        novo = HistoricoColunar.provisorio(self.diretorio, self.arquivo)
+        try:
+            self._copiar_recorte(novo, corte, separados)
+            separados = {campo: (valores if campo == "descricao" else np.concatenate(valores))
+                         for campo, valores in separados.items()}
+            novo._resumos = self._resumos.transferir(novo, len(separados["posicao"]), corte)
+        except BaseException:
+            novo.descartar()
+            raise
+        return separados, novo
+
+    def _copiar_recorte(self, novo: "HistoricoColunar", corte: int, separados: Dict[str, List]):
+        """Passa para ``novo`` os registros a partir de ``corte`` e junta os anteriores em ``separados``"""
+        novo._categorias = self.categorias()
+        novo._codigos_categoria = {campo: None for campo in COLUNAS_CATEGORIA}
+        base = 0
+        for segmento in self.segmentos():
+            n = segmento.n
+            if not n:
+                continue
+            colunas = segmento.colunas
+            antigos = np.asarray(colunas["data"][:n]) < corte
+            for linhas, destino in ((np.flatnonzero(antigos), separados), (np.flatnonzero(~antigos), None)):
+                if not len(linhas):
+                    continue
+                partes = {campo: np.asarray(coluna[:n][linhas]) for campo, coluna in colunas.items()}
+                descricoes = segmento.descricoes(linhas, n)
+                if destino is None:
+                    novo._anexar_codificadas(partes, descricoes)
+                    continue
+                for campo, parte in partes.items():
+                    destino[campo].append(parte)
+                destino["descricao"].extend(descricoes)
+                destino["posicao"].append(base + linhas)
+            base += n
+
+    def data_minima(self) -> Optional[int]:
+        """Menor data do log em segundos (None se vazio), pelos intervalos dos segmentos"""
+        datas = [segmento.data_min for segmento in self.segmentos() if segmento.n]
+        return min(datas) if datas else None
+
+    def registrar_arquivados(self, desde_dia: Optional[int] = None):
+        """Registra nas categorias os tipos e usuários do arquivo e os SKUs dos resumos a partir de ``desde_dia``.
+
+        Com isso totais e consumos arquivados têm código no log. Escrita: o
+        chamador serializa os escritores.
+        """
+        if self.arquivo is None:
+            return
+        for _, totais in self.arquivo.totais():
+            for tipo, usuario, *_ in totais:
+                self._codificar_um("tipo", tipo)
+                self._codificar_um("usuario", usuario)
+        for _, codigos, _, _ in self.arquivo.resumos(desde_dia):
+            if len(codigos):
+                self._codificar("codigo", codigos)
+
+    def totais_arquivados(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+        """Por dia arquivado: códigos de tipo e usuário no log e as medidas de cada par"""
+        if self.arquivo is None:
+            return
+        for dia, totais in self.arquivo.totais():
+            tipos = self.codigos_categoria("tipo", [linha[0] for linha in totais])
+            usuarios = self.codigos_categoria("usuario", [linha[1] for linha in totais])
+            valores = np.array([linha[2:] for linha in totais], dtype=np.int64).reshape(-1, len(MEDIDAS))
+            conhecidos = (tipos >= 0) & (usuarios >= 0)
+            yield dia, tipos[conhecidos], usuarios[conhecidos], valores[conhecidos]
+
+    def diarios_arquivados(self, tipo: str, desde_dia: Optional[int] = None, ate_dia: Optional[int] = None
+                           ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Resumo diário por SKU do tipo informado no arquivo: códigos no log, dias e medidas.
+
+        SKUs sem código no log (ver ``registrar_arquivados``) ficam de fora.
+        """
+        if self.arquivo is None:
+            return
+        for dia, codigos, tipos, valores in self.arquivo.resumos(desde_dia, ate_dia):
+            selecao = tipos == tipo
+            linhas = self.codigos_categoria("codigo", codigos[selecao].tolist())
+            conhecidos = linhas >= 0
+            yield (linhas[conhecidos], np.full(int(conhecidos.sum()), dia, dtype=np.int64),
+                   valores[selecao][conhecidos])
+
+    def soma_delta(self, codigo: str, inicio: Optional[int] = None, fim: Optional[int] = None) -> int:
+        """Soma dos deltas do SKU no log com data em [inicio, fim] (segundos)"""
+        filtro = {"codigo": int(self.codigos_categoria("codigo", [codigo])[0])}
+        return int(sum(segmento.colunas["delta"][:n][slice(None) if linhas is None else linhas].sum()
+                       for segmento, linhas, n in self._selecoes_epoca(inicio, fim, filtro)))
+
+    def reconstruir_resumos(self) -> int:
+        """Refaz os agregados por hora e por dia a partir do log; retorna os registros lidos"""
+        self._resumos.reconstruir(self)
+        return self._resumos.processados
+
+    def _codificar(self, campo: str, valores: Sequence) -> np.ndarray:
+        if len(valores) == 1:
+            # Registro avulso (movimentação): dispensa a fatoração e o pandas
+            return np.array([self._codificar_um(campo, valores[0])], dtype=np.int32)
+        import pandas as pd
+
+        # Codifica cada valor distinto uma vez e espalha pelos registros
+        fatores, distintos = pd.factorize(np.asarray(valores, dtype=object), use_na_sentinel=False)
+        codigos = np.fromiter((self._codificar_um(campo, valor) for valor in distintos),
+                              dtype=np.int32, count=len(distintos))
+        return codigos[fatores]
+
+    def _codificar_um(self, campo: str, valor) -> int:
+        valor = "" if valor is None else str(valor)
+        tabela = self._tabela_codigos(campo)
+        codigo = tabela.get(valor)
+        if codigo is None:
+            categorias = self._categorias[campo]
+            codigo = tabela[valor] = len(categorias)
+            categorias.append(valor)
+        return codigo
+
+    def _tabela_codigos(self, campo: str) -> Dict[str, int]:
+        tabela = self._codigos_categoria[campo]
+        if tabela is None:
+            valores = self._categorias[campo]
+            tabela = self._codigos_categoria[campo] = dict(zip(valores, range(len(valores))))
+        return tabela
+
+    # Leitura (sem trava: cada consulta usa uma foto dos segmentos)
+
+    def __len__(self) -> int:
+        selados, ativo = self._estado
+        return sum(segmento.n for segmento in selados) + ativo.n
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self[i] for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        selados, ativo = self._estado
+        for segmento in selados + (ativo,):
+            if indice < segmento.n:
+                return self._registros(segmento, np.array([indice]), segmento.n)[0]
+            indice -= segmento.n
+        raise IndexError("índice fora do histórico")
+
+    def __iter__(self) -> Iterator[Dict]:
+        selados, ativo = self._estado
+        for segmento in selados + (ativo,):
+            yield from self._registros(segmento, None, segmento.n)
+
+    def iterar(self, inicio: int = 0, fim: Optional[int] = None) -> Iterator[Dict]:
+        """Registros de ``inicio`` até ``fim`` (posições no log), montados um segmento por vez"""
+        selados, ativo = self._estado
+        fim = len(self) if fim is None else fim
+        base = 0
+        for segmento in selados + (ativo,):
+            n = segmento.n
+            if base + n > inicio and base < fim:
+                linhas = np.arange(max(inicio - base, 0), min(fim - base, n))
+                yield from self._registros(segmento, linhas, n)
+            base += n
+            if base >= fim:
+                break
+
+    def colunas(self, inicio: int = 0, fim: Optional[int] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """Colunas fixas (códigos, sem descrição) dos registros de ``inicio`` até ``fim``, por segmento"""
+        selados, ativo = self._estado
+        fim = len(self) if fim is None else fim
+        base = 0
+        for segmento in selados + (ativo,):
+            n = segmento.n
+            if base + n > inicio and base < fim:
+                trecho = slice(max(inicio - base, 0), min(fim - base, n))
+                yield {campo: coluna[trecho] for campo, coluna in segmento.colunas.items()}
+            base += n
+            if base >= fim:
+                break
+
+    def total_categoria(self, campo: str) -> int:
+        """Quantidade de valores distintos já registrados numa coluna de categoria"""
+        return len(self._categorias[campo])
+
+    def codigos_categoria(self, campo: str, valores: Sequence[str]) -> np.ndarray:
+        """Código de cada valor numa coluna de categoria (-1 para valores nunca registrados)"""
+        tabela = self._tabela_codigos(campo)
+        return np.fromiter((tabela.get(valor, -1) for valor in valores), dtype=np.int64,
+                           count=len(valores))
+
+    def _registros(self, segmento: SegmentoHistorico, linhas: Optional[np.ndarray],
+                   n: int) -> List[Dict]:
+        selecao = slice(0, n) if linhas is None else linhas
+        valores = {"descricao": segmento.descricoes(linhas, n)}
+        valores["data"] = formatar_epoca(segmento.colunas["data"][selecao])
+        for campo in COLUNAS_CATEGORIA:
+            categorias = self._categorias[campo]
+            valores[campo] = [categorias[c] for c in segmento.colunas[campo][selecao].tolist()]
+        for campo in ("quantidade", "delta"):
+            valores[campo] = segmento.colunas[campo][selecao].tolist()
+        for campo in COLUNAS_VALOR:
+            coluna = segmento.colunas[campo][selecao]
+            valores[campo] = np.where(np.isnan(coluna), None, coluna).tolist()
+        return [dict(zip(CAMPOS_REGISTRO, linha))
+                for linha in zip(*(valores[campo] for campo in CAMPOS_REGISTRO))]
+
+    def tipos(self) -> List[str]:
+        """Tipos de movimentação já registrados"""
+        return list(self._categorias["tipo"])
+
+    def usuarios(self) -> List[str]:
+        """Usuários que já registraram movimentações"""
+        return list(self._categorias["usuario"])
+
+    def quadro(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+               tipo: Optional[str] = None, usuario: Optional[str] = None) -> "pd.DataFrame":
+        """Registros filtrados como DataFrame tipado (data em datetime64, categorias).
+
+        Apenas os segmentos cujo intervalo de datas cruza [inicio, fim] são lidos.
+        """
+        return self._montar_quadro(list(self._partes(inicio, fim, tipo, usuario)))
+
+    def quadros(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                tipo: Optional[str] = None, usuario: Optional[str] = None) -> Iterator["pd.DataFrame"]:
+        """Os mesmos registros de ``quadro``, um DataFrame por segmento (exportação em blocos)"""
+        vazio = True
+        for parte in self._partes(inicio, fim, tipo, usuario):
+            vazio = False
+            yield self._montar_quadro([parte])
+        if vazio:
+            yield self._montar_quadro([])
+
+    def resumo(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+               tipo: Optional[str] = None, usuario: Optional[str] = None) -> Dict:
+        """Contagens dos registros filtrados, sem montá-los.
+
+        Retorna o total, a contagem e o volume movimentado (soma de ``|delta|``)
+        por tipo e o número de usuários distintos. Dias e horas inteiros do
+        período saem dos agregados; só as pontas que não fecham uma hora são
+        contadas nas colunas do log.
+        """
+        matriz = self._filtrar_matriz(self._matriz_periodo(inicio, fim), tipo, usuario)
+        registros = matriz[:, :, MEDIDAS.index("registros")]
+        tipos = registros.sum(axis=1)
+        volumes = matriz[:, :, MEDIDAS.index("volume")].sum(axis=1)
+        return {
+            "total": int(tipos.sum()),
+            "por_tipo": dict(zip(self.tipos(), tipos.tolist())),
+            "volume_por_tipo": dict(zip(self.tipos(), volumes.tolist())),
+            "usuarios": int(np.count_nonzero(registros.sum(axis=0))),
+        }
+
+    def tendencia(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                  tipo: Optional[str] = None, usuario: Optional[str] = None,
+                  granularidade: str = "dia", codigo: Optional[str] = None) -> "pd.DataFrame":
+        """Registros, volume e saldo por tipo em cada hora ou dia do período, lidos dos agregados.
+
+        Os baldes das pontas entram inteiros. Com ``codigo`` a série é a do
+        SKU, só por dia e sem filtro de usuário. Por hora, só os dias depois
+        do corte do arquivo. Retorna as colunas periodo, tipo e as de
+        ``MEDIDAS``, apenas para combinações com registros.
+        """
+        if granularidade not in GRANULARIDADES:
+            raise ValueError(f"Granularidade inválida: {granularidade}")
+        if codigo is not None and (granularidade != "dia" or usuario is not None):
+            raise ValueError("A tendência por SKU é só diária e não separa usuários")
+        import pandas as pd
+
+        segundos = GRANULARIDADES[granularidade]
+        primeiro = -(1 << 62) if inicio is None else int(para_epoca(inicio)) // segundos
+        ultimo = 1 << 62 if fim is None else int(para_epoca(fim)) // segundos + 1
+        self._resumos.atualizar(self)
+
+        numeros, tipos, valores = [], [], []
+        if codigo is None:
+            for numero, matriz in self._resumos.baldes(granularidade, primeiro, ultimo):
+                por_tipo = self._filtrar_matriz(matriz, tipo, usuario).sum(axis=1)
+                presentes = np.flatnonzero(por_tipo[:, MEDIDAS.index("registros")])
+                numeros.append(np.full(len(presentes), numero, dtype=np.int64))
+                tipos.append(presentes)
+                valores.append(por_tipo[presentes])
+        else:
+            linha = int(self.codigos_categoria("codigo", [codigo])[0])
+            filtro_tipo = None if tipo is None else int(self.codigos_categoria("tipo", [tipo])[0])
+            diarios = self._resumos.do_codigo(linha, primeiro, ultimo) if linha >= 0 else []
+            if self.arquivo is not None and self.arquivo.corte is not None:
+                # Dias anteriores ao corte: resumos diários do arquivo
+                arquivados = []
+                for dia, codigos, nomes_tipo, medidas in self.arquivo.resumos(
+                        primeiro, min(ultimo, self.arquivo.corte // SEGUNDOS_DIA)):
+                    codigos_tipo = self.codigos_categoria("tipo", nomes_tipo.tolist())
+                    escolhidos = (codigos == codigo) & (codigos_tipo >= 0)
+                    if escolhidos.any():
+                        arquivados.append((dia, codigos_tipo[escolhidos], medidas[escolhidos]))
+                diarios = arquivados + [d for d in diarios if d[0] >= self.arquivo.corte // SEGUNDOS_DIA]
+            for numero, codigos_tipo, medidas in diarios:
+                if filtro_tipo is not None:
+                    escolhidos = codigos_tipo == filtro_tipo
+                    codigos_tipo, medidas = codigos_tipo[escolhidos], medidas[escolhidos]
+                numeros.append(np.full(len(codigos_tipo), numero, dtype=np.int64))
+                tipos.append(codigos_tipo)
+                valores.append(medidas)
+
+        numeros = np.concatenate(numeros) if numeros else np.zeros(0, dtype=np.int64)
+        tipos = np.concatenate(tipos) if tipos else np.zeros(0, dtype=np.int64)
+        valores = np.concatenate(valores) if valores else np.zeros((0, len(MEDIDAS)), dtype=np.int64)
+        quadro = pd.DataFrame({
+            "periodo": (numeros * segundos).astype("datetime64[s]"),
+            "tipo": self._categorica("tipo", tipos, compactar=True),
+        })
+        for indice, medida in enumerate(MEDIDAS):
+            quadro[medida] = valores[:, indice]
+        return quadro
+
+    def pagina(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+               tipo: Optional[str] = None, usuario: Optional[str] = None,
+               ordem: str = "data", decrescente: bool = True,
+               deslocamento: int = 0, limite: int = 50) -> "pd.DataFrame":
+        """Uma página dos registros filtrados, ordenada por uma coluna de ``ORDENACOES_HISTORICO``.
+
+        Só as linhas da página são montadas. O log é cronológico, então a ordem
+        por data é a própria ordem de posição e dispensa qualquer ordenação.
+        """
+        if ordem not in ORDENACOES_HISTORICO:
+            raise ValueError(f"Ordenação inválida para o histórico: {ordem}")
+        selecoes = self._selecoes(inicio, fim, tipo, usuario)
+        tamanhos = [n if linhas is None else len(linhas) for _, linhas, n in selecoes]
+        base = np.concatenate([[0], np.cumsum(tamanhos, dtype=np.int64)])
+        total = int(base[-1])
+        if ordem == "data":
+            posicoes = np.arange(deslocamento, min(deslocamento + limite, total), dtype=np.int64)
+            if decrescente:
+                posicoes = total - 1 - posicoes
+        else:
+            posto = self._postos(ordem) if ordem in COLUNAS_CATEGORIA else None
+            chaves = [segmento.colunas[ordem][:n][slice(None) if linhas is None else linhas]
+                      for segmento, linhas, n in selecoes]
+            chaves = np.concatenate(chaves) if chaves else np.zeros(0, dtype=np.int64)
+            posicoes = pagina_ordenada(chaves if posto is None else posto[chaves],
+                                       deslocamento, limite, decrescente)
+
+        # Posição entre os filtrados -> segmento e linha dentro dele
+        qual = np.searchsorted(base, posicoes, side="right") - 1
+        partes, ordem_partes = [], []
+        for i in np.unique(qual).tolist():
+            segmento, linhas, n = selecoes[i]
+            escolhidas = np.flatnonzero(qual == i)
+            locais = posicoes[escolhidas] - base[i]
+            partes.append(self._parte(segmento, locais if linhas is None else linhas[locais], n))
+            ordem_partes.append(escolhidas)
+        quadro = self._montar_quadro(partes, compactar=True)
+        if partes:
+            quadro = quadro.iloc[np.argsort(np.concatenate(ordem_partes))].reset_index(drop=True)
+        return quadro
+
+    def _partes(self, inicio: Optional[datetime], fim: Optional[datetime],
+                tipo: Optional[str], usuario: Optional[str]) -> Iterator[Dict]:
+        for segmento, linhas, n in self._selecoes(inicio, fim, tipo, usuario):
+            yield self._parte(segmento, linhas, n)
+
+    def _parte(self, segmento: SegmentoHistorico, linhas: Optional[np.ndarray], n: int) -> Dict:
+        selecao = slice(None) if linhas is None else linhas
+        parte = {campo: np.asarray(coluna[:n][selecao]) for campo, coluna in segmento.colunas.items()}
+        parte["descricao"] = segmento.descricoes(linhas, n)
+        return parte
+
+    def _matriz_periodo(self, inicio: Optional[datetime], fim: Optional[datetime]) -> np.ndarray:
+        """Medidas do período por tipo × usuário: agregados nas horas inteiras, registros nas sobras.
+
+        Antes do corte do arquivo só há baldes diários: horas inteiras de lá
+        também são lidas registro a registro, do arquivo.
+        """
+        self._resumos.atualizar(self)
+        tipos, usuarios = len(self._categorias["tipo"]), len(self._categorias["usuario"])
+        limites = self._resumos.limites()
+        if limites is None:
+            return np.zeros((tipos, usuarios, len(MEDIDAS)), dtype=np.int64)
+        inicio_s = limites[0] if inicio is None else int(para_epoca(inicio))
+        fim_s = limites[1] if fim is None else int(para_epoca(fim)) + 1
+        sobras, (primeiro_dia, ultimo_dia), horas = decompor_periodo(inicio_s, fim_s)
+        corte = None if self.arquivo is None else self.arquivo.corte
+
+        matriz = self._resumos.somar("dia", primeiro_dia, ultimo_dia, tipos, usuarios)
+        for primeira, ultima in horas:
+            if corte is not None and primeira * SEGUNDOS_HORA < corte:
+                arquivadas = min(ultima * SEGUNDOS_HORA, corte)
+                sobras.append((primeira * SEGUNDOS_HORA, arquivadas))
+                primeira = arquivadas // SEGUNDOS_HORA
+            if primeira < ultima:
+                matriz += self._resumos.somar("hora", primeira, ultima, tipos, usuarios)
+        celulas = matriz.reshape(tipos * usuarios, len(MEDIDAS))
+        for comeco, final in sobras:
+            for codigos_tipo, codigos_usuario, delta in self._registros_periodo(comeco, final - 1):
+                # Registros de categorias surgidas depois da leitura das tabelas ficam de fora
+                conhecidos = ((codigos_tipo >= 0) & (codigos_tipo < tipos)
+                              & (codigos_usuario >= 0) & (codigos_usuario < usuarios))
+                celula = (codigos_tipo * usuarios + codigos_usuario)[conhecidos]
+                delta = delta[conhecidos]
+                for indice, pesos in enumerate((None, np.abs(delta), delta)):
+                    celulas[:, indice] += np.bincount(celula, weights=pesos,
+                                                      minlength=len(celulas)).astype(np.int64)
+        return matriz
+
+    def _registros_periodo(self, inicio: int, fim: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Tipo, usuário (códigos do log) e delta dos registros com data em [inicio, fim], do log e do arquivo"""
+        for segmento, linhas, n in self._selecoes_epoca(inicio, fim, {}):
+            selecao = slice(None) if linhas is None else linhas
+            colunas = segmento.colunas
+            yield (colunas["tipo"][:n][selecao].astype(np.int64),
+                   colunas["usuario"][:n][selecao].astype(np.int64), colunas["delta"][:n][selecao])
+        corte = None if self.arquivo is None else self.arquivo.corte
+        if corte is not None and inicio < corte:
+            for parte in self.arquivo.partes(inicio, fim):
+                tipos = self.codigos_categoria("tipo", parte["categorias_tipo"].tolist())
+                usuarios = self.codigos_categoria("usuario", parte["categorias_usuario"].tolist())
+                yield tipos[parte["tipo"]], usuarios[parte["usuario"]], parte["delta"]
+
+    def _filtrar_matriz(self, matriz: np.ndarray, tipo: Optional[str],
+                        usuario: Optional[str]) -> np.ndarray:
+        """Zera as células de tipo × usuário fora dos filtros"""
+        for eixo, campo, valor in ((0, "tipo", tipo), (1, "usuario", usuario)):
+            if valor is not None:
+                escolhido = np.arange(matriz.shape[eixo]) == self._tabela_codigos(campo).get(valor, -1)
+                matriz = matriz * (escolhido[:, None, None] if eixo == 0 else escolhido[None, :, None])
+        return matriz
+
+    def _selecoes(self, inicio: Optional[datetime], fim: Optional[datetime],
+                  tipo: Optional[str], usuario: Optional[str]
+                  ) -> List[Tuple[SegmentoHistorico, Optional[np.ndarray], int]]:
+        """Segmentos com registros nos filtros e suas linhas (None: todas as n primeiras)"""
+        inicio_s = None if inicio is None else int(para_epoca(inicio))
+        fim_s = None if fim is None else int(para_epoca(fim))
+        filtros = {}
+        for campo, valor in (("tipo", tipo), ("usuario", usuario)):
+            if valor is not None:
+                filtros[campo] = self._tabela_codigos(campo).get(valor, -1)
+        return self._selecoes_epoca(inicio_s, fim_s, filtros)
+
+    def _selecoes_epoca(self, inicio_s: Optional[int], fim_s: Optional[int], filtros: Dict[str, int]
+                        ) -> List[Tuple[SegmentoHistorico, Optional[np.ndarray], int]]:
+        """``_selecoes`` com o período em segundos (inclusivo) e os filtros já codificados"""
+        selecoes = []
+        selados, ativo = self._estado
+        for segmento in selados + (ativo,):
+            n = segmento.n
+            if not segmento.cruza(inicio_s, fim_s):
+                continue
+            if inicio_s is None and fim_s is None and not filtros:
+                selecoes.append((segmento, None, n))
+                continue
+            colunas = segmento.colunas
+            mascara = np.ones(n, dtype=bool)
+            if inicio_s is not None:
+                mascara &= colunas["data"][:n] >= inicio_s
+            if fim_s is not None:
+                mascara &= colunas["data"][:n] <= fim_s
+            for campo, codigo in filtros.items():
+                mascara &= colunas[campo][:n] == codigo
+            linhas = None if mascara.all() else np.flatnonzero(mascara)
+            if linhas is None or len(linhas):
+                selecoes.append((segmento, linhas, n))
+        return selecoes
+
+    def _montar_quadro(self, partes: List[Dict], compactar: bool = False) -> "pd.DataFrame":
+        import pandas as pd
+
+        dados = {campo: np.concatenate([p[campo] for p in partes]) if partes
+                 else np.zeros(0, dtype=COLUNAS_FIXAS[campo]) for campo in COLUNAS_FIXAS}
+        descricoes = [d for p in partes for d in p["descricao"]]
+        return pd.DataFrame({
+            "data": dados["data"].astype("datetime64[s]"),
+            "tipo": self._categorica("tipo", dados["tipo"], compactar),
+            "codigo": self._categorica("codigo", dados["codigo"], compactar),
+            "descricao": descricoes,
+            "quantidade": dados["quantidade"],
+            "usuario": self._categorica("usuario", dados["usuario"], compactar),
+            "delta": dados["delta"],
+            "campo": self._categorica("campo", dados["campo"], compactar),
+            "valor_anterior": dados["valor_anterior"],
+            "valor_novo": dados["valor_novo"],
+        })
+
+    def _categorica(self, campo: str, codigos: np.ndarray, compactar: bool) -> "pd.Categorical":
+        import pandas as pd
+
+        categorias = self._categorias[campo]
+        if compactar:
+            # Poucas linhas (uma página): só os valores presentes viram categorias
+            usados, codigos = np.unique(codigos, return_inverse=True)
+            categorias = [categorias[c] for c in usados.tolist()]
+        return pd.Categorical.from_codes(codigos, categories=list(categorias))
+
+    def _postos(self, campo: str) -> np.ndarray:
+        """Posto alfabético de cada código de categoria (refeito só quando surgem valores novos)"""
+        categorias = self._categorias[campo]
+        total, postos_campo = self._postos_categoria.get(campo, (-1, None))
+        if total != len(categorias):
+            total = len(categorias)
+            postos_campo = postos(categorias[:total])
+            self._postos_categoria[campo] = (total, postos_campo)
+        return postos_campo
@@ -0,0 +1,178 @@
+"""Importação em blocos do catálogo de itens (CSV ou Excel).
+
+O arquivo é lido em blocos de tamanho fixo, sem carregar tudo na memória, e
+cada bloco é validado de forma vetorizada com as mesmas regras do formulário
+de cadastro: campos obrigatórios, unidade conhecida, limites de tamanho dos
+textos, números não negativos, mínimo menor que o máximo e quantidade que não
+ultrapassa o máximo.
+"""
+import io
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from indice_busca import normalizar
+
+COLUNAS_CATALOGO = ["codigo", "descricao", "unidade", "quantidade", "minimo", "maximo",
+                    "localizacao", "fornecedor", "valor_unitario"]
+
+# Cabeçalhos aceitos (normalizados): nomes internos e rótulos do relatório/formulário
+ROTULOS = {
+    "codigo": "codigo", "descricao": "descricao", "unidade": "unidade",
+    "quantidade": "quantidade", "quantidade inicial": "quantidade",
+    "minimo": "minimo", "estoque minimo": "minimo",
+    "maximo": "maximo", "estoque maximo": "maximo",
+    "localizacao": "localizacao", "fornecedor": "fornecedor",
+    "valor_unitario": "valor_unitario", "valor unit.": "valor_unitario",
+    "valor unitario": "valor_unitario", "valor unitario (r$)": "valor_unitario",
+}
+
+UNIDADES = ["PÇ", "UN", "CX", "KG", "M", "L"]
+
+# Tamanho máximo dos textos (o mesmo max_chars do formulário)
+LIMITES_TEXTO = {"codigo": 10, "descricao": 100, "fornecedor": 50, "localizacao": 20}
+
+CAMPOS_OBRIGATORIOS = ["codigo", "descricao", "unidade", "fornecedor", "localizacao"]
+
+TAMANHO_BLOCO = 20000
+
+
+def ler_blocos(arquivo: Union[str, io.IOBase], nome: str, tamanho_bloco: int = TAMANHO_BLOCO,
+               progresso: Optional[Callable[[float], None]] = None) -> Iterator[pd.DataFrame]:
+    """Lê o catálogo em blocos de linhas (CSV pelo pandas, Excel pelo openpyxl em modo streaming).
+
+    O índice de cada bloco é o número da linha no arquivo (o cabeçalho é a
+    linha 1). ``progresso`` recebe a fração já processada sempre que o
+    consumidor pede o bloco seguinte.
+    """
+    if nome.lower().endswith((".xlsx", ".xlsm")):
+        blocos = _ler_blocos_excel(arquivo, tamanho_bloco)
+    else:
+        blocos = _ler_blocos_csv(arquivo, tamanho_bloco)
+    for bloco, fracao in blocos:
+        yield _preparar_bloco(bloco)
+        if progresso is not None:
+            progresso(fracao)
+
+
+def _ler_blocos_csv(arquivo, tamanho_bloco: int) -> Iterator[Tuple[pd.DataFrame, float]]:
+    if isinstance(arquivo, str):
+        arquivo = open(arquivo, "rb")
+    arquivo.seek(0, io.SEEK_END)
+    tamanho = arquivo.tell() or 1
+    arquivo.seek(0)
+    primeira = arquivo.readline()
+    arquivo.seek(0)
+    if isinstance(primeira, bytes):
+        primeira = primeira.decode("utf-8-sig", errors="replace")
+    separador = ";" if ";" in primeira else "\t" if "\t" in primeira else ","
+
+    try:
+        leitor = pd.read_csv(arquivo, sep=separador, dtype=str, keep_default_na=False,
+                             chunksize=tamanho_bloco, encoding="utf-8-sig", skipinitialspace=True)
+        inicio = 2
+        for bloco in leitor:
+            bloco.index = pd.RangeIndex(inicio, inicio + len(bloco))
+            inicio += len(bloco)
+            yield bloco, min(1.0, arquivo.tell() / tamanho)
+    except pd.errors.ParserError as e:
+        raise ValueError(f"Arquivo com formato inválido: {e}") from e
+
+
+def _ler_blocos_excel(arquivo, tamanho_bloco: int) -> Iterator[Tuple[pd.DataFrame, float]]:
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise ValueError("A importação de Excel requer o pacote openpyxl.") from e
+
+    planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        aba = planilha.active
+        total = max(aba.max_row or 1, 1)
+        linhas = aba.iter_rows(values_only=True)
+        cabecalho = [str(c) if c is not None else "" for c in next(linhas, ())]
+        inicio = 2
+        while True:
+            lote = []
+            for linha in linhas:
+                lote.append(linha)
+                if len(lote) == tamanho_bloco:
+                    break
+            if not lote:
+                break
+            bloco = pd.DataFrame(lote, columns=cabecalho[:len(lote[0])] if cabecalho else None,
+                                 index=pd.RangeIndex(inicio, inicio + len(lote)))
+            inicio += len(lote)
+            yield bloco, min(1.0, inicio / total)
+    finally:
+        planilha.close()
+
+
+def _preparar_bloco(bloco: pd.DataFrame) -> pd.DataFrame:
+    colunas = {coluna: ROTULOS.get(normalizar(coluna).strip()) for coluna in bloco.columns}
+    bloco = bloco.rename(columns={c: campo for c, campo in colunas.items() if campo})
+    faltando = [campo for campo in COLUNAS_CATALOGO if campo not in bloco.columns]
+    if faltando:
+        raise ValueError(f"Colunas ausentes no arquivo: {', '.join(faltando)}")
+    return bloco[COLUNAS_CATALOGO]
+
+
+def _numeros(coluna: pd.Series) -> pd.Series:
+    valores = pd.to_numeric(coluna, errors="coerce")
+    # Só os valores não reconhecidos passam pela troca de vírgula decimal por ponto
+    pendentes = valores.isna() & coluna.notna() & (coluna != "")
+    if pendentes.any():
+        valores[pendentes] = pd.to_numeric(
+            coluna[pendentes].astype(str).str.replace(",", ".", regex=False), errors="coerce")
+    return valores
+
+
+def _textos(coluna: pd.Series) -> List[str]:
+    return [v.strip() if isinstance(v, str) else "" if v is None else str(v).strip()
+            for v in coluna.tolist()]
+
+
+def validar_bloco(bloco: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Valida um bloco do catálogo.
+
+    Retorna os itens com colunas tipadas (textos limpos, números inteiros e
+    valor em float) e o motivo da recusa de cada linha ("" para linhas
+    válidas). Quando uma linha viola várias regras, vale a primeira na ordem
+    do formulário.
+    """
+    n = len(bloco)
+    textos = {campo: _textos(bloco[campo])
+              for campo in ("codigo", "descricao", "unidade", "localizacao", "fornecedor")}
+    textos["unidade"] = [unidade.upper() for unidade in textos["unidade"]]
+    numeros = {campo: _numeros(bloco[campo])
+               for campo in ("quantidade", "minimo", "maximo", "valor_unitario")}
+
+    motivo = np.full(n, "", dtype=object)
+    # Atribuídas da última para a primeira regra: a de maior precedência prevalece
+    inteiros_validos = np.ones(n, dtype=bool)
+    for campo in ("quantidade", "minimo", "maximo"):
+        valores = numeros[campo]
+        inteiros_validos &= (valores.notna() & (valores >= 0) & (valores % 1 == 0)).to_numpy()
+    quantidade = numeros["quantidade"].fillna(0).to_numpy()
+    minimo = numeros["minimo"].fillna(0).to_numpy()
+    maximo = numeros["maximo"].fillna(0).to_numpy()
+    motivo[quantidade > maximo] = "Quantidade inicial maior que o estoque máximo"
+    motivo[minimo >= maximo] = "Estoque mínimo deve ser menor que o máximo"
+    valor_valido = (numeros["valor_unitario"].notna() & (numeros["valor_unitario"] >= 0)).to_numpy()
+    motivo[~(inteiros_validos & valor_valido)] = "Número inválido"
+    tamanhos = {campo: np.fromiter(map(len, textos[campo]), dtype=np.int64, count=n)
+                for campo in CAMPOS_OBRIGATORIOS}
+    for campo, limite in LIMITES_TEXTO.items():
+        motivo[tamanhos[campo] > limite] = f"Campo {campo} acima de {limite} caracteres"
+    motivo[~np.isin(np.array(textos["unidade"], dtype=object), UNIDADES)] = "Unidade inválida"
+    vazio = np.zeros(n, dtype=bool)
+    for campo in CAMPOS_OBRIGATORIOS:
+        vazio |= tamanhos[campo] == 0
+    motivo[vazio] = "Campos obrigatórios vazios"
+
+    itens = pd.DataFrame(textos, index=bloco.index)
+    for campo in ("quantidade", "minimo", "maximo"):
+        itens[campo] = np.where(inteiros_validos, numeros[campo].fillna(0), 0).astype(np.int64)
+    itens["valor_unitario"] = numeros["valor_unitario"].fillna(0.0).astype(np.float64).to_numpy()
+    return itens[COLUNAS_CATALOGO], motivo
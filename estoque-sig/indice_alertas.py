@@ -0,0 +1,139 @@
+"""Índice de alertas de estoque mantido incrementalmente.
+
+Cada item fica em no máximo um balde (crítico, baixo, reposição ou excesso),
+atualizado quando quantidade, mínimo ou máximo mudam. Consultar os itens de
+um status custa proporcional ao resultado, e os itens mais urgentes saem de
+um heap ordenado pela razão quantidade/mínimo.
+"""
+import heapq
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from estoque_colunar import EstoqueColunar
+
+STATUS_ALERTA = ("critico", "baixo", "reposicao", "excesso")
+
+# Status que entram na fila de urgência de reposição
+STATUS_URGENTES = ("critico", "baixo", "reposicao")
+
+
+def classificar_alerta(qtd: int, minimo: int, maximo: int) -> Optional[str]:
+    """Retorna o status de alerta do item (ou None se estiver normal)"""
+    if qtd == 0:
+        return "critico"
+    elif qtd < minimo:
+        return "baixo"
+    elif qtd < minimo * 1.2:
+        return "reposicao"
+    elif qtd > maximo:
+        return "excesso"
+    return None
+
+
+def classificar_alertas(qtd: np.ndarray, minimo: np.ndarray, maximo: np.ndarray) -> np.ndarray:
+    """Versão vetorizada de ``classificar_alerta``: posição em ``STATUS_ALERTA`` (-1 se normal)"""
+    return np.select([qtd == 0, qtd < minimo, qtd < minimo * 1.2, qtd > maximo],
+                     list(range(len(STATUS_ALERTA))), -1)
+
+
+def razao_urgencia(qtd: int, minimo: int) -> float:
+    """Razão quantidade/mínimo usada para ordenar a urgência"""
+    return qtd / minimo if minimo > 0 else 0.0
+
+
+class IndiceAlertas:
+    """Baldes de alerta por status e fila de urgência"""
+
+    def __init__(self):
+        self._zerar()
+
+    def _zerar(self):
+        # dict usado como conjunto ordenado por ordem de entrada no balde
+        self._baldes: Dict[str, Dict[str, None]] = {status: {} for status in STATUS_ALERTA}
+        self._status: Dict[str, str] = {}
+        # Heap (razão, sequência, código) com remoção preguiçosa
+        self._heap: List[Tuple[float, int, str]] = []
+        self._razao: Dict[str, Tuple[float, int]] = {}
+        self._seq = 0
+
+    def reconstruir(self, estoque: Mapping):
+        """Reclassifica todo o estoque (carga inicial ou restauração)"""
+        self._zerar()
+        if isinstance(estoque, EstoqueColunar):
+            qtd = estoque.coluna("quantidade")
+            minimo = estoque.coluna("minimo")
+            maximo = estoque.coluna("maximo")
+            # Só os itens em alerta passam pelo caminho item a item
+            em_alerta = classificar_alertas(qtd, minimo, maximo) >= 0
+            codigos = estoque.codigos()
+            for linha in np.flatnonzero(em_alerta):
+                self.atualizar(codigos[linha], int(qtd[linha]),
+                               int(minimo[linha]), int(maximo[linha]))
+        else:
+            for codigo, item in estoque.items():
+                self.atualizar(codigo, item["quantidade"], item["minimo"], item["maximo"])
+
+    def atualizar(self, codigo: str, qtd: int, minimo: int, maximo: int):
+        """Reposiciona o item após mudança de quantidade, mínimo ou máximo"""
+        novo = classificar_alerta(qtd, minimo, maximo)
+        atual = self._status.get(codigo)
+        if novo != atual:
+            if atual is not None:
+                del self._baldes[atual][codigo]
+                del self._status[codigo]
+            if novo is not None:
+                self._baldes[novo][codigo] = None
+                self._status[codigo] = novo
+
+        if novo in STATUS_URGENTES:
+            razao = razao_urgencia(qtd, minimo)
+            anterior = self._razao.get(codigo)
+            if anterior is None or anterior[0] != razao:
+                self._seq += 1
+                self._razao[codigo] = (razao, self._seq)
+                heapq.heappush(self._heap, (razao, self._seq, codigo))
+        else:
+            self._razao.pop(codigo, None)
+        self._compactar_heap()
+
+    def remover(self, codigo: str):
+        """Retira o item do índice"""
+        atual = self._status.pop(codigo, None)
+        if atual is not None:
+            del self._baldes[atual][codigo]
+        self._razao.pop(codigo, None)
+        self._compactar_heap()
+
+    def status(self, codigo: str) -> Optional[str]:
+        """Status de alerta atual do item"""
+        return self._status.get(codigo)
+
+    def itens(self, status: str) -> List[str]:
+        """Códigos no balde do status informado"""
+        return list(self._baldes[status])
+
+    def contagem(self, status: str) -> int:
+        """Quantidade de itens no balde"""
+        return len(self._baldes[status])
+
+    def mais_urgentes(self, n: int) -> List[str]:
+        """Os n itens com menor razão quantidade/mínimo, do mais urgente ao menos"""
+        resultado = []
+        validos = []
+        while self._heap and len(resultado) < n:
+            entrada = heapq.heappop(self._heap)
+            razao, seq, codigo = entrada
+            if self._razao.get(codigo) == (razao, seq):
+                resultado.append(codigo)
+                validos.append(entrada)
+        # Devolve as entradas válidas ao heap; as obsoletas ficam descartadas
+        for entrada in validos:
+            heapq.heappush(self._heap, entrada)
+        return resultado
+
+    def _compactar_heap(self):
+        # Evita que entradas obsoletas dominem o heap
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._razao):
+            self._heap = [(razao, seq, codigo) for codigo, (razao, seq) in self._razao.items()]
+            heapq.heapify(self._heap)
@@ -0,0 +1,298 @@
+"""Índice invertido de trigramas para busca por código e descrição.
+
+Textos são normalizados (sem acentos, minúsculos) antes da indexação, de modo
+que "abracadeira" encontra "ABRAÇADEIRA". Cada trigrama (de bytes UTF-8 do
+texto normalizado) aponta para as linhas que o contêm:
+
+- a base fica em arrays NumPy no formato CSR (trigramas ordenados, início de
+  cada lista e linhas), construída de forma vetorizada;
+- itens adicionados ou alterados depois da construção entram num delta em
+  dicionários, e a versão antiga da linha é apenas desativada;
+- quando o delta cresce demais, a base é reconstruída a partir das linhas
+  ativas.
+
+A busca intersecta as listas dos trigramas do termo, confirma a ocorrência
+por substring e ordena os resultados por relevância.
+"""
+import re
+import unicodedata
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+TAMANHO_NGRAMA = 3
+
+# Separadores usados na construção vetorizada (não aparecem em texto normalizado)
+_SEP_CAMPO = "\x00"
+_SEP_LINHA = "\x01"
+
+
+# Marcas diacríticas combinantes que sobram após a decomposição NFKD
+_DIACRITICOS = re.compile("[\u0300-\u036f]")
+
+
+def normalizar(texto: str) -> str:
+    """Remove acentos e converte para minúsculas"""
+    texto = str(texto)
+    if texto.isascii():
+        return texto.lower()
+    return _DIACRITICOS.sub("", unicodedata.normalize("NFKD", texto)).casefold()
+
+
+def ngramas(texto: str) -> Set[int]:
+    """Trigramas (como inteiros de 24 bits) dos bytes UTF-8 de um texto normalizado"""
+    b = texto.encode("utf-8")
+    return {(b[i] << 16) | (b[i + 1] << 8) | b[i + 2]
+            for i in range(len(b) - TAMANHO_NGRAMA + 1)}
+
+
+class IndiceBusca:
+    """Índice de trigramas sobre código e descrição dos itens"""
+
+    def __init__(self):
+        self._zerar()
+
+    @property
+    def _linha(self) -> Dict[str, int]:
+        """Código -> linha do índice"""
+        if self._mapa_linhas is None:
+            self._mapa_linhas = dict(zip(self._codigos, range(len(self._codigos))))
+        return self._mapa_linhas
+
+    @_linha.setter
+    def _linha(self, linhas: Dict[str, int]):
+        self._mapa_linhas = linhas
+
+    def _zerar(self):
+        # Textos normalizados e código de cada linha do índice
+        self._codigos: List[str] = []
+        self._cod_norm: List[str] = []
+        self._desc_norm: List[str] = []
+        self._ativa = np.zeros(0, dtype=bool)
+        self._linha: Dict[str, int] = {}
+        # Base CSR: listas de linhas por trigrama
+        self._gramas = np.zeros(0, dtype=np.uint32)
+        self._inicio = np.zeros(1, dtype=np.int64)
+        self._linhas_base = np.zeros(0, dtype=np.int32)
+        self._n_base = 0
+        # Texto concatenado da base, usado para termos curtos demais para trigramas
+        self._texto_base = ""
+        self._inicio_linhas = np.zeros(0, dtype=np.int64)
+        # Delta: trigrama -> linhas adicionadas após a última construção
+        self._delta: Dict[int, Set[int]] = {}
+
+    def reconstruir(self, codigos: List[str], descricoes: List[str]):
+        """Indexa novamente todos os itens (listas alinhadas de códigos e descrições)"""
+        self._zerar()
+        self._codigos = list(codigos)
+        self._linha = dict(zip(self._codigos, range(len(self._codigos))))
+        # Normaliza tudo de uma vez (uma única passada sobre o texto concatenado)
+        if self._codigos:
+            self._cod_norm = normalizar(_SEP_LINHA.join(self._codigos)).split(_SEP_LINHA)
+            self._desc_norm = normalizar(
+                _SEP_LINHA.join(map(str, descricoes)).replace(_SEP_CAMPO, " ")
+            ).split(_SEP_LINHA)
+        self._construir_base()
+
+    def _construir_base(self):
+        n = len(self._codigos)
+        self._n_base = n
+        self._ativa = np.ones(n, dtype=bool)
+        self._delta = {}
+        self._texto_base = ""
+        self._inicio_linhas = np.zeros(0, dtype=np.int64)
+        if n == 0:
+            self._gramas = np.zeros(0, dtype=np.uint32)
+            self._inicio = np.zeros(1, dtype=np.int64)
+            self._linhas_base = np.zeros(0, dtype=np.int32)
+            return
+
+        texto = _SEP_LINHA.join(c + _SEP_CAMPO + d
+                                for c, d in zip(self._cod_norm, self._desc_norm))
+        self._texto_base = texto
+        tamanhos = np.fromiter((len(c) + len(d) + 2 for c, d in
+                                zip(self._cod_norm, self._desc_norm)), dtype=np.int64, count=n)
+        self._inicio_linhas = np.concatenate([[0], np.cumsum(tamanhos)[:-1]])
+        b = np.frombuffer(texto.encode("utf-8"), dtype=np.uint8)
+        linha_do_byte = np.cumsum(b == ord(_SEP_LINHA), dtype=np.int64)
+
+        # Trigramas que não atravessam separadores
+        separador = b <= 1
+        validos = ~(separador[:-2] | separador[1:-1] | separador[2:])
+        b32 = b.astype(np.uint32)
+        gramas = ((b32[:-2] << 16) | (b32[1:-1] << 8) | b32[2:])[validos]
+        linhas = linha_do_byte[:-2][validos]
+
+        chaves = np.unique((gramas.astype(np.uint64) << np.uint64(32)) | linhas.astype(np.uint64))
+        gramas = (chaves >> np.uint64(32)).astype(np.uint32)
+        self._linhas_base = (chaves & np.uint64(0xFFFFFFFF)).astype(np.int32)
+        self._gramas, inicio = np.unique(gramas, return_index=True)
+        self._inicio = np.append(inicio, len(gramas)).astype(np.int64)
+
+    def exportar_base(self) -> Dict:
+        """Estado do índice como base CSR consolidada (para snapshot)"""
+        if self._delta or len(self._codigos) != len(self._linha):
+            self._consolidar()
+        return {"codigos": self._codigos, "cod_norm": self._cod_norm,
+                "desc_norm": self._desc_norm, "gramas": self._gramas, "inicio": self._inicio,
+                "linhas": self._linhas_base, "inicio_linhas": self._inicio_linhas}
+
+    @classmethod
+    def de_base(cls, codigos: Sequence[str], cod_norm: Sequence[str], desc_norm: Sequence[str],
+                gramas: np.ndarray, inicio: np.ndarray, linhas: np.ndarray,
+                inicio_linhas: np.ndarray) -> "IndiceBusca":
+        """Recria o índice a partir de uma base exportada, sem reindexar os textos"""
+        indice = cls()
+        indice._codigos = codigos
+        # Montado só no primeiro uso (ver _linha)
+        indice._mapa_linhas = None
+        indice._cod_norm = cod_norm
+        indice._desc_norm = desc_norm
+        indice._n_base = len(codigos)
+        indice._ativa = np.ones(len(codigos), dtype=bool)
+        indice._gramas, indice._inicio, indice._linhas_base = gramas, inicio, linhas
+        indice._inicio_linhas = inicio_linhas
+        indice._texto_base = None
+        return indice
+
+    def adicionar(self, codigo: str, descricao: str):
+        """Indexa um item (a versão anterior, se houver, é desativada)"""
+        anterior = self._linha.get(codigo)
+        if anterior is not None:
+            self._ativa[anterior] = False
+
+        linha = len(self._codigos)
+        self._linha[codigo] = linha
+        self._codigos.append(codigo)
+        self._cod_norm.append(normalizar(codigo))
+        self._desc_norm.append(normalizar(descricao))
+        if linha >= len(self._ativa):
+            self._ativa = np.concatenate([self._ativa, np.zeros(max(1024, linha), dtype=bool)])
+        self._ativa[linha] = True
+
+        for grama in ngramas(self._cod_norm[linha]) | ngramas(self._desc_norm[linha]):
+            self._delta.setdefault(grama, set()).add(linha)
+
+        # Linhas no delta mais versões desativadas na base
+        if len(self._codigos) - self._n_base > max(10000, self._n_base // 10):
+            self._consolidar()
+
+    def atualizar(self, codigo: str, descricao: str):
+        """Reindexa o item após mudança de descrição"""
+        self.adicionar(codigo, descricao)
+
+    def remover(self, codigo: str):
+        """Retira o item do índice"""
+        linha = self._linha.pop(codigo, None)
+        if linha is not None:
+            self._ativa[linha] = False
+
+    def _consolidar(self):
+        # Reconstrói a base apenas com as linhas ativas
+        ativas = [(self._codigos[linha], linha) for linha in self._linha.values()]
+        ativas.sort(key=lambda par: par[1])
+        cod_norm = [self._cod_norm[linha] for _, linha in ativas]
+        desc_norm = [self._desc_norm[linha] for _, linha in ativas]
+        self._codigos = [codigo for codigo, _ in ativas]
+        self._linha = {codigo: i for i, codigo in enumerate(self._codigos)}
+        self._cod_norm = cod_norm
+        self._desc_norm = desc_norm
+        self._construir_base()
+
+    def _candidatos(self, termo: str) -> Iterable[int]:
+        gramas = ngramas(termo)
+        listas = []
+        for grama in gramas:
+            posicao = np.searchsorted(self._gramas, grama)
+            if posicao < len(self._gramas) and self._gramas[posicao] == grama:
+                listas.append(self._linhas_base[self._inicio[posicao]:self._inicio[posicao + 1]])
+            else:
+                listas.append(self._linhas_base[:0])
+        listas.sort(key=len)
+        base = listas[0]
+        for lista in listas[1:]:
+            if not len(base):
+                break
+            base = np.intersect1d(base, lista, assume_unique=True)
+        base = base[self._ativa[base]]
+
+        delta = None
+        for grama in gramas:
+            linhas = self._delta.get(grama)
+            if not linhas:
+                delta = set()
+                break
+            delta = set(linhas) if delta is None else delta & linhas
+        delta = [linha for linha in (delta or ()) if self._ativa[linha]]
+
+        return base.tolist() + delta
+
+    def _candidatos_curtos(self, termo: str) -> Iterable[int]:
+        # Ocorrências no texto concatenado da base (busca em C) mapeadas para
+        # linhas; o delta, pequeno, é conferido inteiro na ordenação
+        if self._texto_base is None:
+            # Base vinda de snapshot: o texto concatenado só é montado no primeiro uso
+            self._texto_base = _SEP_LINHA.join(
+                c + _SEP_CAMPO + d for c, d in islice(zip(self._cod_norm, self._desc_norm),
+                                                      self._n_base))
+        posicoes = np.fromiter((m.start() for m in re.finditer(re.escape(termo), self._texto_base)),
+                               dtype=np.int64)
+        base = np.unique(np.searchsorted(self._inicio_linhas, posicoes, side="right") - 1)
+        base = base[self._ativa[base]]
+        delta = [linha for linha in range(self._n_base, len(self._codigos)) if self._ativa[linha]]
+        return base.tolist() + delta
+
+    def buscar(self, termo: str, limite: Optional[int] = None) -> List[str]:
+        """Retorna os códigos que contêm o termo, do mais ao menos relevante"""
+        termo = normalizar(termo).strip()
+        if not termo:
+            return []
+
+        if len(termo.encode("utf-8")) < TAMANHO_NGRAMA:
+            # Termos curtos não têm trigramas
+            candidatos = self._candidatos_curtos(termo)
+        else:
+            candidatos = self._candidatos(termo)
+
+        linhas = np.fromiter(candidatos, dtype=np.int64)
+        if not len(linhas):
+            return []
+        ordem = self._ordenar(termo, linhas)
+        if limite is not None:
+            ordem = ordem[:limite]
+        return [self._codigos[linha] for linha in ordem.tolist()]
+
+    def _ordenar(self, termo: str, linhas: np.ndarray) -> np.ndarray:
+        # Relevância (menor é melhor): 0 código exato, 1 prefixo do código,
+        # 2 código contém, 3 início da descrição, 4 início de palavra da
+        # descrição, 5 descrição contém; desempate pela posição e pela linha
+        indices = linhas.tolist()
+        cods = [self._cod_norm[i] for i in indices]
+        descs = [self._desc_norm[i] for i in indices]
+        lista_desc = [d.find(termo) for d in descs]
+        pos_cod = np.array([c.find(termo) for c in cods], dtype=np.int64)
+        pos_desc = np.array(lista_desc, dtype=np.int64)
+
+        nivel = np.full(len(linhas), 5, dtype=np.int64)
+        chave = pos_desc.copy()
+        no_meio = np.flatnonzero(pos_desc > 0)
+        inicio_palavra = np.array([not descs[i][lista_desc[i] - 1].isalnum()
+                                   for i in no_meio.tolist()], dtype=bool)
+        nivel[no_meio[inicio_palavra]] = 4
+        nivel[pos_desc == 0] = 3
+
+        contem = pos_cod > 0
+        nivel[contem] = 2
+        chave[contem] = pos_cod[contem]
+        prefixo = np.flatnonzero(pos_cod == 0)
+        tamanho = np.array([len(cods[i]) for i in prefixo.tolist()], dtype=np.int64)
+        nivel[prefixo] = np.where(tamanho == len(termo), 0, 1)
+        chave[prefixo] = np.where(tamanho == len(termo), 0, tamanho)
+
+        encontrados = (pos_cod >= 0) | (pos_desc >= 0)
+        linhas, nivel, chave = linhas[encontrados], nivel[encontrados], chave[encontrados]
+        return linhas[np.lexsort((linhas, chave, nivel))]
+
+    def __len__(self) -> int:
+        return len(self._linha)
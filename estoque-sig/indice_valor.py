@@ -0,0 +1,110 @@
+"""Ranking dos itens por valor em estoque (quantidade × valor unitário).
+
+Heaps de máximo com remoção preguiçosa, como a fila de urgência do índice de
+alertas: um para o catálogo todo e um por fornecedor e por localização. Cada
+mudança de quantidade, preço ou grupo de um item empilha a entrada nova em
+O(log n); as antigas são descartadas quando chegam ao topo e não conferem
+mais com o estoque. Os K maiores saem em O(K log n), sem percorrer o catálogo.
+
+Os heaps são montados na primeira consulta (os de um campo de grupo, na
+primeira consulta por aquele campo) a partir do estoque informado em
+``reconstruir``; até lá as atualizações não custam nada.
+"""
+import heapq
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from estoque_colunar import EstoqueColunar
+
+# Campos com ranking próprio por valor do campo
+GRUPOS_VALOR = ("fornecedor", "localizacao")
+
+# Entrada de heap: (-valor, código)
+Entrada = Tuple[float, str]
+
+
+def valor_item(item: Mapping) -> float:
+    """Valor em estoque do item (mesma conta usada na montagem dos heaps)"""
+    return float(item["quantidade"]) * float(item["valor_unitario"])
+
+
+class IndiceValor:
+    """Maiores itens por valor, no catálogo e por fornecedor/localização"""
+
+    def __init__(self):
+        self.reconstruir({})
+
+    def reconstruir(self, estoque: Mapping):
+        """Descarta os heaps; serão remontados do estoque na próxima consulta"""
+        self._estoque = estoque
+        self._geral: Optional[List[Entrada]] = None
+        self._grupos: Dict[str, Dict[str, List[Entrada]]] = {}
+        self._empilhadas = 0
+
+    def atualizar(self, codigo: str, item: Mapping):
+        """Empilha a entrada atual do item após mudança de quantidade, preço ou grupo"""
+        if self._geral is None and not self._grupos:
+            return
+        # Muitas entradas obsoletas: sai mais barato remontar na próxima consulta
+        self._empilhadas += 1
+        if self._empilhadas > max(1024, len(self._estoque)):
+            self.reconstruir(self._estoque)
+            return
+        entrada = (-valor_item(item), codigo)
+        if self._geral is not None:
+            heapq.heappush(self._geral, entrada)
+        for campo, heaps in self._grupos.items():
+            heapq.heappush(heaps.setdefault(item[campo], []), entrada)
+
+    def maiores(self, k: int, campo: Optional[str] = None,
+                valor: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Os k itens de maior valor (do catálogo ou do grupo ``campo`` = ``valor``)"""
+        if campo is None:
+            if self._geral is None:
+                self._geral = self._montar(None)[None]
+            heap = self._geral
+        else:
+            if campo not in self._grupos:
+                self._grupos[campo] = self._montar(campo)
+            heap = self._grupos[campo].get(valor, [])
+
+        resultado: List[Entrada] = []
+        vistos = set()
+        while heap and len(resultado) < k:
+            entrada = heapq.heappop(heap)
+            negativo, codigo = entrada
+            if codigo not in vistos and self._vigente(codigo, -negativo, campo, valor):
+                vistos.add(codigo)
+                resultado.append(entrada)
+        # Devolve as entradas válidas ao heap; obsoletas e repetidas ficam descartadas
+        for entrada in resultado:
+            heapq.heappush(heap, entrada)
+        return [(codigo, -negativo) for negativo, codigo in resultado]
+
+    def _vigente(self, codigo: str, valor: float, campo: Optional[str],
+                 grupo: Optional[str]) -> bool:
+        if codigo not in self._estoque:
+            return False
+        item = self._estoque[codigo]
+        return valor_item(item) == valor and (campo is None or item[campo] == grupo)
+
+    def _montar(self, campo: Optional[str]) -> Dict[Optional[str], List[Entrada]]:
+        """Heaps do catálogo (campo None) ou de cada valor do campo, lidos do estoque"""
+        estoque = self._estoque
+        if isinstance(estoque, EstoqueColunar):
+            codigos = estoque.codigos()
+            negativos = (-(estoque.coluna("quantidade") * estoque.coluna("valor_unitario"))).tolist()
+            grupos = estoque.textos(campo) if campo is not None else None
+        else:
+            codigos = list(estoque.keys())
+            negativos = [-valor_item(item) for item in estoque.values()]
+            grupos = [item[campo] for item in estoque.values()] if campo is not None else None
+
+        if grupos is None:
+            heaps = {None: list(zip(negativos, codigos))}
+        else:
+            heaps = {}
+            for grupo, negativo, codigo in zip(grupos, negativos, codigos):
+                heaps.setdefault(grupo, []).append((negativo, codigo))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        return heaps
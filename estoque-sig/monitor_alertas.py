@@ -0,0 +1,299 @@
+"""Avaliação de alertas em segundo plano e envio de notificações.
+
+As escritas do gerenciador só marcam os SKUs alterados (``marcar``); uma
+thread própria reavalia esses SKUs com as mesmas regras de ``obter_alertas``
+(crítico, baixo, reposição e excesso) e envia aos destinos os alertas novos:
+
+- mudanças em rajada são agrupadas: a thread espera ``atraso`` segundos
+  depois da primeira marcação e avalia tudo o que chegou nesse intervalo;
+- um item notificado num status não é notificado de novo no mesmo status
+  antes de ``intervalo_repeticao`` segundos (saldo oscilando em torno do
+  mínimo, por exemplo); piorar de status (baixo -> crítico) notifica;
+- só os status ativados nas Configurações geram notificação.
+
+Destinos recebem cada lote de alertas como lista de dicionários: webhook
+(POST JSON), fila em arquivo (uma linha JSON por alerta) e caixa de saída de
+e-mail (um ``.eml`` por lote num diretório). Uma falha num destino não
+interrompe os demais nem a thread.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from estoque_colunar import EstoqueColunar
+from indice_alertas import STATUS_ALERTA, classificar_alertas
+
+# Espera depois da primeira marcação, para agrupar rajadas de mudanças (segundos)
+ATRASO_ALERTAS = 1.0
+
+# Tempo mínimo entre duas notificações do mesmo item no mesmo status (segundos)
+INTERVALO_REPETICAO = 3600.0
+
+# Últimos alertas enviados mantidos para exibição
+ALERTAS_RECENTES = 50
+
+ROTULOS_ALERTA = {"critico": "Estoque crítico", "baixo": "Estoque baixo",
+                  "reposicao": "Reposição", "excesso": "Excesso de estoque"}
+
+
+class DestinoAlerta:
+    """Destino de notificações: recebe cada lote de alertas novos"""
+
+    nome = "destino"
+
+    def enviar(self, alertas: List[Dict]):
+        raise NotImplementedError
+
+
+class DestinoWebhook(DestinoAlerta):
+    """POST de ``{"alertas": [...]}`` em JSON para uma URL (um receptor local, por exemplo)"""
+
+    nome = "webhook"
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def enviar(self, alertas: List[Dict]):
+        # Importados no primeiro envio: quem só usa o gerenciador não os carrega
+        import urllib.request
+
+        corpo = json.dumps({"alertas": alertas}, ensure_ascii=False).encode("utf-8")
+        requisicao = urllib.request.Request(self.url, data=corpo, method="POST",
+                                            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+            resposta.read()
+
+
+class DestinoFila(DestinoAlerta):
+    """Fila em arquivo: uma linha JSON por alerta, acrescentada ao fim do arquivo"""
+
+    nome = "fila"
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+
+    def enviar(self, alertas: List[Dict]):
+        linhas = "".join(json.dumps(alerta, ensure_ascii=False) + "\n" for alerta in alertas)
+        with open(self.caminho, "a", encoding="utf-8") as arquivo:
+            arquivo.write(linhas)
+
+
+class DestinoEmail(DestinoAlerta):
+    """Caixa de saída: um e-mail (``.eml``) por lote num diretório, para o processo de envio"""
+
+    nome = "email"
+
+    def __init__(self, diretorio: str, remetente: str = "estoque@localhost",
+                 destinatarios: Sequence[str] = ("compras@localhost",)):
+        self.diretorio = diretorio
+        self.remetente = remetente
+        self.destinatarios = list(destinatarios)
+        os.makedirs(diretorio, exist_ok=True)
+
+    def enviar(self, alertas: List[Dict]):
+        from email.message import EmailMessage
+
+        mensagem = EmailMessage()
+        mensagem["From"] = self.remetente
+        mensagem["To"] = ", ".join(self.destinatarios)
+        mensagem["Subject"] = f"[Estoque] {len(alertas)} alerta(s) de estoque"
+        mensagem.set_content("\n".join(
+            f"{alerta['data']}  {ROTULOS_ALERTA[alerta['status']]}: {alerta['codigo']} - "
+            f"{alerta['descricao']} (quantidade {alerta['quantidade']}, mínimo {alerta['minimo']}, "
+            f"máximo {alerta['maximo']})"
+            for alerta in alertas))
+        nome = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}.eml"
+        # Gravado com outro nome e renomeado: o processo de envio nunca lê um arquivo pela metade
+        temporario = os.path.join(self.diretorio, f".{nome}.tmp")
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(bytes(mensagem))
+        os.replace(temporario, os.path.join(self.diretorio, nome))
+
+
+class MonitorAlertas:
+    """Thread que reavalia os SKUs alterados e envia os alertas novos aos destinos.
+
+    ``gerenciador`` é o ``EstoqueManager``: o monitor lê ``estoque`` e
+    ``alertas_ativos`` a cada avaliação, sem travas (como as demais leituras).
+    """
+
+    def __init__(self, gerenciador, destinos: Iterable[DestinoAlerta],
+                 atraso: float = ATRASO_ALERTAS, intervalo_repeticao: float = INTERVALO_REPETICAO,
+                 relogio: Callable[[], float] = time.monotonic):
+        self._gerenciador = gerenciador
+        self.destinos = list(destinos)
+        self.atraso = atraso
+        self.intervalo_repeticao = intervalo_repeticao
+        self._relogio = relogio
+        self._condicao = threading.Condition()
+        self._pendentes: set = set()
+        self._todos = False
+        self._parar = False
+        self._ocioso = True
+        # Estado visto pela thread: status atual dos itens em alerta e último envio de cada item
+        self._status: Dict[str, str] = {}
+        self._enviados: Dict[str, Tuple[str, float]] = {}
+        self._recentes: Deque[Dict] = deque(maxlen=ALERTAS_RECENTES)
+        self.contagem = {"enviados": 0, "repetidos": 0, "falhas": 0}
+        self.ultimo_erro: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # Chamados pelas escritas (só marcam; a avaliação fica na thread)
+
+    def marcar(self, codigos: Iterable[str]):
+        with self._condicao:
+            self._pendentes.update(codigos)
+            self._condicao.notify_all()
+
+    def marcar_todos(self):
+        """Estoque substituído (restauração, importação grande): reavalia todos os itens"""
+        with self._condicao:
+            self._todos = True
+            self._condicao.notify_all()
+
+    def recentes(self) -> List[Dict]:
+        """Últimos alertas enviados, do mais antigo ao mais novo"""
+        with self._condicao:
+            return list(self._recentes)
+
+    # Ciclo de vida
+
+    def iniciar(self):
+        """Toma o estado atual como referência (sem notificar) e inicia a thread"""
+        self._avaliar(None, notificar=False)
+        self._thread = threading.Thread(target=self._executar, name="estoque-alertas", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        """Avalia o que ainda estiver marcado e encerra a thread"""
+        with self._condicao:
+            self._parar = True
+            self._condicao.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def aguardar(self, timeout: Optional[float] = None) -> bool:
+        """Espera a thread esvaziar as marcações (retorna False se o tempo acabar)"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._condicao:
+            while self._pendentes or self._todos or not self._ocioso:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._condicao.wait(restante)
+        return True
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not (self._pendentes or self._todos or self._parar):
+                    self._condicao.wait()
+                if not (self._pendentes or self._todos):
+                    return
+                self._ocioso = False
+                # Agrupa a rajada: espera o atraso (ou o pedido de parada) antes de ler as marcações
+                fim = time.monotonic() + self.atraso
+                restante = self.atraso
+                while restante > 0 and not self._parar:
+                    self._condicao.wait(restante)
+                    restante = fim - time.monotonic()
+                codigos, todos = self._pendentes, self._todos
+                self._pendentes, self._todos = set(), False
+            try:
+                self._avaliar(None if todos else codigos)
+            except Exception as erro:
+                # Estoque trocado durante a leitura, por exemplo: a próxima marcação reavalia
+                self.ultimo_erro = f"avaliação: {erro}"
+            with self._condicao:
+                self._ocioso = True
+                self._condicao.notify_all()
+
+    # Avaliação
+
+    def _avaliar(self, codigos: Optional[Iterable[str]], notificar: bool = True):
+        """Reclassifica os itens (todos, se ``codigos`` for None) e notifica as mudanças de status"""
+        estoque = self._gerenciador.estoque
+        codigos, quantidades, minimos, maximos = self._colunas(estoque, codigos)
+        status = classificar_alertas(quantidades, minimos, maximos)
+        if codigos is None:
+            # Todos os itens: os que saíram do estoque ou do alerta deixam o estado
+            codigos = estoque.codigos() if isinstance(estoque, EstoqueColunar) else list(estoque.keys())
+            em_alerta = np.flatnonzero(status >= 0)
+            anteriores, self._status = self._status, {}
+            mudancas = [(codigos[linha], STATUS_ALERTA[status[linha]], anteriores.get(codigos[linha]))
+                        for linha in em_alerta.tolist()]
+            for codigo, atual, _ in mudancas:
+                self._status[codigo] = atual
+        else:
+            mudancas = []
+            for codigo, posicao in zip(codigos, status.tolist()):
+                atual = STATUS_ALERTA[posicao] if posicao >= 0 else None
+                anterior = self._status.get(codigo)
+                if atual is None:
+                    self._status.pop(codigo, None)
+                else:
+                    self._status[codigo] = atual
+                    mudancas.append((codigo, atual, anterior))
+        if notificar:
+            alertas = self._filtrar(estoque, [m for m in mudancas if m[1] != m[2]])
+            if alertas:
+                self._enviar(alertas)
+
+    @staticmethod
+    def _colunas(estoque, codigos: Optional[Iterable[str]]
+                 ) -> Tuple[Optional[List[str]], np.ndarray, np.ndarray, np.ndarray]:
+        """Quantidade, mínimo e máximo dos itens (todos, se ``codigos`` for None; ausentes ficam de fora)"""
+        if isinstance(estoque, EstoqueColunar):
+            if codigos is None:
+                return (None, *(np.asarray(estoque.coluna(campo)) for campo in ("quantidade", "minimo", "maximo")))
+            codigos = list(codigos)
+            linhas = estoque.linhas(codigos)
+            presentes = linhas >= 0
+            codigos = [codigo for codigo, presente in zip(codigos, presentes.tolist()) if presente]
+            return (codigos, *(np.asarray(estoque.coluna(campo))[linhas[presentes]]
+                               for campo in ("quantidade", "minimo", "maximo")))
+        itens = list(estoque.items()) if codigos is None else \
+            [(codigo, estoque[codigo]) for codigo in codigos if codigo in estoque]
+        colunas = [np.array([item[campo] for _, item in itens], dtype=np.int64)
+                   for campo in ("quantidade", "minimo", "maximo")]
+        return (None if codigos is None else [codigo for codigo, _ in itens], *colunas)
+
+    def _filtrar(self, estoque, mudancas: List[Tuple[str, str, Optional[str]]]) -> List[Dict]:
+        """Alertas dos status ativos que não repetem um envio recente do mesmo item e status"""
+        ativos = self._gerenciador.alertas_ativos
+        agora = self._relogio()
+        data = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        alertas = []
+        for codigo, status, anterior in mudancas:
+            if not ativos.get(status, False):
+                continue
+            enviado = self._enviados.get(codigo)
+            if enviado is not None and enviado[0] == status and agora - enviado[1] < self.intervalo_repeticao:
+                self.contagem["repetidos"] += 1
+                continue
+            self._enviados[codigo] = (status, agora)
+            item = estoque[codigo]
+            alertas.append({"data": data, "codigo": codigo, "descricao": item["descricao"],
+                            "status": status, "anterior": anterior,
+                            "quantidade": int(item["quantidade"]), "minimo": int(item["minimo"]),
+                            "maximo": int(item["maximo"])})
+        return alertas
+
+    def _enviar(self, alertas: List[Dict]):
+        for destino in self.destinos:
+            try:
+                destino.enviar(alertas)
+            except Exception as erro:
+                self.contagem["falhas"] += 1
+                self.ultimo_erro = f"{destino.nome}: {erro}"
+        self.contagem["enviados"] += len(alertas)
+        with self._condicao:
+            self._recentes.extend(alertas)
@@ -0,0 +1,93 @@
+"""Leitura e validação vetorizada de movimentações em lote.
+
+Um lote é uma tabela com código, tipo (ENTRADA ou SAÍDA), quantidade e
+observação opcional, vinda de um CSV ou de linhas coladas na tela. A validação
+de saldo segue a ordem das linhas, como se cada movimento fosse lançado
+isoladamente: uma saída que deixaria o item negativo é recusada e não afeta
+as linhas seguintes.
+"""
+import io
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_LOTE = ["codigo", "tipo", "quantidade", "observacao"]
+
+# Grafias aceitas para o tipo (comparadas em minúsculas e sem acento)
+TIPOS_LOTE = {"entrada": "ENTRADA", "e": "ENTRADA", "saida": "SAÍDA", "s": "SAÍDA"}
+
+
+def ler_movimentos(fonte: Union[str, io.IOBase]) -> pd.DataFrame:
+    """Lê um lote (texto colado ou arquivo CSV) no formato codigo;tipo;quantidade;observacao.
+
+    O separador pode ser ponto e vírgula, tabulação ou vírgula, e o cabeçalho
+    é opcional.
+    """
+    texto = fonte if isinstance(fonte, str) else fonte.read()
+    if isinstance(texto, bytes):
+        texto = texto.decode("utf-8-sig")
+    texto = texto.strip()
+    if not texto:
+        raise ValueError("Nenhum movimento informado.")
+
+    primeira = texto.split("\n", 1)[0]
+    separador = ";" if ";" in primeira else "\t" if "\t" in primeira else ","
+    tem_cabecalho = primeira.split(separador)[0].strip().lower() in ("codigo", "código")
+    try:
+        movimentos = pd.read_csv(io.StringIO(texto), sep=separador, header=None,
+                                 names=COLUNAS_LOTE, dtype=str, skipinitialspace=True,
+                                 skiprows=1 if tem_cabecalho else 0, keep_default_na=False)
+    except pd.errors.ParserError as e:
+        raise ValueError(f"Lote com formato inválido: {e}") from e
+    return movimentos
+
+
+def normalizar_tipos(tipos: pd.Series) -> pd.Series:
+    """Converte as grafias aceitas em "ENTRADA"/"SAÍDA" (NaN para tipos inválidos)"""
+    return (tipos.astype(str).str.strip().str.lower()
+            .str.replace("í", "i", regex=False).map(TIPOS_LOTE))
+
+
+def aplicar_saldos(grupos: np.ndarray, deltas: np.ndarray,
+                   saldo_inicial: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Decide, na ordem das linhas, quais movimentos mantêm o saldo não negativo.
+
+    ``grupos`` identifica o item de cada linha, ``deltas`` traz a variação
+    assinada e ``saldo_inicial`` o saldo do item antes do lote. Retorna
+    ``(aceito, saldo)``, com o saldo do item após cada linha (ou no momento da
+    recusa). Itens sem recusa são resolvidos por somas acumuladas; só os itens
+    com alguma recusa passam pelo caminho linha a linha.
+    """
+    n = len(grupos)
+    aceito = np.ones(n, dtype=bool)
+    saldo = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return aceito, saldo
+
+    ordem = np.argsort(grupos, kind="stable")
+    g = grupos[ordem]
+    d = deltas[ordem]
+    inicio = np.ones(n, dtype=bool)
+    inicio[1:] = g[1:] != g[:-1]
+    acumulado = np.cumsum(d)
+    primeira = np.maximum.accumulate(np.where(inicio, np.arange(n), 0))
+    saldo_ordenado = saldo_inicial[ordem] + acumulado - acumulado[primeira] + d[primeira]
+
+    # Até a primeira linha negativa de um item o resultado coincide com o sequencial
+    grupos_com_falha = np.unique(g[saldo_ordenado < 0])
+    if len(grupos_com_falha):
+        refazer = np.flatnonzero(np.isin(g, grupos_com_falha))
+        atual, grupo_atual = 0, None
+        for posicao in refazer.tolist():
+            if g[posicao] != grupo_atual:
+                grupo_atual = g[posicao]
+                atual = int(saldo_inicial[ordem[posicao]])
+            if atual + d[posicao] < 0:
+                aceito[ordem[posicao]] = False
+            else:
+                atual += int(d[posicao])
+            saldo_ordenado[posicao] = atual
+
+    saldo[ordem] = saldo_ordenado
+    return aceito, saldo
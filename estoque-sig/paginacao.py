@@ -0,0 +1,47 @@
+"""Paginação e ordenação no servidor para as tabelas do Estoque e do Histórico.
+
+A interface envia coluna de ordenação, direção, deslocamento e tamanho da
+página; só as linhas da página são montadas e enviadas ao navegador. A
+ordenação trabalha sobre chaves numéricas (valores, códigos de categoria ou
+postos de textos) e não ordena a tabela inteira: uma partição encontra as
+``deslocamento + limite`` primeiras chaves e apenas elas são ordenadas.
+"""
+from typing import Sequence
+
+import numpy as np
+
+TAMANHOS_PAGINA = [25, 50, 100, 250, 500]
+
+
+def pagina_ordenada(chaves: np.ndarray, deslocamento: int, limite: int,
+                    decrescente: bool = False) -> np.ndarray:
+    """Posições (em ``chaves``) das linhas da página, em ordem estável das chaves.
+
+    Empates mantêm a ordem original das posições, nas duas direções, de modo
+    que páginas vizinhas nunca repetem nem pulam linhas.
+    """
+    n = len(chaves)
+    fim = min(deslocamento + limite, n)
+    if fim <= deslocamento:
+        return np.zeros(0, dtype=np.int64)
+    chaves = np.asarray(chaves)
+    if decrescente:
+        chaves = -chaves.astype(np.float64) if chaves.dtype.kind == "u" else -chaves
+    if fim < n:
+        limiar = np.partition(chaves, fim - 1)[fim - 1]
+        menores = np.flatnonzero(chaves < limiar)
+        empates = np.flatnonzero(chaves == limiar)[:fim - len(menores)]
+        candidatas = np.concatenate([menores, empates])
+    else:
+        candidatas = np.arange(n)
+    # Candidatas em ordem de posição e empates no limiar por último: o sort estável basta
+    ordem = candidatas[np.argsort(chaves[candidatas], kind="stable")]
+    return ordem[deslocamento:fim]
+
+
+def postos(valores: Sequence[str]) -> np.ndarray:
+    """Posto (ordem alfabética) de cada texto, como chave numérica de ordenação"""
+    import pandas as pd
+
+    codigos, _ = pd.factorize(np.asarray(valores, dtype=object), sort=True)
+    return codigos.astype(np.int64)
@@ -0,0 +1,495 @@
+"""Armazenamento persistente do estoque, histórico e usuários.
+
+``ArmazenamentoMemoria`` mantém o comportamento original (nada é gravado).
+``ArmazenamentoSQLite`` usa o sqlite3 da biblioteca padrão em modo WAL:
+
+- itens, histórico e usuários ficam em tabelas indexadas;
+- as escritas entram numa fila e uma thread gravadora aplica tudo o que
+  estiver acumulado numa única transação (group commit), com atualizações de
+  quantidade do mesmo SKU coalescidas;
+- os comandos SQL são constantes reutilizadas com ``executemany``, aproveitando
+  o cache de statements preparados da conexão;
+- a carga inicial lê os itens em lotes de colunas e o histórico só é lido
+  quando alguém o consulta;
+- parâmetros do sistema (inteiros) ficam na tabela ``meta``, ao lado da geração;
+- registros do histórico arquivados pela retenção são apagados da tabela.
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Colunas da tabela de itens, na ordem usada pelos lotes de carga
+COLUNAS_ITEM = ("codigo", "descricao", "unidade", "quantidade", "minimo", "maximo",
+                "localizacao", "fornecedor", "valor_unitario", "ultima_atualizacao")
+
+COLUNAS_HISTORICO = ("data", "tipo", "codigo", "descricao", "quantidade", "usuario", "delta",
+                     "campo", "valor_anterior", "valor_novo")
+
+# Colunas acrescentadas à tabela de histórico depois da primeira versão do esquema
+MIGRACOES_HISTORICO = {
+    "campo": "TEXT NOT NULL DEFAULT ''",
+    "valor_anterior": "REAL",
+    "valor_novo": "REAL",
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS itens (
+    codigo TEXT PRIMARY KEY,
+    descricao TEXT NOT NULL,
+    unidade TEXT NOT NULL,
+    quantidade INTEGER NOT NULL,
+    minimo INTEGER NOT NULL,
+    maximo INTEGER NOT NULL,
+    localizacao TEXT NOT NULL,
+    fornecedor TEXT NOT NULL,
+    valor_unitario REAL NOT NULL,
+    ultima_atualizacao TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_itens_fornecedor ON itens (fornecedor);
+CREATE INDEX IF NOT EXISTS idx_itens_localizacao ON itens (localizacao);
+
+CREATE TABLE IF NOT EXISTS historico (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    codigo TEXT NOT NULL,
+    descricao TEXT NOT NULL,
+    quantidade INTEGER NOT NULL,
+    usuario TEXT,
+    delta INTEGER NOT NULL DEFAULT 0,
+    campo TEXT NOT NULL DEFAULT '',
+    valor_anterior REAL,
+    valor_novo REAL
+);
+CREATE INDEX IF NOT EXISTS idx_historico_data ON historico (data);
+CREATE INDEX IF NOT EXISTS idx_historico_codigo ON historico (codigo, data);
+CREATE INDEX IF NOT EXISTS idx_historico_tipo ON historico (tipo, data);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    usuario TEXT PRIMARY KEY,
+    senha TEXT NOT NULL,
+    tipo TEXT NOT NULL
+);
+
+-- Geração: avança a cada transação gravada (valida snapshots do estado)
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (chave, valor) VALUES ('geracao', 0);
+"""
+
+SQL_SALVAR_ITEM = (
+    "INSERT OR REPLACE INTO itens (codigo, descricao, unidade, quantidade, minimo, maximo, "
+    "localizacao, fornecedor, valor_unitario, ultima_atualizacao) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_SALVAR_QUANTIDADE = "UPDATE itens SET quantidade = ?, ultima_atualizacao = ? WHERE codigo = ?"
+SQL_INSERIR_HISTORICO = (
+    "INSERT INTO historico (data, tipo, codigo, descricao, quantidade, usuario, delta, "
+    "campo, valor_anterior, valor_novo) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_SALVAR_USUARIO = "INSERT OR REPLACE INTO usuarios (usuario, senha, tipo) VALUES (?, ?, ?)"
+SQL_REMOVER_USUARIO = "DELETE FROM usuarios WHERE usuario = ?"
+SQL_AVANCAR_GERACAO = "UPDATE meta SET valor = valor + 1 WHERE chave = 'geracao'"
+SQL_SALVAR_PARAMETRO = "INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)"
+SQL_COMPACTAR_HISTORICO = "DELETE FROM historico WHERE data < ?"
+
+
+def linha_item(codigo: str, item: Dict) -> Tuple:
+    """Converte um item (dict-like) na tupla da tabela de itens"""
+    return (codigo, item["descricao"], item["unidade"], int(item["quantidade"]),
+            int(item["minimo"]), int(item["maximo"]), item["localizacao"],
+            item["fornecedor"], float(item["valor_unitario"]), item["ultima_atualizacao"])
+
+
+def linha_historico(registro: Dict) -> Tuple:
+    """Converte um registro do histórico na tupla da tabela"""
+    return (registro["data"], registro["tipo"], registro["codigo"], registro["descricao"],
+            registro["quantidade"], registro["usuario"], registro.get("delta", 0),
+            registro.get("campo", ""), registro.get("valor_anterior"), registro.get("valor_novo"))
+
+
+class ArmazenamentoMemoria:
+    """Sem persistência: os dados vivem apenas no processo"""
+
+    persistente = False
+
+    def possui_itens(self) -> bool:
+        return False
+
+    def geracao(self) -> Optional[int]:
+        """Contador de transações gravadas (None quando nada é persistido)"""
+        return None
+
+    def carregar_itens(self, tamanho_lote: int = 50000) -> Iterator[Tuple[List[str], Dict[str, List]]]:
+        return iter(())
+
+    def carregar_historico(self, tamanho_lote: int = 50000) -> Iterator[Dict[str, List]]:
+        return iter(())
+
+    def carregar_usuarios(self) -> Dict[str, Dict]:
+        return {}
+
+    def carregar_parametros(self) -> Dict[str, int]:
+        return {}
+
+    def salvar_item(self, codigo: str, item: Dict):
+        pass
+
+    def salvar_itens(self, itens: Dict[str, Dict]):
+        pass
+
+    def salvar_itens_lote(self, codigos: List[str], colunas: Dict[str, List]):
+        pass
+
+    def salvar_quantidade(self, codigo: str, quantidade: int, ultima_atualizacao: str):
+        pass
+
+    def salvar_quantidades(self, codigos: List[str], quantidades: List[int],
+                           ultima_atualizacao: str):
+        pass
+
+    def registrar_historico(self, registro: Dict):
+        pass
+
+    def registrar_historico_lote(self, colunas: Dict[str, List]):
+        pass
+
+    def salvar_usuario(self, usuario: str, dados: Dict):
+        pass
+
+    def remover_usuario(self, usuario: str):
+        pass
+
+    def salvar_parametro(self, chave: str, valor: int):
+        pass
+
+    def compactar_historico(self, corte: str):
+        pass
+
+    def substituir_itens(self, itens: Dict[str, Dict]):
+        pass
+
+    def substituir_tudo(self, itens: Dict[str, Dict], historico: Iterable[Dict],
+                        usuarios: Dict[str, Dict]):
+        pass
+
+    def sincronizar(self):
+        pass
+
+    def fechar(self):
+        pass
+
+
+class ArmazenamentoSQLite(ArmazenamentoMemoria):
+    """Persistência em SQLite (WAL) com gravação em lote numa thread dedicada"""
+
+    persistente = True
+
+    def __init__(self, caminho: str, tamanho_lote: int = 20000):
+        self.caminho = caminho
+        self.tamanho_lote = tamanho_lote
+        self._fila: "queue.Queue" = queue.Queue()
+        self._fechado = False
+        # Falha do último lote descartado, relançada pelo próximo ``sincronizar``
+        self._erro: Optional[Exception] = None
+
+        conexao = self._conectar()
+        conexao.executescript(ESQUEMA)
+        # Bancos criados com um esquema anterior ganham as colunas novas do histórico
+        existentes = {linha[1] for linha in conexao.execute("PRAGMA table_info(historico)")}
+        for coluna, definicao in MIGRACOES_HISTORICO.items():
+            if coluna not in existentes:
+                conexao.execute(f"ALTER TABLE historico ADD COLUMN {coluna} {definicao}")
+        conexao.commit()
+        conexao.close()
+
+        self._gravador = threading.Thread(target=self._executar_gravador,
+                                          name="estoque-sqlite", daemon=True)
+        self._gravador.start()
+        atexit.register(self.fechar)
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, check_same_thread=False,
+                                  cached_statements=256, timeout=30)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        return conexao
+
+    # Leitura (conexões próprias; o WAL permite ler enquanto o gravador escreve)
+
+    def possui_itens(self) -> bool:
+        conexao = self._conectar()
+        try:
+            return conexao.execute("SELECT 1 FROM itens LIMIT 1").fetchone() is not None
+        finally:
+            conexao.close()
+
+    def carregar_itens(self, tamanho_lote: int = 50000) -> Iterator[Tuple[List[str], Dict[str, List]]]:
+        """Lê os itens em lotes de colunas (codigos, {campo: valores})"""
+        conexao = self._conectar()
+        try:
+            cursor = conexao.execute(f"SELECT {', '.join(COLUNAS_ITEM)} FROM itens ORDER BY rowid")
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                colunas = list(zip(*linhas))
+                yield list(colunas[0]), {campo: list(valores) for campo, valores
+                                         in zip(COLUNAS_ITEM[1:], colunas[1:])}
+        finally:
+            conexao.close()
+
+    def carregar_historico(self, tamanho_lote: int = 50000) -> Iterator[Dict[str, List]]:
+        """Lê o histórico em ordem de gravação, em lotes de colunas {campo: valores}"""
+        self.sincronizar()
+        conexao = self._conectar()
+        try:
+            cursor = conexao.execute(
+                f"SELECT {', '.join(COLUNAS_HISTORICO)} FROM historico ORDER BY id")
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                yield dict(zip(COLUNAS_HISTORICO, map(list, zip(*linhas))))
+        finally:
+            conexao.close()
+
+    def geracao(self) -> Optional[int]:
+        """Contador de transações gravadas, após aplicar tudo o que está na fila"""
+        self.sincronizar()
+        conexao = self._conectar()
+        try:
+            return conexao.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()[0]
+        finally:
+            conexao.close()
+
+    def carregar_usuarios(self) -> Dict[str, Dict]:
+        conexao = self._conectar()
+        try:
+            return {usuario: {"senha": senha, "tipo": tipo} for usuario, senha, tipo in
+                    conexao.execute("SELECT usuario, senha, tipo FROM usuarios")}
+        finally:
+            conexao.close()
+
+    def carregar_parametros(self) -> Dict[str, int]:
+        """Parâmetros do sistema gravados com ``salvar_parametro``"""
+        self.sincronizar()
+        conexao = self._conectar()
+        try:
+            return dict(conexao.execute("SELECT chave, valor FROM meta WHERE chave != 'geracao'"))
+        finally:
+            conexao.close()
+
+    # Escrita (enfileirada para o gravador)
+
+    def salvar_item(self, codigo: str, item: Dict):
+        self._fila.put(("item", linha_item(codigo, item)))
+
+    def salvar_itens(self, itens: Dict[str, Dict]):
+        for codigo, item in itens.items():
+            self.salvar_item(codigo, item)
+
+    def salvar_itens_lote(self, codigos: List[str], colunas: Dict[str, List]):
+        """Grava vários itens a partir de listas alinhadas por campo (tipos Python)"""
+        self._fila.put(("itens", list(zip(codigos, *(colunas[campo] for campo in COLUNAS_ITEM[1:])))))
+
+    def salvar_quantidade(self, codigo: str, quantidade: int, ultima_atualizacao: str):
+        self._fila.put(("quantidade", (int(quantidade), ultima_atualizacao, codigo)))
+
+    def salvar_quantidades(self, codigos: List[str], quantidades: List[int],
+                           ultima_atualizacao: str):
+        self._fila.put(("quantidades", [(int(quantidade), ultima_atualizacao, codigo)
+                                        for codigo, quantidade in zip(codigos, quantidades)]))
+
+    def registrar_historico(self, registro: Dict):
+        self._fila.put(("historico", linha_historico(registro)))
+
+    def registrar_historico_lote(self, colunas: Dict[str, List]):
+        self._fila.put(("historico_lote", list(zip(*(colunas[c] for c in COLUNAS_HISTORICO)))))
+
+    def salvar_usuario(self, usuario: str, dados: Dict):
+        self._fila.put(("usuario", (usuario, dados["senha"], dados["tipo"])))
+
+    def remover_usuario(self, usuario: str):
+        self._fila.put(("remover_usuario", (usuario,)))
+
+    def salvar_parametro(self, chave: str, valor: int):
+        self._fila.put(("parametro", (chave, int(valor))))
+
+    def compactar_historico(self, corte: str):
+        """Apaga os registros do histórico com data anterior a ``corte`` ("%Y-%m-%d %H:%M:%S")"""
+        self._fila.put(("compactar", corte))
+
+    def substituir_itens(self, itens: Dict[str, Dict]):
+        """Troca todos os itens gravados pelos informados (histórico e usuários ficam)"""
+        self._fila.put(("substituir_itens", [linha_item(codigo, item) for codigo, item in itens.items()]))
+
+    def substituir_tudo(self, itens: Dict[str, Dict], historico: Iterable[Dict],
+                        usuarios: Dict[str, Dict]):
+        """Troca itens, histórico e usuários gravados numa única transação.
+
+        Itens e usuários são convertidos já na chamada; ``historico`` é lido
+        pelo gravador dentro da transação e não pode mudar até lá (um trecho
+        fixo do log, que só recebe acréscimos).
+        """
+        self._fila.put(("substituir", (
+            [linha_item(codigo, item) for codigo, item in itens.items()],
+            historico,
+            [(usuario, dados["senha"], dados["tipo"]) for usuario, dados in usuarios.items()]
+        )))
+
+    def sincronizar(self):
+        """Bloqueia até que todas as escritas enfileiradas estejam gravadas.
+
+        Relança a falha de um lote descartado pelo gravador desde a última
+        sincronização (as gravações desse lote não estão no banco).
+        """
+        if self._fechado:
+            return
+        concluido = threading.Event()
+        self._fila.put(("sincronizar", concluido))
+        # Nunca espera por um gravador que não está mais rodando
+        while not concluido.wait(1.0):
+            if not self._gravador.is_alive():
+                raise RuntimeError("O gravador do banco foi encerrado; as gravações pendentes se perderam.")
+        erro, self._erro = self._erro, None
+        if erro is not None:
+            raise erro
+
+    def fechar(self):
+        """Grava o que estiver pendente e encerra o gravador"""
+        if self._fechado:
+            return
+        self._fechado = True
+        self._fila.put(None)
+        self._gravador.join()
+
+    # Gravador
+
+    def _executar_gravador(self):
+        conexao = self._conectar()
+        try:
+            while True:
+                lote = [self._fila.get()]
+                # Group commit: junta tudo o que já está na fila numa transação
+                while len(lote) < self.tamanho_lote:
+                    try:
+                        lote.append(self._fila.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    continuar = self._aplicar(conexao, lote)
+                except Exception as erro:
+                    # O lote é descartado (a transação em curso é desfeita) e o gravador
+                    # continua; quem espera neste lote é liberado e recebe o erro
+                    if conexao.in_transaction:
+                        conexao.rollback()
+                    self._erro = erro
+                    continuar = None not in lote
+                    for operacao in lote:
+                        if operacao is not None and operacao[0] == "sincronizar":
+                            operacao[1].set()
+                if not continuar:
+                    break
+        finally:
+            conexao.close()
+
+    def _aplicar(self, conexao: sqlite3.Connection, lote: List) -> bool:
+        """Aplica um lote de operações; retorna False ao receber o sinal de fim"""
+        itens: Dict[str, List] = {}
+        quantidades: Dict[str, Tuple] = {}
+        historico: List[Tuple] = []
+        usuarios: List[Tuple[str, Optional[Tuple]]] = []
+        parametros: Dict[str, int] = {}
+        continuar = True
+        eventos = []
+
+        def gravar():
+            if not (itens or quantidades or historico or usuarios or parametros):
+                return
+            with conexao:
+                conexao.execute(SQL_AVANCAR_GERACAO)
+                if itens:
+                    conexao.executemany(SQL_SALVAR_ITEM, [tuple(linha) for linha in itens.values()])
+                if quantidades:
+                    conexao.executemany(SQL_SALVAR_QUANTIDADE, quantidades.values())
+                if historico:
+                    conexao.executemany(SQL_INSERIR_HISTORICO, historico)
+                for usuario, dados in usuarios:
+                    if dados is None:
+                        conexao.execute(SQL_REMOVER_USUARIO, (usuario,))
+                    else:
+                        conexao.execute(SQL_SALVAR_USUARIO, dados)
+                if parametros:
+                    conexao.executemany(SQL_SALVAR_PARAMETRO, parametros.items())
+            itens.clear()
+            quantidades.clear()
+            historico.clear()
+            usuarios.clear()
+            parametros.clear()
+
+        for operacao in lote:
+            if operacao is None:
+                continuar = False
+                continue
+            tipo, dados = operacao
+            if tipo in ("item", "itens"):
+                for linha in (dados,) if tipo == "item" else dados:
+                    itens[linha[0]] = list(linha)
+                    quantidades.pop(linha[0], None)
+            elif tipo in ("quantidade", "quantidades"):
+                for atualizacao in (dados,) if tipo == "quantidade" else dados:
+                    quantidade, ultima_atualizacao, codigo = atualizacao
+                    if codigo in itens:
+                        itens[codigo][3] = quantidade
+                        itens[codigo][9] = ultima_atualizacao
+                    else:
+                        quantidades[codigo] = atualizacao
+            elif tipo == "historico":
+                historico.append(dados)
+            elif tipo == "historico_lote":
+                historico.extend(dados)
+            elif tipo == "usuario":
+                usuarios.append((dados[0], dados))
+            elif tipo == "remover_usuario":
+                usuarios.append((dados[0], None))
+            elif tipo == "parametro":
+                parametros[dados[0]] = dados[1]
+            elif tipo == "compactar":
+                # Registros enfileirados antes do corte são gravados antes de apagar
+                gravar()
+                with conexao:
+                    conexao.execute(SQL_COMPACTAR_HISTORICO, (dados,))
+                    conexao.execute(SQL_AVANCAR_GERACAO)
+            elif tipo == "substituir_itens":
+                # Gravações anteriores dos itens são descartadas junto com as linhas antigas
+                itens.clear()
+                quantidades.clear()
+                gravar()
+                with conexao:
+                    conexao.execute("DELETE FROM itens")
+                    conexao.executemany(SQL_SALVAR_ITEM, dados)
+                    conexao.execute(SQL_AVANCAR_GERACAO)
+            elif tipo == "substituir":
+                # Banco antigo ou estado novo por inteiro: uma falha no meio desfaz tudo
+                novos_itens, novo_historico, novos_usuarios = dados
+                gravar()
+                with conexao:
+                    conexao.execute("DELETE FROM itens")
+                    conexao.execute("DELETE FROM historico")
+                    conexao.execute("DELETE FROM usuarios")
+                    conexao.execute(SQL_AVANCAR_GERACAO)
+                    conexao.executemany(SQL_SALVAR_ITEM, novos_itens)
+                    conexao.executemany(SQL_INSERIR_HISTORICO, map(linha_historico, novo_historico))
+                    conexao.executemany(SQL_SALVAR_USUARIO, novos_usuarios)
+            elif tipo == "sincronizar":
+                eventos.append(dados)
+
+        gravar()
+        for evento in eventos:
+            evento.set()
+        return continuar
@@ -0,0 +1,198 @@
+"""Previsão de demanda por SKU a partir das saídas registradas no histórico.
+
+O consumo diário de cada código fica numa matriz (códigos × dias) usada como
+janela circular dos últimos ``JANELA_PREVISAO`` dias. A matriz é alimentada
+de forma incremental: cada atualização lê só os registros acrescentados ao
+histórico desde a anterior. As estimativas saem para todos os códigos de uma
+vez, com operações vetorizadas sobre a janela:
+
+- média móvel: consumo médio dos últimos ``dias`` dias;
+- suavização exponencial: média ponderada, com pesos que decaem com a idade;
+- sazonal: perfil de consumo por dia da semana; os dias até o mínimo seguem o
+  consumo esperado de cada dia da semana a partir de amanhã.
+
+O dia de hoje entra na janela como os demais: uma saída registrada agora já
+altera a previsão. Dias da janela que a retenção já tirou do log vêm dos
+resumos diários por SKU do arquivo.
+"""
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from resumos_historico import MEDIDAS
+
+JANELA_PREVISAO = 63
+
+SEGUNDOS_DIA = 86400
+
+# Modo -> rótulo exibido na interface
+MODOS_PREVISAO: Dict[str, str] = {
+    "media_movel": "Média móvel",
+    "suavizacao": "Suavização exponencial",
+    "sazonal": "Sazonal (dia da semana)",
+}
+
+
+def dia_da_semana(dias: np.ndarray) -> np.ndarray:
+    """Dia da semana (0 = segunda) de dias contados desde a época (1970-01-01, quinta)"""
+    return (np.asarray(dias) + 3) % 7
+
+
+class PrevisaoDemanda:
+    """Consumo diário por código de item do histórico, atualizado incrementalmente"""
+
+    def __init__(self, janela: int = JANELA_PREVISAO):
+        self.janela = janela
+        self._trava = threading.Lock()
+        # Marca crescente das alterações da matriz (consumidores guardam a última vista)
+        self._marca = 0
+        self._redefinir(None)
+
+    def _redefinir(self, historico):
+        self._historico = historico
+        self._processados = 0
+        # Linha = código do item no histórico; coluna = dia % janela
+        self._consumo = np.zeros((0, self.janela), dtype=np.int32)
+        self._dia: Optional[int] = None
+        # Marca da última alteração de cada linha; antes de ``_marca_geral`` mudaram todas
+        self._marca += 1
+        self._marca_geral = self._marca
+        self._alterado = np.zeros(0, dtype=np.int64)
+
+    def atualizar(self, historico, hoje: int):
+        """Acumula as saídas acrescentadas ao histórico desde a última atualização.
+
+        Um histórico substituído (restauração, compactação) ou encolhido é
+        relido do início, junto com as saídas arquivadas dentro da janela.
+        """
+        with self._trava:
+            if historico is not self._historico or len(historico) < self._processados:
+                self._redefinir(historico)
+                saldo = MEDIDAS.index("saldo")
+                for codigos, dias, medidas in historico.diarios_arquivados("SAÍDA", hoje - self.janela + 1):
+                    self._acumular(codigos, dias, -medidas[:, saldo])
+            fim = len(historico)
+            saida = int(historico.codigos_categoria("tipo", ["SAÍDA"])[0])
+            if saida >= 0:
+                for colunas in historico.colunas(self._processados, fim):
+                    selecao = colunas["tipo"] == saida
+                    self._acumular(colunas["codigo"][selecao],
+                                   colunas["data"][selecao] // SEGUNDOS_DIA,
+                                   -colunas["delta"][selecao])
+            self._processados = fim
+            self._avancar(hoje)
+
+    def _acumular(self, codigos: np.ndarray, dias: np.ndarray, quantidades: np.ndarray):
+        if not len(codigos):
+            return
+        self._avancar(int(dias.max()))
+        validos = dias > self._dia - self.janela
+        codigos, dias, quantidades = codigos[validos], dias[validos], quantidades[validos]
+        if not len(codigos):
+            return
+        linhas = int(codigos.max()) + 1
+        if linhas > len(self._consumo):
+            maior = np.zeros((max(linhas, 2 * len(self._consumo)), self.janela), dtype=np.int32)
+            maior[:len(self._consumo)] = self._consumo
+            self._consumo = maior
+            self._alterado = np.concatenate([self._alterado,
+                                             np.zeros(len(maior) - len(self._alterado), dtype=np.int64)])
+        np.add.at(self._consumo, (codigos, dias % self.janela), quantidades)
+        self._marca += 1
+        self._alterado[codigos] = self._marca
+
+    def _avancar(self, dia: int):
+        """Move a janela até ``dia``, zerando as colunas dos dias que entram"""
+        if self._dia is None or dia >= self._dia + self.janela:
+            self._consumo[:] = 0
+        elif dia > self._dia:
+            self._consumo[:, np.arange(self._dia + 1, dia + 1) % self.janela] = 0
+        if self._dia is None or dia > self._dia:
+            self._dia = dia
+            self._marca += 1
+            self._marca_geral = self._marca
+
+    def _ultimos(self, dias: int) -> np.ndarray:
+        """Consumo dos últimos ``dias`` dias até o atual (códigos × dias, do mais antigo ao mais novo)"""
+        colunas = np.arange(self._dia - dias + 1, self._dia + 1) % self.janela
+        return self._consumo[:, colunas].astype(np.float64)
+
+    def estimar(self, modo: str = "media_movel", dias: int = 28,
+                alfa: float = 0.3) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Consumo diário estimado por código (e perfil semanal, no modo sazonal).
+
+        Chamar depois de ``atualizar``: a janela termina no dia informado nela.
+        """
+        if modo not in MODOS_PREVISAO:
+            raise ValueError(f"Modo de previsão desconhecido: {modo}")
+        dias = int(min(max(dias, 1), self.janela))
+        with self._trava:
+            if self._dia is None:
+                return np.zeros(0), None
+            if modo == "sazonal":
+                dias = max(dias // 7, 1) * 7
+            consumo = self._ultimos(dias)
+            dia_final = self._dia
+        if modo == "media_movel":
+            return consumo.mean(axis=1), None
+        if modo == "suavizacao":
+            pesos = alfa * (1 - alfa) ** np.arange(dias)[::-1]
+            return consumo @ (pesos / pesos.sum()), None
+        semana = dia_da_semana(np.arange(dia_final - dias + 1, dia_final + 1))
+        perfil = np.stack([consumo[:, semana == d].mean(axis=1) for d in range(7)], axis=1)
+        return perfil.mean(axis=1), perfil
+
+    def variabilidade(self, dias: int = 28, desde: Optional[int] = None
+                      ) -> Tuple[Optional[np.ndarray], np.ndarray, int]:
+        """Coeficiente de variação do consumo diário dos últimos ``dias`` dias.
+
+        Com ``desde`` (marca devolvida por uma chamada anterior) calcula só os
+        códigos alterados depois dela. Retorna os códigos calculados (None para
+        todos), o coeficiente de cada um (NaN sem consumo) e a marca atual.
+        """
+        dias = int(min(max(dias, 2), self.janela))
+        with self._trava:
+            if self._dia is None:
+                return None, np.zeros(0), self._marca
+            linhas = None
+            if desde is not None and desde >= self._marca_geral:
+                linhas = np.flatnonzero(self._alterado > desde)
+            colunas = np.arange(self._dia - dias + 1, self._dia + 1) % self.janela
+            consumo = (self._consumo[:, colunas] if linhas is None
+                       else self._consumo[np.ix_(linhas, colunas)]).astype(np.float64)
+            marca = self._marca
+        media = consumo.mean(axis=1)
+        desvio = consumo.std(axis=1)
+        variacao = np.divide(desvio, media, out=np.full(len(media), np.nan), where=media > 0)
+        return linhas, variacao, marca
+
+
+def dias_ate_minimo(excedente: np.ndarray, consumo: np.ndarray,
+                    perfil: Optional[np.ndarray] = None, amanha: int = 0) -> np.ndarray:
+    """Dias até o excedente sobre o mínimo se esgotar (infinito sem consumo).
+
+    Com ``perfil`` (itens × 7, a partir de segunda) o consumo de cada dia segue o
+    dia da semana, começando por ``amanha``; sem ele o consumo é constante.
+    """
+    dias = np.full(len(excedente), np.inf)
+    ativos = np.flatnonzero(consumo > 0)
+    restante = excedente[ativos].astype(np.float64)
+    if perfil is None:
+        dias[ativos] = restante / consumo[ativos]
+        return dias
+
+    diario = perfil[ativos][:, (amanha + np.arange(7)) % 7]
+    semana = diario.sum(axis=1)
+    completas = np.floor(restante / semana)
+    resto = restante - completas * semana
+    acumulado = np.cumsum(diario, axis=1)
+    # Dias inteiros da última semana antes de o acumulado cobrir o resto, mais a fração do seguinte
+    inteiros = np.minimum((acumulado < resto[:, None]).sum(axis=1), 6)
+    posicao = np.arange(len(ativos))
+    anterior = np.where(inteiros > 0, acumulado[posicao, inteiros - 1], 0.0)
+    consumo_dia = diario[posicao, inteiros]
+    fracao = np.divide(resto - anterior, consumo_dia, out=np.zeros(len(ativos)),
+                       where=consumo_dia > 0)
+    dias[ativos] = completas * 7 + inteiros + fracao
+    return dias
@@ -0,0 +1,323 @@
+"""Agregados do histórico por hora e por dia, mantidos conforme os registros entram.
+
+Cada balde (hora ou dia contados desde a época, na mesma hora local das datas
+do log) guarda uma matriz tipo × usuário com a contagem de registros, o volume
+movimentado (soma de ``|delta|``) e o saldo (soma de ``delta``). Os baldes
+diários guardam também as mesmas medidas por SKU e tipo; por hora isso teria
+praticamente uma linha por registro e não resumiria nada.
+
+As estatísticas de um período somam os baldes que ele cobre: dias inteiros
+pelos baldes diários, horas inteiras nas pontas pelos horários. O que sobra
+nas pontas (menos de uma hora de cada lado) é lido do próprio log por quem
+consulta. O custo cresce com o número de baldes, não com o de registros.
+
+Os agregados acompanham um log pela posição já processada: o log empurra cada
+registro novo (``acumular_um``/``acumular``) e, se algo escapou (agregados
+recém-criados, reconstrução), ``atualizar`` lê os registros que faltam.
+
+Registros arquivados pela retenção (ver ``arquivo_historico``) saem do log: os
+baldes diários por tipo e usuário deles continuam aqui (semeados dos totais do
+arquivo quando os agregados são refeitos); os horários e os por SKU anteriores
+ao corte são descartados e, quando preciso, lidos do próprio arquivo.
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SEGUNDOS_HORA = 3600
+SEGUNDOS_DIA = 86400
+
+# Granularidade -> duração do balde em segundos
+GRANULARIDADES = {"hora": SEGUNDOS_HORA, "dia": SEGUNDOS_DIA}
+
+# Medidas de cada célula, na ordem do último eixo das matrizes
+MEDIDAS = ("registros", "volume", "saldo")
+
+# Chave por SKU nos baldes diários: código do item nos bits altos, tipo nos baixos
+_BITS_TIPO = 32
+
+
+def _medidas(delta: np.ndarray) -> np.ndarray:
+    """Medidas (registros × 3) de cada registro a partir do delta"""
+    delta = np.asarray(delta, dtype=np.int64)
+    return np.stack([np.ones(len(delta), dtype=np.int64), np.abs(delta), delta], axis=1)
+
+
+def _ampliar(matriz: np.ndarray, tipos: int, usuarios: int) -> np.ndarray:
+    """A matriz com pelo menos ``tipos`` × ``usuarios`` células (zeros nas novas)"""
+    if matriz.shape[0] >= tipos and matriz.shape[1] >= usuarios:
+        return matriz
+    maior = np.zeros((max(tipos, matriz.shape[0]), max(usuarios, matriz.shape[1]), len(MEDIDAS)),
+                     dtype=np.int64)
+    maior[:matriz.shape[0], :matriz.shape[1]] = matriz
+    return maior
+
+
+class BaldeCodigos:
+    """Medidas por (SKU, tipo) de um dia, em chaves ordenadas; acréscimos ficam pendentes até a leitura"""
+
+    __slots__ = ("chaves", "valores", "_pendentes", "_chaves_um", "_deltas_um")
+
+    def __init__(self):
+        self.chaves = np.zeros(0, dtype=np.int64)
+        self.valores = np.zeros((0, len(MEDIDAS)), dtype=np.int64)
+        self._pendentes: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._chaves_um: List[int] = []
+        self._deltas_um: List[int] = []
+
+    def anexar(self, chaves: np.ndarray, deltas: np.ndarray):
+        self._pendentes.append((chaves, deltas))
+
+    def anexar_um(self, chave: int, delta: int):
+        self._chaves_um.append(chave)
+        self._deltas_um.append(delta)
+
+    def consolidar(self):
+        """Funde os acréscimos pendentes nas chaves ordenadas"""
+        if self._chaves_um:
+            self._pendentes.append((np.array(self._chaves_um, dtype=np.int64),
+                                    np.array(self._deltas_um, dtype=np.int64)))
+            self._chaves_um, self._deltas_um = [], []
+        if not self._pendentes:
+            return
+        chaves = np.concatenate([self.chaves] + [c for c, _ in self._pendentes])
+        valores = np.concatenate([self.valores] + [_medidas(d) for _, d in self._pendentes])
+        self._pendentes = []
+        self.chaves, inverso = np.unique(chaves, return_inverse=True)
+        self.valores = np.stack([np.bincount(inverso, weights=valores[:, m], minlength=len(self.chaves))
+                                 for m in range(len(MEDIDAS))], axis=1).astype(np.int64)
+
+    def do_codigo(self, codigo: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Tipos (códigos) e medidas do SKU no dia"""
+        inicio, fim = np.searchsorted(self.chaves, [codigo << _BITS_TIPO, (codigo + 1) << _BITS_TIPO])
+        return self.chaves[inicio:fim] & ((1 << _BITS_TIPO) - 1), self.valores[inicio:fim]
+
+
+class ResumosHistorico:
+    """Baldes horários e diários das medidas do histórico, alimentados registro a registro"""
+
+    def __init__(self, historico=None):
+        self._trava = threading.RLock()
+        self._historico = historico
+        # Só depois de semeados os baldes aceitam registros empurrados pelo log
+        self._semeado = False
+        self._limpar()
+
+    def _limpar(self):
+        self._processados = 0
+        # Granularidade -> número do balde -> matriz tipo × usuário × medida
+        self._baldes: Dict[str, Dict[int, np.ndarray]] = {g: {} for g in GRANULARIDADES}
+        # Números dos baldes existentes, em ordem, para localizar um período por bisseção
+        self._ordem: Dict[str, List[int]] = {g: [] for g in GRANULARIDADES}
+        self._codigos: Dict[int, BaldeCodigos] = {}
+
+    @property
+    def processados(self) -> int:
+        """Registros do log já incluídos nos baldes"""
+        return self._processados
+
+    @property
+    def semeado(self) -> bool:
+        return self._semeado
+
+    # Escrita
+
+    def acumular_um(self, posicao: int, data: int, tipo: int, usuario: int, codigo: int, delta: int):
+        """Inclui o registro da posição ``posicao`` do log, se for o próximo esperado"""
+        with self._trava:
+            if not self._semeado or posicao != self._processados:
+                return
+            for granularidade, segundos in GRANULARIDADES.items():
+                numero = data // segundos
+                matriz = self._baldes[granularidade].get(numero)
+                if matriz is None or tipo >= matriz.shape[0] or usuario >= matriz.shape[1]:
+                    matriz = self._matriz(granularidade, numero, tipo + 1, usuario + 1)
+                celula = matriz[tipo, usuario]
+                celula[0] += 1
+                celula[1] += abs(delta)
+                celula[2] += delta
+            self._balde_codigos(data // SEGUNDOS_DIA).anexar_um((codigo << _BITS_TIPO) | tipo, delta)
+            self._processados = posicao + 1
+
+    def acumular(self, posicao: int, colunas: Dict[str, np.ndarray]):
+        """Inclui os registros em colunas que começam na posição ``posicao`` do log, se for a esperada"""
+        with self._trava:
+            if not self._semeado or posicao != self._processados:
+                return
+            self._incluir(colunas)
+            self._processados = posicao + len(colunas["data"])
+
+    def atualizar(self, historico):
+        """Inclui os registros do log que ainda não estão nos baldes.
+
+        Um log diferente do acompanhado ou encolhido é relido do início.
+        """
+        with self._trava:
+            if not self._semeado or historico is not self._historico or len(historico) < self._processados:
+                self._historico = historico
+                self.semear()
+            fim = len(historico)
+            for colunas in historico.colunas(self._processados, fim):
+                self._incluir(colunas)
+            self._processados = fim
+
+    def reconstruir(self, historico):
+        """Descarta os baldes e os refaz a partir do log (e dos totais do seu arquivo)"""
+        with self._trava:
+            self._historico = historico
+            self.semear()
+            self.atualizar(historico)
+
+    def semear(self):
+        """Recomeça do início do log, com os baldes diários dos registros já arquivados"""
+        with self._trava:
+            self._limpar()
+            totais = self._historico.totais_arquivados() if self._historico is not None else ()
+            for dia, tipos, usuarios, valores in totais:
+                if len(tipos):
+                    matriz = self._matriz("dia", dia, int(tipos.max()) + 1, int(usuarios.max()) + 1)
+                    np.add.at(matriz, (tipos, usuarios), valores)
+            self._semeado = True
+
+    def transferir(self, historico, removidos: int, corte: int) -> "ResumosHistorico":
+        """Passa os agregados para o log que sobrou de um recorte.
+
+        ``removidos`` registros anteriores a ``corte`` (segundos, início de um
+        dia) saíram do log; já estavam todos processados. Baldes horários e por
+        SKU anteriores ao corte são descartados. Sem semear não há o que passar:
+        o log novo semeia na primeira consulta.
+        """
+        with self._trava:
+            self._historico = historico
+            if not self._semeado:
+                return self
+            self._processados = max(self._processados - removidos, 0)
+            horas = self._ordem["hora"]
+            quantos = bisect.bisect_left(horas, corte // SEGUNDOS_HORA)
+            for numero in horas[:quantos]:
+                del self._baldes["hora"][numero]
+            del horas[:quantos]
+            dia = corte // SEGUNDOS_DIA
+            self._codigos = {numero: balde for numero, balde in self._codigos.items() if numero >= dia}
+            return self
+
+    def _incluir(self, colunas: Dict[str, np.ndarray]):
+        datas = np.asarray(colunas["data"], dtype=np.int64)
+        if not len(datas):
+            return
+        tipo = np.asarray(colunas["tipo"], dtype=np.int64)
+        usuario = np.asarray(colunas["usuario"], dtype=np.int64)
+        delta = np.asarray(colunas["delta"], dtype=np.int64)
+        medidas = _medidas(delta)
+        tipos, usuarios = int(tipo.max()) + 1, int(usuario.max()) + 1
+        celula = tipo * usuarios + usuario
+        for granularidade, segundos in GRANULARIDADES.items():
+            for numero, linhas in self._grupos(datas // segundos):
+                soma = np.stack([np.bincount(celula[linhas], weights=medidas[linhas, m],
+                                             minlength=tipos * usuarios)
+                                 for m in range(len(MEDIDAS))], axis=1)
+                matriz = self._matriz(granularidade, numero, tipos, usuarios)
+                matriz[:tipos, :usuarios] += soma.astype(np.int64).reshape(tipos, usuarios, len(MEDIDAS))
+        chaves = (np.asarray(colunas["codigo"], dtype=np.int64) << _BITS_TIPO) | tipo
+        for numero, linhas in self._grupos(datas // SEGUNDOS_DIA):
+            self._balde_codigos(numero).anexar(chaves[linhas], delta[linhas])
+
+    @staticmethod
+    def _grupos(numeros: np.ndarray):
+        """Pares (número do balde, linhas) dos registros, um por balde presente"""
+        if numeros[0] == numeros[-1] and np.all(numeros == numeros[0]):
+            yield int(numeros[0]), slice(None)
+            return
+        ordem = np.argsort(numeros, kind="stable")
+        distintos, inicios = np.unique(numeros[ordem], return_index=True)
+        yield from zip(distintos.tolist(), np.split(ordem, inicios[1:]))
+
+    def _matriz(self, granularidade: str, numero: int, tipos: int, usuarios: int) -> np.ndarray:
+        baldes = self._baldes[granularidade]
+        matriz = baldes.get(numero)
+        if matriz is None:
+            bisect.insort(self._ordem[granularidade], numero)
+            matriz = np.zeros((tipos, usuarios, len(MEDIDAS)), dtype=np.int64)
+        else:
+            matriz = _ampliar(matriz, tipos, usuarios)
+        baldes[numero] = matriz
+        return matriz
+
+    def _balde_codigos(self, dia: int) -> BaldeCodigos:
+        balde = self._codigos.get(dia)
+        if balde is None:
+            balde = self._codigos[dia] = BaldeCodigos()
+        return balde
+
+    # Leitura
+
+    def limites(self) -> Optional[Tuple[int, int]]:
+        """Início e fim (exclusivo), em segundos, dos baldes com registros (None sem registros)"""
+        with self._trava:
+            dias, horas = self._ordem["dia"], self._ordem["hora"]
+            if not dias:
+                return None
+            # Todo registro tem balde diário; os horários, quando existem, são os mais recentes
+            fim = (horas[-1] + 1) * SEGUNDOS_HORA if horas else (dias[-1] + 1) * SEGUNDOS_DIA
+            return dias[0] * SEGUNDOS_DIA, fim
+
+    def baldes(self, granularidade: str, inicio: int, fim: int) -> List[Tuple[int, np.ndarray]]:
+        """Baldes existentes com número em [inicio, fim), com cópia das matrizes"""
+        with self._trava:
+            ordem = self._ordem[granularidade]
+            baldes = self._baldes[granularidade]
+            return [(numero, baldes[numero].copy())
+                    for numero in ordem[bisect.bisect_left(ordem, inicio):bisect.bisect_left(ordem, fim)]]
+
+    def somar(self, granularidade: str, inicio: int, fim: int, tipos: int, usuarios: int) -> np.ndarray:
+        """Soma das matrizes dos baldes com número em [inicio, fim), em tipos × usuarios × medida"""
+        total = np.zeros((tipos, usuarios, len(MEDIDAS)), dtype=np.int64)
+        with self._trava:
+            ordem = self._ordem[granularidade]
+            baldes = self._baldes[granularidade]
+            for numero in ordem[bisect.bisect_left(ordem, inicio):bisect.bisect_left(ordem, fim)]:
+                matriz = baldes[numero]
+                total[:matriz.shape[0], :matriz.shape[1]] += matriz[:tipos, :usuarios]
+        return total
+
+    def do_codigo(self, codigo: int, inicio: int, fim: int) -> List[Tuple[int, np.ndarray, np.ndarray]]:
+        """Por dia em [inicio, fim) com registros do SKU: dia, tipos (códigos) e medidas"""
+        resultado = []
+        with self._trava:
+            ordem = self._ordem["dia"]
+            for dia in ordem[bisect.bisect_left(ordem, inicio):bisect.bisect_left(ordem, fim)]:
+                # Dias vindos do arquivo não têm balde por SKU (ver transferir)
+                balde = self._codigos.get(dia)
+                if balde is None:
+                    continue
+                balde.consolidar()
+                tipos, valores = balde.do_codigo(codigo)
+                if len(tipos):
+                    resultado.append((dia, tipos, valores))
+        return resultado
+
+
+def decompor_periodo(inicio: int, fim: int) -> Tuple[List[Tuple[int, int]], Tuple[int, int],
+                                                     List[Tuple[int, int]]]:
+    """Divide o intervalo de segundos [inicio, fim) em dias, horas e sobras.
+
+    Retorna os trechos em segundos que não fecham uma hora (até dois), os dias
+    inteiros (números de balde) e os trechos de horas inteiras fora desses dias
+    (até dois), todos com fim exclusivo.
+    """
+    hora_inicio = -(-inicio // SEGUNDOS_HORA)
+    hora_fim = fim // SEGUNDOS_HORA
+    if hora_inicio >= hora_fim:
+        return [(inicio, fim)] if inicio < fim else [], (0, 0), []
+    sobras = [(a, b) for a, b in ((inicio, hora_inicio * SEGUNDOS_HORA), (hora_fim * SEGUNDOS_HORA, fim))
+              if a < b]
+    por_dia = SEGUNDOS_DIA // SEGUNDOS_HORA
+    dia_inicio = -(-hora_inicio // por_dia)
+    dia_fim = hora_fim // por_dia
+    if dia_inicio >= dia_fim:
+        return sobras, (0, 0), [(hora_inicio, hora_fim)]
+    horas = [(a, b) for a, b in ((hora_inicio, dia_inicio * por_dia), (dia_fim * por_dia, hora_fim))
+             if a < b]
+    return sobras, (dia_inicio, dia_fim), horas
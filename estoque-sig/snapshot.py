@@ -0,0 +1,163 @@
+"""Snapshot binário do estado para partida e restauração rápidas.
+
+Um snapshot é um diretório com formato versionado:
+
+- ``manifesto.json``: formato, versão, número de itens, geração do
+  armazenamento no momento da gravação, usuários e o índice dos segmentos do
+  histórico (quantidade de registros e intervalo de datas de cada um);
+- ``itens_<campo>.npy``: colunas numéricas do estoque, reabertas por mmap em
+  modo cópia na escrita: páginas não alteradas nunca são copiadas;
+- tabelas de textos (``<nome>.txt`` com os valores em UTF-8, cada um seguido
+  de ``SEP_TEXTO``, e ``<nome>_inicio.npy`` com os deslocamentos) para os
+  campos de texto dos itens, as categorias do histórico e os textos
+  normalizados do índice de busca;
+- ``segmento_<n>_<coluna>.npy``: segmentos do histórico no formato de
+  ``HistoricoColunar`` (segmentos já mapeados em disco entram por link);
+- ``busca_<array>.npy``: base CSR do índice de trigramas.
+
+A gravação acontece num diretório temporário que só no final toma o lugar do
+snapshot anterior. A carga não relê nem reindexa nada: mapeia os arrays,
+monta o dicionário de códigos e recria os índices a partir das bases salvas.
+"""
+import json
+import os
+import shutil
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from arquivo_historico import ArquivoHistorico
+from estoque_colunar import CAMPOS_NUMERICOS, CAMPOS_TEXTO, SEP_TEXTO, EstoqueColunar, TextosMapeados
+from historico_colunar import COLUNAS_CATEGORIA, HistoricoColunar, SegmentoMapeado
+from indice_busca import IndiceBusca
+
+FORMATO_SNAPSHOT = "estoque-sig-snapshot"
+# Versão 2: histórico com campo alterado e valores anterior/novo
+VERSAO_SNAPSHOT = 2
+
+MANIFESTO = "manifesto.json"
+
+_ARRAYS_BUSCA = ("gramas", "inicio", "linhas", "inicio_linhas")
+
+
+def gravar_textos(diretorio: str, nome: str, valores: Iterable[str]):
+    """Grava uma tabela de textos (bloco UTF-8 + deslocamentos de cada valor)"""
+    valores = [str(valor).replace(SEP_TEXTO, " ") for valor in valores]
+    bloco = "".join(valor + SEP_TEXTO for valor in valores).encode("utf-8")
+    tamanhos = np.fromiter((len(valor.encode("utf-8")) + 1 for valor in valores),
+                           dtype=np.int64, count=len(valores))
+    with open(os.path.join(diretorio, f"{nome}.txt"), "wb") as arquivo:
+        arquivo.write(bloco)
+    np.save(os.path.join(diretorio, f"{nome}_inicio.npy"),
+            np.concatenate([[0], np.cumsum(tamanhos)]).astype(np.int64))
+
+
+def abrir_textos(diretorio: str, nome: str) -> TextosMapeados:
+    """Abre uma tabela de textos por mmap (valores decodificados sob demanda)"""
+    inicio = np.load(os.path.join(diretorio, f"{nome}_inicio.npy"), mmap_mode="r")
+    caminho = os.path.join(diretorio, f"{nome}.txt")
+    # np.memmap não aceita arquivos vazios
+    texto = (np.memmap(caminho, dtype=np.uint8, mode="r") if os.path.getsize(caminho)
+             else np.zeros(0, dtype=np.uint8))
+    return TextosMapeados(texto, inicio)
+
+
+def ler_textos(diretorio: str, nome: str) -> List[str]:
+    """Lê uma tabela de textos inteira como lista (uma única decodificação)"""
+    with open(os.path.join(diretorio, f"{nome}.txt"), "rb") as arquivo:
+        valores = arquivo.read().decode("utf-8").split(SEP_TEXTO)
+    valores.pop()
+    return valores
+
+
+def gravar_snapshot(diretorio: str, estoque: EstoqueColunar, historico: HistoricoColunar,
+                    indice_busca: IndiceBusca, usuarios: Mapping[str, Dict],
+                    geracao: Optional[int]) -> Dict:
+    """Grava o estado num snapshot (o chamador garante que nada muda durante a gravação)"""
+    temporario = diretorio.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    n = len(estoque)
+    # Folga nas colunas numéricas: cadastros novos não forçam cópia logo de início
+    capacidade = max(1024, n + n // 8)
+    for campo, dtype in CAMPOS_NUMERICOS.items():
+        coluna = np.zeros(capacidade, dtype=dtype)
+        coluna[:n] = estoque.coluna(campo)
+        np.save(os.path.join(temporario, f"itens_{campo}.npy"), coluna)
+    gravar_textos(temporario, "itens_codigo", estoque.codigos())
+    for campo in CAMPOS_TEXTO:
+        gravar_textos(temporario, f"itens_{campo}", estoque.textos(campo))
+
+    for campo, valores in historico.categorias().items():
+        gravar_textos(temporario, f"historico_{campo}", valores)
+    segmentos = [segmento.gravar(temporario, numero)
+                 for numero, segmento in enumerate(historico.segmentos())]
+
+    base = indice_busca.exportar_base()
+    for nome in ("codigos", "cod_norm", "desc_norm"):
+        gravar_textos(temporario, f"busca_{nome}", base[nome])
+    for nome in _ARRAYS_BUSCA:
+        np.save(os.path.join(temporario, f"busca_{nome}.npy"), base[nome])
+
+    manifesto = {
+        "formato": FORMATO_SNAPSHOT,
+        "versao": VERSAO_SNAPSHOT,
+        "itens": n,
+        "geracao": geracao,
+        "usuarios": dict(usuarios),
+        "historico": {"registros": sum(s["n"] for s in segmentos), "segmentos": segmentos},
+    }
+    with open(os.path.join(temporario, MANIFESTO), "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False)
+
+    # Troca o snapshot anterior pelo novo (arquivos ainda mapeados continuam válidos)
+    antigo = diretorio.rstrip(os.sep) + ".antigo"
+    shutil.rmtree(antigo, ignore_errors=True)
+    if os.path.exists(diretorio):
+        os.rename(diretorio, antigo)
+    os.rename(temporario, diretorio)
+    shutil.rmtree(antigo, ignore_errors=True)
+    return manifesto
+
+
+def ler_manifesto(diretorio: str) -> Optional[Dict]:
+    """Manifesto do snapshot (None se não houver snapshot no diretório)"""
+    caminho = os.path.join(diretorio, MANIFESTO)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding="utf-8") as arquivo:
+        manifesto = json.load(arquivo)
+    if manifesto.get("formato") != FORMATO_SNAPSHOT or manifesto.get("versao") != VERSAO_SNAPSHOT:
+        raise ValueError("Snapshot em formato ou versão não suportado.")
+    return manifesto
+
+
+def abrir_snapshot(diretorio: str, manifesto: Dict,
+                   diretorio_historico: Optional[str] = None,
+                   arquivo: Optional[ArquivoHistorico] = None
+                   ) -> Tuple[EstoqueColunar, HistoricoColunar, IndiceBusca]:
+    """Abre estoque, histórico e índice de busca de um snapshot por mmap.
+
+    O histórico aberto fica ligado a ``arquivo`` (registros fora da janela quente), se houver.
+    """
+    codigos = ler_textos(diretorio, "itens_codigo")
+    if len(codigos) != manifesto["itens"]:
+        raise ValueError("Snapshot inconsistente: número de itens não confere.")
+    numericos = {campo: np.load(os.path.join(diretorio, f"itens_{campo}.npy"), mmap_mode="c")
+                 for campo in CAMPOS_NUMERICOS}
+    textos = {campo: abrir_textos(diretorio, f"itens_{campo}") for campo in CAMPOS_TEXTO}
+    estoque = EstoqueColunar.de_colunas(codigos, numericos, textos)
+
+    categorias = {campo: ler_textos(diretorio, f"historico_{campo}")
+                  for campo in COLUNAS_CATEGORIA}
+    segmentos = [SegmentoMapeado(diretorio, numero, **segmento)
+                 for numero, segmento in enumerate(manifesto["historico"]["segmentos"])
+                 if segmento["n"]]
+    historico = HistoricoColunar.de_segmentos(categorias, segmentos, diretorio_historico, arquivo)
+
+    busca = {nome: abrir_textos(diretorio, f"busca_{nome}") for nome in ("codigos", "cod_norm", "desc_norm")}
+    busca.update({nome: np.load(os.path.join(diretorio, f"busca_{nome}.npy"), mmap_mode="r")
+                  for nome in _ARRAYS_BUSCA})
+    indice_busca = IndiceBusca.de_base(**busca)
+    return estoque, historico, indice_busca